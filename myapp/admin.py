@@ -1,19 +1,48 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
+from django.db import connection
+from django.db.models import Count, Max, Prefetch
 from .models import (
-    Student, Driver, Vehicle, Route, Stop, Schedule,
-    Booking, Payment  # Removed VehicleLocation and Notification
+    Student, Driver, Vehicle, Route, Place, Stop, Schedule,
+    ServiceCalendar, ServiceException,
+    Booking, Payment, DailyRevenue, VehicleLocation  # Removed Notification
 )
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for very large tables. An unfiltered changelist is counted from
+    the planner's row estimate on PostgreSQL, or from the highest primary key
+    elsewhere (an index lookup), instead of a full COUNT(*). Filtered and
+    searched changelists still get an exact count.
+    """
+    
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if query.where or query.distinct:
+            return super().count
+        model = self.object_list.model
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        return model._default_manager.aggregate(highest=Max('pk'))['highest'] or 0
+
+
 @admin.register(Student)
 class StudentAdmin(admin.ModelAdmin):
     list_display = ['student_id', 'get_full_name', 'phone_number', 'guardian_name', 'is_active', 'created_at']
     list_filter = ['is_active', 'created_at']
     search_fields = ['student_id', 'user__first_name', 'user__last_name', 'phone_number', 'guardian_name']
     readonly_fields = ['created_at', 'updated_at', 'display_profile_picture']
+    list_select_related = ['user']
     
     fieldsets = (
         ('User Account', {
@@ -51,6 +80,7 @@ class DriverAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'created_at', 'license_expiry']
     search_fields = ['driver_id', 'user__first_name', 'user__last_name', 'license_number', 'phone_number']
     readonly_fields = ['created_at', 'updated_at', 'display_profile_picture']
+    list_select_related = ['user']
     
     fieldsets = (
         ('User Account', {
@@ -102,10 +132,16 @@ class VehicleAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('drivers', queryset=Driver.objects.select_related('user').order_by('pk'))
+        )
+    
     def driver_name(self, obj):
-        driver = obj.drivers.first()
-        if driver:
-            return driver.user.get_full_name()
+        # Indexed rather than .first(), which would query again
+        drivers = obj.drivers.all()
+        if drivers:
+            return drivers[0].user.get_full_name()
         return "Unassigned"
     driver_name.short_description = 'Driver'
 
@@ -113,14 +149,15 @@ class VehicleAdmin(admin.ModelAdmin):
 class StopInline(admin.TabularInline):
     model = Stop
     extra = 1
-    fields = ['stop_order', 'stop_name', 'estimated_arrival_time']
+    fields = ['stop_order', 'stop_name', 'place', 'estimated_arrival_time', 'distance_km', 'is_active']
+    autocomplete_fields = ['place']
     ordering = ['stop_order']
 
 
 class ScheduleInline(admin.TabularInline):
     model = Schedule
     extra = 1
-    fields = ['day_of_week', 'departure_time', 'arrival_time', 'is_active']
+    fields = ['weekday', 'departure_time', 'arrival_time', 'calendar', 'is_active']
 
 
 @admin.register(Route)
@@ -129,6 +166,7 @@ class RouteAdmin(admin.ModelAdmin):
     list_filter = ['route_type', 'is_active', 'created_at']
     search_fields = ['route_code', 'route_name', 'origin', 'destination']
     readonly_fields = ('created_at', 'updated_at')
+    list_select_related = ['vehicle']
     inlines = [StopInline, ScheduleInline]
     
     fieldsets = (
@@ -151,20 +189,74 @@ class RouteAdmin(admin.ModelAdmin):
     )
 
 
+class PlaceStopInline(admin.TabularInline):
+    model = Stop
+    extra = 0
+    fields = ['route', 'stop_order', 'stop_name']
+    readonly_fields = ['route', 'stop_order', 'stop_name']
+    can_delete = False
+    show_change_link = True
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Place)
+class PlaceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'latitude', 'longitude', 'stop_count']
+    search_fields = ['name']
+    readonly_fields = ['key', 'created_at', 'updated_at']
+    inlines = [PlaceStopInline]
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(stop_count=Count('stops'))
+    
+    def stop_count(self, obj):
+        return obj.stop_count
+    stop_count.short_description = 'Stops'
+    stop_count.admin_order_field = 'stop_count'
+
+
 @admin.register(Stop)
 class StopAdmin(admin.ModelAdmin):
-    list_display = ['route', 'stop_order', 'stop_name', 'estimated_arrival_time']
-    list_filter = ['route']
-    search_fields = ['stop_name', 'route__route_name']
+    list_display = ['route', 'stop_order', 'stop_name', 'place', 'estimated_arrival_time', 'distance_km', 'is_active']
+    list_filter = ['is_active', 'route']
+    search_fields = ['stop_name', 'place__name', 'route__route_name']
+    autocomplete_fields = ['place']
+    list_select_related = ['route', 'place']
     ordering = ['route', 'stop_order']
 
 
 @admin.register(Schedule)
 class ScheduleAdmin(admin.ModelAdmin):
-    list_display = ['route', 'day_of_week', 'departure_time', 'arrival_time', 'is_active']
-    list_filter = ['day_of_week', 'is_active', 'route']
+    list_display = ['route', 'weekday', 'departure_time', 'arrival_time', 'calendar', 'is_active']
+    list_filter = ['weekday', 'is_active', 'calendar', 'route']
     search_fields = ['route__route_name', 'route__route_code']
-    ordering = ['route', 'day_of_week', 'departure_time']
+    list_select_related = ['route', 'calendar']
+    ordering = ['route', 'weekday', 'departure_time']
+
+
+class ServiceExceptionInline(admin.TabularInline):
+    model = ServiceException
+    extra = 1
+    fields = ['date', 'exception_type', 'service_weekday', 'description']
+
+
+@admin.register(ServiceCalendar)
+class ServiceCalendarAdmin(admin.ModelAdmin):
+    list_display = ['name', 'start_date', 'end_date', 'is_active']
+    list_filter = ['is_active']
+    search_fields = ['name']
+    inlines = [ServiceExceptionInline]
+
+
+@admin.register(ServiceException)
+class ServiceExceptionAdmin(admin.ModelAdmin):
+    list_display = ['date', 'exception_type', 'calendar', 'service_weekday', 'description']
+    list_filter = ['exception_type', 'calendar']
+    search_fields = ['description']
+    list_select_related = ['calendar']
+    ordering = ['-date']
 
 
 @admin.register(Booking)
@@ -173,6 +265,9 @@ class BookingAdmin(admin.ModelAdmin):
     list_filter = ['status', 'booking_date', 'created_at']
     search_fields = ['booking_id', 'student__student_id', 'student__user__first_name', 'student__user__last_name']
     readonly_fields = ['booking_id', 'created_at', 'updated_at', 'payment_status_display']
+    list_select_related = ['student__user', 'route', 'payment']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Booking Information', {
@@ -235,6 +330,7 @@ class PaymentAdmin(admin.ModelAdmin):
     list_filter = ['payment_status', 'payment_method', 'payment_date', 'created_at']
     search_fields = ['payment_id', 'transaction_reference', 'booking__booking_id']
     readonly_fields = ['payment_id', 'created_at', 'updated_at']
+    list_select_related = ['booking']
     
     fieldsets = (
         ('Payment Information', {
@@ -250,11 +346,47 @@ class PaymentAdmin(admin.ModelAdmin):
     )
     
     def booking_link(self, obj):
-        url = reverse('admin:myapp_booking_change', args=[obj.booking.id])
+        url = reverse('admin:myapp_booking_change', args=[obj.booking_id])
         return format_html('<a href="{}">{}</a>', url, obj.booking.booking_id)
     booking_link.short_description = 'Booking'
 
 
+@admin.register(DailyRevenue)
+class DailyRevenueAdmin(admin.ModelAdmin):
+    """Read-only: rows are maintained from bookings (see myapp/revenue.py)"""
+    list_display = ['date', 'route', 'driver', 'vehicle_type', 'status', 'bookings', 'seats', 'revenue']
+    list_filter = ['status', 'vehicle_type', 'date']
+    list_select_related = ['route', 'driver__user']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(VehicleLocation)
+class VehicleLocationAdmin(admin.ModelAdmin):
+    """GPS history, read-only"""
+    list_display = ['vehicle', 'latitude', 'longitude', 'speed', 'heading', 'timestamp']
+    list_filter = ['vehicle__vehicle_type']
+    search_fields = ['vehicle__plate_number']
+    list_select_related = ['vehicle']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Fixes are stored as they arrive, so id order is time order without sorting the whole table
+    ordering = ['-id']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # Customize the admin site header and title
 admin.site.site_header = "Sakay Transportation Admin"
 admin.site.site_title = "Sakay Admin Portal"
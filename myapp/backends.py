@@ -0,0 +1,29 @@
+# backends.py
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+
+
+class RoleModelBackend(ModelBackend):
+    """
+    ModelBackend that loads the signed-in user together with its driver
+    (and the driver's vehicle) and student profiles in one query, so role
+    checks and request.user.driver / request.user.student in views and
+    middleware are attribute reads.
+    """
+    
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and password is not None:
+            # The password has been checked: stop ModelBackend, listed next for older
+            # sessions, from hashing it a second time
+            raise PermissionDenied
+        return user
+    
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('driver__vehicle', 'student').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,153 @@
+# catalog.py
+"""
+Versioned cache of the public route catalog (routes, stops, schedules and
+their vehicles).
+
+The network changes rarely, so public pages render from plain dicts cached
+under a catalog version. Signals bump the version whenever a Route, Stop,
+Schedule, Vehicle or Place (or the service calendar) is saved or deleted (see
+signals.py); a new version simply misses the cache and the catalog is
+rebuilt once.
+
+Each process also keeps the catalog it last loaded, so a warm request costs
+a single cache read of the version number and no database queries.
+Anything else derived from the catalog can reuse the same mechanism through
+memoize_on_version().
+"""
+import time
+
+from django.core.cache import cache
+
+from .models import Place, Route, Stop, Schedule
+
+VERSION_KEY = 'catalog:version'
+DATA_KEY = 'catalog:data:{version}'
+DATA_TIMEOUT = 60 * 60 * 24 * 7
+
+_memo = {}
+
+
+def catalog_version():
+    """Current catalog version, initialised on first use"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Start a new catalog version. Versions are timestamps rather than a
+    counter so a flushed or restarted cache can never hand out a version
+    that already has stale data cached under it.
+    """
+    version = time.time_ns()
+    cache.set(VERSION_KEY, version, None)
+    return version
+
+
+def memoize_on_version(name, builder):
+    """
+    Per-process memo of builder() for the current catalog version.
+    builder is only called again after the catalog version changes.
+    """
+    version = catalog_version()
+    hit = _memo.get(name)
+    if hit is not None and hit[0] == version:
+        return hit[1]
+    value = builder()
+    _memo[name] = (version, value)
+    return value
+
+
+def _serialize_route(route):
+    vehicle = route.vehicle
+    return {
+        'id': route.id,
+        'route_code': route.route_code,
+        'route_name': route.route_name,
+        'origin': route.origin,
+        'destination': route.destination,
+        'distance_km': route.distance_km,
+        'fare': route.fare,
+        'estimated_duration': route.estimated_duration,
+        'route_type': route.route_type,
+        'get_route_type_display': route.get_route_type_display(),
+        'vehicle': {
+            'id': vehicle.id,
+            'plate_number': vehicle.plate_number,
+            'vehicle_type': vehicle.vehicle_type,
+            'get_vehicle_type_display': vehicle.get_vehicle_type_display(),
+            'model': vehicle.model,
+            'color': vehicle.color,
+            'capacity': vehicle.capacity,
+        },
+        'stops': [],
+        'schedules': [],
+    }
+
+
+def build_catalog():
+    """Load every active route with its stops and active schedules in three queries"""
+    routes = [
+        _serialize_route(route)
+        for route in Route.objects.filter(is_active=True).select_related('vehicle').order_by('route_code')
+    ]
+    by_id = {route['id']: route for route in routes}
+
+    stops = Stop.objects.filter(
+        route__in=by_id.keys(), is_active=True
+    ).select_related('place').order_by('route', 'stop_order')
+    for stop in stops:
+        place = stop.place
+        by_id[stop.route_id]['stops'].append({
+            'id': stop.id,
+            'stop_name': stop.stop_name,
+            'place_id': stop.place_id,
+            'place_key': place.key if place else Place.key_for(stop.stop_name),
+            'place_name': place.name if place else stop.stop_name,
+            'latitude': place.latitude if place else None,
+            'longitude': place.longitude if place else None,
+            'stop_order': stop.stop_order,
+            'estimated_arrival_time': stop.estimated_arrival_time,
+            'distance_km': stop.distance_km,
+        })
+
+    schedules = Schedule.objects.filter(
+        route__in=by_id.keys(), is_active=True
+    ).order_by('route', 'weekday', 'departure_time')
+    for schedule in schedules:
+        by_id[schedule.route_id]['schedules'].append({
+            'id': schedule.id,
+            'weekday': schedule.weekday,
+            'day_of_week': schedule.day_of_week,
+            'get_day_of_week_display': schedule.get_weekday_display(),
+            'departure_time': schedule.departure_time,
+            'arrival_time': schedule.arrival_time,
+        })
+
+    return {
+        'routes': routes,
+        'by_code': {route['route_code']: route for route in routes},
+        'by_id': by_id,
+    }
+
+
+def _load_catalog():
+    key = DATA_KEY.format(version=catalog_version())
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = build_catalog()
+        cache.set(key, catalog, DATA_TIMEOUT)
+    return catalog
+
+
+def get_catalog():
+    """The public route catalog for the current version"""
+    return memoize_on_version('catalog', _load_catalog)
+
+
+def get_route(route_code):
+    """Cached route dict for an active route, or None"""
+    return get_catalog()['by_code'].get(route_code)
@@ -0,0 +1,136 @@
+# cube.py
+"""
+Report cube.
+
+ReportCell pre-aggregates bookings, seats, revenue and cancellations by
+month x route x vehicle type x departure hour, so the reports page slices a
+few thousand cells with any combination of filters instead of grouping the
+booking table.
+
+The cube is rebuilt a month at a time. Every change that moves bookings in
+the revenue rollup (see revenue.py) marks the booking months dirty in
+ReportMonth, as does a booking or a schedule moving to another departure
+time; refresh() (the build_report_cube command) then rebuilds just those months.
+A month is marked clean before its rebuild starts, so a booking changed
+while it runs leaves the month dirty for the next refresh.
+"""
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import ExtractHour, TruncMonth
+from django.utils import timezone
+
+from .models import Booking, ReportCell, ReportMonth
+
+MEASURES = ('bookings', 'seats', 'revenue', 'cancellations')
+DIMENSIONS = {
+    'month': 'month',
+    'route': 'route__route_code',
+    'vehicle_type': 'vehicle_type',
+    'hour': 'hour',
+}
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def mark_dirty(dates):
+    """Flag the months of the given dates for the next refresh()"""
+    months = {month_of(day) for day in dates}
+    if months:
+        ReportMonth.objects.bulk_create(
+            [ReportMonth(month=month, is_dirty=True) for month in months],
+            update_conflicts=True, unique_fields=['month'], update_fields=['is_dirty'],
+        )
+
+
+def cells(bookings):
+    """Cube cells of a booking queryset, as dicts of key fields and measures"""
+    not_cancelled = ~Q(status='CANCELLED')
+    return bookings.order_by().values(
+        'route_id',
+        month=TruncMonth('booking_date'),
+        vehicle_type=F('route__vehicle__vehicle_type'),
+        hour=ExtractHour('schedule__departure_time'),
+    ).annotate(
+        bookings=Count('pk', filter=not_cancelled),
+        seats=Sum('seats_booked', filter=not_cancelled, default=0),
+        revenue=Sum('total_fare', filter=Q(status='COMPLETED'), default=0),
+        cancellations=Count('pk', filter=Q(status='CANCELLED')),
+    )
+
+
+def _write(bookings, batch_size):
+    return len(ReportCell.objects.bulk_create([ReportCell(**cell) for cell in cells(bookings)], batch_size=batch_size))
+
+
+def build_month(month, batch_size=1000):
+    """Replace a month's cells with ones computed from its bookings. Returns the cells written."""
+    with transaction.atomic():
+        ReportCell.objects.filter(month=month).delete()
+        written = _write(Booking.objects.filter(booking_date__gte=month, booking_date__lt=next_month(month)),
+                         batch_size)
+        ReportMonth.objects.filter(month=month).update(built_at=timezone.now())
+    return written
+
+
+def refresh(batch_size=1000):
+    """Rebuild the dirty months. Returns {month: cells written}."""
+    built = {}
+    for month in ReportMonth.objects.filter(is_dirty=True).order_by('month').values_list('month', flat=True):
+        if not ReportMonth.objects.filter(month=month, is_dirty=True).update(is_dirty=False):
+            continue  # Claimed by a concurrent refresh
+        try:
+            built[month] = build_month(month, batch_size)
+        except Exception:
+            mark_dirty([month])
+            raise
+    return built
+
+
+def rebuild(batch_size=1000):
+    """Recompute the whole cube from the bookings. Returns the cells written."""
+    with transaction.atomic():
+        ReportCell.objects.all().delete()
+        written = _write(Booking.objects.all(), batch_size)
+        now = timezone.now()
+        ReportMonth.objects.all().delete()
+        ReportMonth.objects.bulk_create([
+            ReportMonth(month=month, is_dirty=False, built_at=now)
+            for month in ReportCell.objects.order_by().values_list('month', flat=True).distinct()
+        ], batch_size=batch_size)
+    return written
+
+
+def slice_cube(by='month', start=None, end=None, route_id=None, vehicle_type=None, hour=None):
+    """
+    Cube totals grouped by one of DIMENSIONS, for the months from start to end
+    and optionally a single route, vehicle type or departure hour
+    """
+    cube = ReportCell.objects.all()
+    if start:
+        cube = cube.filter(month__gte=month_of(start))
+    if end:
+        cube = cube.filter(month__lte=month_of(end))
+    if route_id:
+        cube = cube.filter(route_id=route_id)
+    if vehicle_type:
+        cube = cube.filter(vehicle_type=vehicle_type)
+    if hour is not None:
+        cube = cube.filter(hour=hour)
+    column = DIMENSIONS[by]
+    return cube.order_by(column).values(value=F(column)).annotate(
+        **{measure: Sum(measure) for measure in MEASURES}
+    )
+
+
+def freshness():
+    """Dirty months waiting for a rebuild, and when the cube was last built"""
+    return ReportMonth.objects.aggregate(dirty_months=Count('pk', filter=Q(is_dirty=True)),
+                                         built_at=Max('built_at'))
@@ -0,0 +1,71 @@
+# dashboard.py
+"""
+Admin dashboard snapshot.
+
+Every counter on the admin dashboard comes from two queries: one pass over
+bookings with conditional aggregation, and one statement of scalar COUNT
+subqueries for students and routes. The recent bookings list adds a third.
+The snapshot holds only what the page shows.
+The result is cached as a snapshot for SNAPSHOT_TTL seconds, so a busy
+dashboard (and its live refresh endpoint) hits the database at most once
+per TTL however many admins have it open.
+"""
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Student, Route, Booking
+
+SNAPSHOT_KEY = 'dashboard:admin'
+SNAPSHOT_TTL = 30
+RECENT_BOOKINGS = 10
+
+
+def count_many(**querysets):
+    """COUNT(*) of several querysets in a single SELECT of scalar subqueries"""
+    columns, params = [], []
+    for name, queryset in querysets.items():
+        sql, query_params = queryset.order_by().values('pk').query.sql_with_params()
+        columns.append(f'(SELECT COUNT(*) FROM ({sql}) {name}_rows)')
+        params.extend(query_params)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(columns), params)
+        return dict(zip(querysets, cursor.fetchone()))
+
+
+def build_admin_snapshot():
+    numbers = Booking.objects.aggregate(
+        total_bookings=Count('pk'),
+        pending_bookings=Count('pk', filter=Q(status='PENDING')),
+    )
+    numbers.update(count_many(
+        total_students=Student.objects.filter(is_active=True),
+        total_routes=Route.objects.filter(is_active=True),
+    ))
+
+    recent = Booking.objects.select_related('student__user', 'route').order_by('-created_at')[:RECENT_BOOKINGS]
+    recent_bookings = [{
+        'booking_id': booking.booking_id,
+        'student_name': booking.student.user.get_full_name(),
+        'route_name': booking.route.route_name,
+        'booking_date': booking.booking_date,
+        'status': booking.status,
+        'get_status_display': booking.get_status_display(),
+        'total_fare': booking.total_fare,
+    } for booking in recent]
+
+    return {
+        'numbers': numbers,
+        'recent_bookings': recent_bookings,
+        'generated_at': timezone.now(),
+    }
+
+
+def get_admin_snapshot():
+    """Dashboard snapshot, at most SNAPSHOT_TTL seconds old"""
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        snapshot = build_admin_snapshot()
+        cache.set(SNAPSHOT_KEY, snapshot, SNAPSHOT_TTL)
+    return snapshot
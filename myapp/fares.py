@@ -0,0 +1,105 @@
+# fares.py
+"""
+Segment-based fares.
+
+Every route gets a precomputed pickup x dropoff fare matrix stored as a flat
+array of centavos, so pricing a booking is a single indexed array access.
+The matrix is cached per route and dropped whenever the route or one of its
+stops changes (see signals.py).
+"""
+from array import array
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.core.cache import cache
+
+from .models import Stop
+
+CACHE_KEY = 'fare_matrix:{route_id}'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class FareMatrix:
+    """Flat n x n matrix of segment fares (in centavos) for one route"""
+
+    def __init__(self, stop_ids, fares):
+        self.stop_ids = tuple(stop_ids)
+        self.size = len(self.stop_ids)
+        self.index = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.fares = fares
+
+    def fare(self, pickup_stop_id, dropoff_stop_id):
+        """Fare for one seat between two stops, or None for an invalid segment"""
+        try:
+            centavos = self.fares[self.index[pickup_stop_id] * self.size + self.index[dropoff_stop_id]]
+        except KeyError:
+            return None
+        if not centavos:
+            return None
+        return Decimal(centavos) / 100
+
+    def __getstate__(self):
+        return {'stop_ids': self.stop_ids, 'fares': self.fares}
+
+    def __setstate__(self, state):
+        self.__init__(state['stop_ids'], state['fares'])
+
+
+def _stop_distances(route, stops):
+    """
+    Cumulative distance (km) of every stop from the route origin.
+    Uses Stop.distance_km when all stops have it, otherwise spreads the
+    route distance over the stops by their scheduled arrival offsets.
+    """
+    if all(stop.distance_km is not None for stop in stops):
+        return [Decimal(stop.distance_km) for stop in stops]
+
+    minutes = [stop.estimated_arrival_time.hour * 60 + stop.estimated_arrival_time.minute for stop in stops]
+    offsets = [m - minutes[0] for m in minutes]
+    if offsets[-1] <= 0 or any(b < a for a, b in zip(offsets, offsets[1:])):
+        # Times are missing or wrap past midnight; fall back to stop order
+        offsets = list(range(len(stops)))
+    span = offsets[-1] or 1
+    return [Decimal(route.distance_km) * offset / span for offset in offsets]
+
+
+def build_fare_matrix(route):
+    """Compute the full pickup x dropoff fare matrix for a route"""
+    stops = list(Stop.objects.filter(route=route, is_active=True).order_by('stop_order'))
+    n = len(stops)
+    fares = array('L', bytes(array('L').itemsize * n * n))
+    if n < 2:
+        return FareMatrix([stop.id for stop in stops], fares)
+
+    distances = _stop_distances(route, stops)
+    total = distances[-1] - distances[0]
+    full_fare = Decimal(route.fare) * 100
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            if total > 0:
+                centavos = full_fare * (distances[j] - distances[i]) / total
+            else:
+                centavos = full_fare
+            # Every valid segment costs at least one centavo so 0 can mark invalid ones
+            fares[i * n + j] = max(1, int(centavos.quantize(Decimal('1'), rounding=ROUND_HALF_UP)))
+
+    return FareMatrix([stop.id for stop in stops], fares)
+
+
+def get_fare_matrix(route):
+    """Cached fare matrix for a route, rebuilt on a cache miss"""
+    key = CACHE_KEY.format(route_id=route.pk)
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = build_fare_matrix(route)
+        cache.set(key, matrix, CACHE_TIMEOUT)
+    return matrix
+
+
+def invalidate_fare_matrix(route_id):
+    cache.delete(CACHE_KEY.format(route_id=route_id))
+
+
+def segment_fare(route, pickup_stop, dropoff_stop):
+    """Fare for one seat from pickup_stop to dropoff_stop, or None if the segment is invalid"""
+    return get_fare_matrix(route).fare(pickup_stop.pk, dropoff_stop.pk)
@@ -0,0 +1,532 @@
+# gtfs.py
+"""
+GTFS import and export of the route network.
+
+How a feed maps onto the models:
+
+    stops.txt            Place (stop_id is P<place id> on export)
+    routes.txt           Route, keyed by route_id = route_code. Fields GTFS
+                         has no column for travel in extension columns:
+                         origin, destination, distance_km,
+                         estimated_duration, service_type, vehicle_plate
+    fare_attributes.txt  Route.fare, through fare_rules.txt
+    calendar.txt         the weekdays (and ServiceCalendar) of a service
+    trips.txt            one Schedule per trip and weekday of its service
+    stop_times.txt       schedule times; the route's first trip also
+                         defines its Stop rows
+    vehicles.txt         Vehicle (extension file, keyed by plate number)
+
+Both directions stream. Import reads each file row by row and writes in
+chunks with bulk_create/bulk_update inside a single transaction, keeping
+only id maps in memory. Export walks querysets with .iterator() and writes
+straight into the zip. Bulk writes skip model signals, so import rebuilds
+the route search index, rebuilds the revenue rollup of routes whose bookings
+moved to another vehicle type and marks their report cube months dirty, and
+starts a new catalog version itself.
+"""
+import csv
+import io
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, time
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+
+from .catalog import bump_catalog_version
+from .cube import mark_dirty
+from .fares import invalidate_fare_matrix
+from .models import Vehicle, Route, Place, Stop, Schedule, ServiceCalendar, Booking
+from .revenue import rebuild as rebuild_revenue
+from .search import route_index
+
+GTFS_DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+GTFS_BUS = 3
+OPEN_START = date(2000, 1, 1)
+OPEN_END = date(2099, 12, 31)
+# bulk_update writes one CASE expression per field, which slows down sharply
+# past a few hundred rows per statement
+UPDATE_BATCH = 250
+
+
+class FeedError(Exception):
+    pass
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def minutes_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+def parse_gtfs_time(value):
+    """Minutes after midnight of the service day; GTFS times may pass 24:00:00"""
+    hours, minutes, *_ = value.strip().split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def format_gtfs_time(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}:00'
+
+
+def clock(minutes):
+    minutes %= 24 * 60
+    return time(minutes // 60, minutes % 60)
+
+
+def parse_gtfs_date(value):
+    value = value.strip()
+    return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+
+def service_id_for(weekday, calendar_name=None):
+    day = Schedule.DAY_NAMES[weekday]
+    return f'{calendar_name}:{day}' if calendar_name else day
+
+
+# ================== EXPORT ==================
+
+@contextmanager
+def _member(feed, name, header):
+    with feed.open(name, 'w') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(header)
+        yield writer
+        text.flush()
+        text.detach()
+
+
+def export_feed(path, agency_name='Sakay', agency_url='', agency_timezone='Asia/Manila', chunk_size=2000):
+    """Write every active route, with its stops, schedules and vehicle, to a GTFS zip"""
+    counts = Counter()
+    routes = Route.objects.filter(is_active=True)
+    schedules = Schedule.objects.filter(route__is_active=True, is_active=True)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as feed:
+        with _member(feed, 'agency.txt', ['agency_id', 'agency_name', 'agency_url', 'agency_timezone']) as writer:
+            writer.writerow(['sakay', agency_name, agency_url, agency_timezone])
+
+        with _member(feed, 'vehicles.txt', ['plate_number', 'vehicle_type', 'model', 'color', 'capacity', 'year',
+                                            'is_active']) as writer:
+            for vehicle in Vehicle.objects.filter(route__is_active=True).distinct().order_by('plate_number').iterator(chunk_size):
+                writer.writerow([vehicle.plate_number, vehicle.vehicle_type, vehicle.model, vehicle.color,
+                                 vehicle.capacity, vehicle.year, int(vehicle.is_active)])
+                counts['vehicles'] += 1
+
+        places = Place.objects.filter(stops__route__is_active=True, stops__is_active=True).distinct().order_by('id')
+        with _member(feed, 'stops.txt', ['stop_id', 'stop_name', 'stop_lat', 'stop_lon']) as writer:
+            for place in places.iterator(chunk_size):
+                writer.writerow([f'P{place.id}', place.name,
+                                 '' if place.latitude is None else place.latitude,
+                                 '' if place.longitude is None else place.longitude])
+                counts['stops'] += 1
+
+        route_rows = routes.select_related('vehicle').order_by('route_code')
+        with _member(feed, 'routes.txt', ['route_id', 'agency_id', 'route_short_name', 'route_long_name',
+                                          'route_type', 'origin', 'destination', 'distance_km',
+                                          'estimated_duration', 'service_type', 'vehicle_plate']) as writer:
+            for route in route_rows.iterator(chunk_size):
+                writer.writerow([route.route_code, 'sakay', route.route_code, route.route_name, GTFS_BUS,
+                                 route.origin, route.destination, route.distance_km, route.estimated_duration,
+                                 route.route_type, route.vehicle.plate_number])
+                counts['routes'] += 1
+
+        fares = routes.order_by('route_code').values_list('route_code', 'fare')
+        with _member(feed, 'fare_attributes.txt', ['fare_id', 'price', 'currency_type', 'payment_method',
+                                                   'transfers']) as writer:
+            for route_code, fare in fares.iterator(chunk_size):
+                writer.writerow([route_code, fare, 'PHP', 0, 0])
+        with _member(feed, 'fare_rules.txt', ['fare_id', 'route_id']) as writer:
+            for route_code, _ in fares.iterator(chunk_size):
+                writer.writerow([route_code, route_code])
+
+        services = schedules.values_list(
+            'weekday', 'calendar__name', 'calendar__start_date', 'calendar__end_date'
+        ).distinct().order_by('calendar__name', 'weekday')
+        with _member(feed, 'calendar.txt', ['service_id'] + GTFS_DAYS + ['start_date', 'end_date']) as writer:
+            for weekday, name, start, end in services:
+                flags = [int(day == weekday) for day in range(7)]
+                writer.writerow([service_id_for(weekday, name)] + flags +
+                                [(start or OPEN_START).strftime('%Y%m%d'), (end or OPEN_END).strftime('%Y%m%d')])
+
+        trip_rows = schedules.values_list('id', 'route__route_code', 'weekday', 'calendar__name', 'route__destination')
+        with _member(feed, 'trips.txt', ['route_id', 'service_id', 'trip_id', 'trip_headsign']) as writer:
+            for schedule_id, route_code, weekday, name, destination in trip_rows.order_by('route_id', 'id').iterator(chunk_size):
+                writer.writerow([route_code, service_id_for(weekday, name), f'S{schedule_id}', destination])
+                counts['trips'] += 1
+
+        with _member(feed, 'stop_times.txt', ['trip_id', 'arrival_time', 'departure_time', 'stop_id',
+                                              'stop_sequence', 'shape_dist_traveled']) as writer:
+            counts['stop_times'] = _write_stop_times(writer, schedules, chunk_size)
+
+    return counts
+
+
+def _write_stop_times(writer, schedules, chunk_size):
+    """
+    Merge-join schedules and stops, both ordered by route, so only one
+    route's stops are held in memory at a time.
+    """
+    stops = Stop.objects.filter(route__is_active=True, is_active=True).order_by('route_id', 'stop_order').values_list(
+        'route_id', 'place_id', 'stop_order', 'estimated_arrival_time', 'distance_km'
+    ).iterator(chunk_size)
+    pending = next(stops, None)
+    route_id, route_stops = None, []
+    rows = 0
+
+    trips = schedules.order_by('route_id', 'id').values_list('id', 'route_id', 'departure_time').iterator(chunk_size)
+    for schedule_id, schedule_route_id, departure in trips:
+        if schedule_route_id != route_id:
+            route_id, route_stops = schedule_route_id, []
+            while pending is not None and pending[0] < route_id:
+                pending = next(stops, None)
+            while pending is not None and pending[0] == route_id:
+                route_stops.append(pending)
+                pending = next(stops, None)
+        if not route_stops:
+            continue
+
+        first = minutes_of_day(route_stops[0][3])
+        start = minutes_of_day(departure)
+        for _, place_id, stop_order, arrival, distance in route_stops:
+            at = format_gtfs_time(start + (minutes_of_day(arrival) - first) % (24 * 60))
+            writer.writerow([f'S{schedule_id}', at, at, f'P{place_id}', stop_order,
+                             '' if distance is None else distance])
+            rows += 1
+    return rows
+
+
+# ================== IMPORT ==================
+
+def _rows(feed, name, required=True):
+    if name not in feed.namelist():
+        if required:
+            raise FeedError(f'{name} is missing from the feed')
+        return
+    with feed.open(name) as raw:
+        yield from csv.DictReader(io.TextIOWrapper(raw, encoding='utf-8-sig', newline=''))
+
+
+def _decimal(value, places, default=None):
+    """Rounded like the model field, so unchanged values compare equal to what is stored"""
+    value = (value or '').strip()
+    return Decimal(value).quantize(Decimal(1).scaleb(-places)) if value else default
+
+
+def _values(obj, fields):
+    return [getattr(obj, obj._meta.get_field(name).attname) for name in fields]
+
+
+def import_feed(path, batch_size=1000, default_vehicle=None):
+    """
+    Load a GTFS zip in one transaction. Routes, places, stops, schedules
+    and vehicles are matched on their natural keys and updated in place;
+    stops and schedules of imported routes that are no longer in the feed
+    are deactivated rather than deleted, so existing bookings keep them.
+    """
+    counts = Counter()
+    with zipfile.ZipFile(path) as feed, transaction.atomic():
+        retyped = _import_vehicles(feed, batch_size, counts)
+        places = _import_places(feed, batch_size, counts)
+        routes, moved = _import_routes(feed, batch_size, counts, default_vehicle)
+        services = _import_services(feed)
+        trips = {}
+        for row in _rows(feed, 'trips.txt'):
+            if row['route_id'] not in routes:
+                raise FeedError(f'Trip {row["trip_id"]} uses unknown route {row["route_id"]}')
+            if row['service_id'] not in services:
+                raise FeedError(f'Trip {row["trip_id"]} uses unknown service {row["service_id"]}')
+            trips[row['trip_id']] = (routes[row['route_id']], row['service_id'])
+
+        patterns, times = _scan_stop_times(feed, trips, places)
+        _import_stops(patterns, batch_size, counts)
+        _import_schedules(trips, times, services, routes, batch_size, counts)
+        _fill_route_ends(patterns, routes, batch_size)
+
+        route_index().rebuild()
+        _rebuild_rollups(moved | set(Route.objects.filter(vehicle_id__in=retyped).values_list('pk', flat=True)),
+                         batch_size, counts)
+
+        def refresh_caches():
+            for route_id in routes.values():
+                invalidate_fare_matrix(route_id)
+            bump_catalog_version()
+        transaction.on_commit(refresh_caches)
+
+    return counts
+
+
+def _import_vehicles(feed, batch_size, counts):
+    """Ids of the existing vehicles whose type changed"""
+    fields = ['vehicle_type', 'model', 'color', 'capacity', 'year', 'is_active']
+    retyped = set()
+    for chunk in chunked(_rows(feed, 'vehicles.txt', required=False), batch_size):
+        existing = Vehicle.objects.in_bulk([row['plate_number'] for row in chunk], field_name='plate_number')
+        created, updated = [], []
+        for row in chunk:
+            vehicle = existing.get(row['plate_number']) or Vehicle(plate_number=row['plate_number'])
+            before = _values(vehicle, fields)
+            if vehicle.pk is not None and vehicle.vehicle_type != row['vehicle_type']:
+                retyped.add(vehicle.pk)
+            vehicle.vehicle_type = row['vehicle_type']
+            vehicle.model = row.get('model', '')
+            vehicle.color = row.get('color', '')
+            vehicle.capacity = int(row['capacity'])
+            vehicle.year = int(row.get('year') or date.today().year)
+            vehicle.is_active = row.get('is_active', '1') != '0'
+            if vehicle.pk is None:
+                created.append(vehicle)
+            elif _values(vehicle, fields) != before:
+                updated.append(vehicle)
+        Vehicle.objects.bulk_create(created)
+        Vehicle.objects.bulk_update(updated, fields, batch_size=UPDATE_BATCH)
+        counts['vehicles created'] += len(created)
+        counts['vehicles updated'] += len(updated)
+    return retyped
+
+
+def _import_places(feed, batch_size, counts):
+    """GTFS stop_id -> (place id, stop name). Stops sharing a name share a place."""
+    places = {}
+    by_key = {}
+    for chunk in chunked(_rows(feed, 'stops.txt'), batch_size):
+        keys = {Place.key_for(row['stop_name']) for row in chunk} - by_key.keys()
+        by_key.update(Place.objects.in_bulk(keys, field_name='key'))
+        created, updated = {}, {}
+        for row in chunk:
+            key = Place.key_for(row['stop_name'])
+            place = by_key.get(key)
+            if place is None:
+                place = by_key[key] = created[key] = Place(name=row['stop_name'].strip(), key=key)
+            latitude, longitude = _decimal(row.get('stop_lat'), 6), _decimal(row.get('stop_lon'), 6)
+            if latitude is not None and longitude is not None and (latitude, longitude) != (place.latitude, place.longitude):
+                place.latitude, place.longitude = latitude, longitude
+                if place.pk:
+                    updated[key] = place
+            places[row['stop_id']] = (place, row['stop_name'].strip())
+        Place.objects.bulk_create(created.values())
+        Place.objects.bulk_update(updated.values(), ['latitude', 'longitude'], batch_size=UPDATE_BATCH)
+        counts['places created'] += len(created)
+        counts['places updated'] += len(updated)
+    return {stop_id: (place.pk, name) for stop_id, (place, name) in places.items()}
+
+
+def _import_routes(feed, batch_size, counts, default_vehicle):
+    """route_code -> Route id, and the ids of the existing routes that changed vehicle"""
+    fare_prices = {row['fare_id']: Decimal(row['price']) for row in _rows(feed, 'fare_attributes.txt', required=False)}
+    fares = {
+        row['route_id']: fare_prices[row['fare_id']]
+        for row in _rows(feed, 'fare_rules.txt', required=False)
+        if row.get('route_id') and row['fare_id'] in fare_prices
+    }
+    fields = ['route_name', 'origin', 'destination', 'distance_km', 'fare', 'estimated_duration', 'route_type',
+              'vehicle', 'is_active']
+    route_types = {value for value, _ in Route.ROUTE_TYPE_CHOICES}
+    vehicles = {}
+    routes = {}   # route_code -> Route until the end, then -> id
+    moved = set()
+
+    for chunk in chunked(_rows(feed, 'routes.txt'), batch_size):
+        plates = {row.get('vehicle_plate') or default_vehicle for row in chunk} - vehicles.keys() - {None, ''}
+        vehicles.update(Vehicle.objects.filter(plate_number__in=plates).values_list('plate_number', 'id'))
+        existing = Route.objects.in_bulk([row['route_id'] for row in chunk], field_name='route_code')
+        created, updated = [], []
+        for row in chunk:
+            plate = row.get('vehicle_plate') or default_vehicle
+            if plate not in vehicles:
+                raise FeedError(f'Route {row["route_id"]} has no known vehicle; give vehicle_plate or --vehicle')
+            route = existing.get(row['route_id']) or Route(route_code=row['route_id'])
+            before = _values(route, fields)
+            route.route_name = row.get('route_long_name') or row.get('route_short_name') or row['route_id']
+            route.origin = row.get('origin', route.origin)
+            route.destination = row.get('destination', route.destination)
+            route.distance_km = _decimal(row.get('distance_km'), 2, route.distance_km or Decimal('0'))
+            route.fare = fares.get(row['route_id'], route.fare if route.fare is not None else Decimal('0'))
+            route.estimated_duration = row.get('estimated_duration', route.estimated_duration)
+            service_type = row.get('service_type')
+            route.route_type = service_type if service_type in route_types else route.route_type or 'PICKUP'
+            if route.pk is not None and route.vehicle_id != vehicles[plate]:
+                moved.add(route.pk)
+            route.vehicle_id = vehicles[plate]
+            route.is_active = True
+            if row['route_id'] not in fares:
+                counts['routes without a fare'] += 1
+            if route.pk is None:
+                created.append(route)
+            elif _values(route, fields) != before:
+                updated.append(route)
+            routes[route.route_code] = route
+        Route.objects.bulk_create(created)
+        Route.objects.bulk_update(updated, fields, batch_size=UPDATE_BATCH)
+        counts['routes created'] += len(created)
+        counts['routes updated'] += len(updated)
+    routes = {route_code: route.pk for route_code, route in routes.items()}
+    return routes, moved
+
+
+def _rebuild_rollups(route_ids, batch_size, counts):
+    """
+    Bookings of these routes now fall under another vehicle type. Rebuild
+    their daily revenue rows, as the Route and Vehicle signals would have,
+    and mark their months for the next report cube refresh.
+    """
+    if not route_ids:
+        return
+    counts['revenue rows rebuilt'] += rebuild_revenue(batch_size=batch_size, route_ids=route_ids)
+    mark_dirty(Booking.objects.filter(route_id__in=route_ids).dates('booking_date', 'month'))
+
+
+def _import_services(feed):
+    """service_id -> (weekdays, ServiceCalendar id or None)"""
+    services = {}
+    for row in _rows(feed, 'calendar.txt'):
+        weekdays = [day for day, name in enumerate(GTFS_DAYS) if row[name].strip() == '1']
+        start, end = parse_gtfs_date(row['start_date']), parse_gtfs_date(row['end_date'])
+        calendar_id = None
+        if start > OPEN_START or end < OPEN_END:
+            # Our own exports name services "<calendar>:<DAY>"
+            name, _, day = row['service_id'].rpartition(':')
+            if not name or day not in Schedule.DAY_NAMES:
+                name = row['service_id']
+            calendar, _ = ServiceCalendar.objects.update_or_create(
+                name=name, defaults={'start_date': start, 'end_date': None if end >= OPEN_END else end}
+            )
+            calendar_id = calendar.pk
+        services[row['service_id']] = (weekdays, calendar_id)
+    return services
+
+
+def _scan_stop_times(feed, trips, places):
+    """
+    One streaming pass over stop_times.txt. Returns each route's stop
+    pattern (taken from its first trip in the file) and each trip's
+    (departure, arrival) in minutes.
+    """
+    pattern_trip = {}   # route id -> trip_id defining its stops
+    patterns = {}       # route id -> [(sequence, place id, stop name, arrival, distance)]
+    bounds = {}         # trip_id -> [first sequence, departure, last sequence, arrival]
+
+    for row in _rows(feed, 'stop_times.txt'):
+        trip_id = row['trip_id']
+        if trip_id not in trips:
+            raise FeedError(f'stop_times.txt refers to unknown trip {trip_id}')
+        if row['stop_id'] not in places:
+            raise FeedError(f'stop_times.txt refers to unknown stop {row["stop_id"]}')
+        route_id = trips[trip_id][0]
+        sequence = int(row['stop_sequence'])
+        arrival = parse_gtfs_time(row['arrival_time'] or row['departure_time'])
+        departure = parse_gtfs_time(row['departure_time'] or row['arrival_time'])
+
+        trip = bounds.get(trip_id)
+        if trip is None:
+            bounds[trip_id] = [sequence, departure, sequence, arrival]
+        else:
+            if sequence < trip[0]:
+                trip[0], trip[1] = sequence, departure
+            if sequence > trip[2]:
+                trip[2], trip[3] = sequence, arrival
+
+        if pattern_trip.setdefault(route_id, trip_id) == trip_id:
+            place_id, stop_name = places[row['stop_id']]
+            patterns.setdefault(route_id, []).append(
+                (sequence, place_id, stop_name, arrival, _decimal(row.get('shape_dist_traveled'), 2))
+            )
+
+    for stops in patterns.values():
+        stops.sort()
+    times = {trip_id: (trip[1], trip[3]) for trip_id, trip in bounds.items()}
+    return patterns, times
+
+
+def _import_stops(patterns, batch_size, counts):
+    """Upsert each route's stops by stop_order; deactivate the ones past the end of the pattern"""
+    fields = ['place', 'stop_name', 'estimated_arrival_time', 'distance_km', 'is_active']
+    for chunk in chunked(patterns.items(), batch_size):
+        existing = {
+            (stop.route_id, stop.stop_order): stop
+            for stop in Stop.objects.filter(route_id__in=[route_id for route_id, _ in chunk])
+        }
+        created, updated = [], []
+        for route_id, stops in chunk:
+            for order, (_, place_id, stop_name, arrival, distance) in enumerate(stops, 1):
+                stop = existing.pop((route_id, order), None) or Stop(route_id=route_id, stop_order=order)
+                before = _values(stop, fields)
+                stop.place_id = place_id
+                stop.stop_name = stop_name
+                stop.estimated_arrival_time = clock(arrival)
+                stop.distance_km = distance
+                stop.is_active = True
+                if stop.pk is None:
+                    created.append(stop)
+                elif _values(stop, fields) != before:
+                    updated.append(stop)
+        dropped = [stop for stop in existing.values() if stop.is_active]
+        for stop in dropped:
+            stop.is_active = False
+        Stop.objects.bulk_create(created, batch_size=batch_size)
+        Stop.objects.bulk_update(updated, fields, batch_size=UPDATE_BATCH)
+        Stop.objects.bulk_update(dropped, ['is_active'], batch_size=UPDATE_BATCH)
+        counts['stops created'] += len(created)
+        counts['stops updated'] += len(updated)
+        counts['stops deactivated'] += len(dropped)
+
+
+def _import_schedules(trips, times, services, routes, batch_size, counts):
+    """Match schedules on (route, weekday, departure time); deactivate the ones the feed dropped"""
+    wanted = {}
+    for trip_id, (route_id, service_id) in trips.items():
+        if trip_id not in times:
+            continue
+        departure, arrival = times[trip_id]
+        weekdays, calendar_id = services[service_id]
+        for weekday in weekdays:
+            wanted[(route_id, weekday, clock(departure))] = (clock(arrival), calendar_id)
+
+    fields = ['arrival_time', 'calendar', 'is_active']
+    for route_ids in chunked(routes.values(), batch_size):
+        updated, dropped = [], []
+        for schedule in Schedule.objects.filter(route_id__in=route_ids):
+            match = wanted.pop((schedule.route_id, schedule.weekday, schedule.departure_time), None)
+            if match is None:
+                if schedule.is_active:
+                    schedule.is_active = False
+                    dropped.append(schedule)
+                continue
+            if (schedule.arrival_time, schedule.calendar_id, schedule.is_active) != (*match, True):
+                schedule.arrival_time, schedule.calendar_id = match
+                schedule.is_active = True
+                updated.append(schedule)
+        Schedule.objects.bulk_update(updated + dropped, fields, batch_size=UPDATE_BATCH)
+        counts['schedules updated'] += len(updated)
+        counts['schedules deactivated'] += len(dropped)
+
+    for chunk in chunked(wanted.items(), batch_size):
+        Schedule.objects.bulk_create([
+            Schedule(route_id=route_id, weekday=weekday, departure_time=departure,
+                     arrival_time=arrival, calendar_id=calendar_id)
+            for (route_id, weekday, departure), (arrival, calendar_id) in chunk
+        ])
+        counts['schedules created'] += len(chunk)
+
+
+def _fill_route_ends(patterns, routes, batch_size):
+    """Plain GTFS feeds have no origin/destination columns; take them from the stop pattern"""
+    for route_ids in chunked(routes.values(), batch_size):
+        blank = [
+            route for route in Route.objects.filter(pk__in=route_ids)
+            if (not route.origin or not route.destination) and patterns.get(route.pk)
+        ]
+        for route in blank:
+            route.origin = route.origin or patterns[route.pk][0][2]
+            route.destination = route.destination or patterns[route.pk][-1][2]
+        Route.objects.bulk_update(blank, ['origin', 'destination'], batch_size=UPDATE_BATCH)
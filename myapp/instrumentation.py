@@ -0,0 +1,159 @@
+# instrumentation.py
+"""
+Per-view request metrics, kept in the memory of each process.
+
+RequestMetricsMiddleware times every request into the Prometheus latency
+histogram (see metrics.py). For a sample of them (the
+REQUEST_METRICS_SAMPLE_RATE share) it also counts queries and SQL time
+through a connection.execute_wrapper hook. The sampled figures are added up
+per URL name in the process-wide `aggregator`, which the admin performance
+endpoint reads. They start over when the process restarts, and each worker
+process has its own.
+"""
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import metrics
+
+# Upper bounds of the latency histogram buckets, in seconds; slower requests land in a last, open bucket
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+UNMATCHED = '<unmatched>'
+
+
+class ViewStats:
+    """Running totals of one URL name"""
+    __slots__ = ('requests', 'latency', 'buckets', 'queries', 'max_queries', 'sql_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.latency = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_time = 0.0
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding that share of the requests, or None past the last bound"""
+        wanted = fraction * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= wanted:
+                return bound
+        return None
+
+
+class Aggregator:
+    """Request metrics per URL name. record() takes a lock only long enough to add to the totals."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self.started_at = timezone.now()
+
+    def record(self, view, latency, queries, sql_time):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = ViewStats()
+            stats.requests += 1
+            stats.latency += latency
+            stats.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            stats.queries += queries
+            if queries > stats.max_queries:
+                stats.max_queries = queries
+            stats.sql_time += sql_time
+
+    def snapshot(self):
+        """One dict per URL name, the most total time first. Times are in milliseconds."""
+        with self._lock:
+            views = {view: (stats.requests, stats.latency, list(stats.buckets), stats.queries, stats.max_queries,
+                            stats.sql_time) for view, stats in self._views.items()}
+        rows = []
+        for view, (requests, latency, buckets, queries, max_queries, sql_time) in views.items():
+            stats = ViewStats()
+            stats.requests, stats.buckets = requests, buckets
+            rows.append({
+                'view': view,
+                'requests': requests,
+                'total_ms': round(latency * 1000, 1),
+                'mean_ms': round(latency / requests * 1000, 1),
+                'p50_ms': _ms(stats.percentile(0.5)),
+                'p95_ms': _ms(stats.percentile(0.95)),
+                'p99_ms': _ms(stats.percentile(0.99)),
+                'queries_per_request': round(queries / requests, 1),
+                'max_queries': max_queries,
+                'sql_ms_per_request': round(sql_time / requests * 1000, 1),
+                'sql_share': round(sql_time / latency, 2) if latency else 0,
+                'histogram': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], buckets)),
+            })
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+aggregator = Aggregator()
+
+
+class QueryRecorder:
+    """execute_wrapper hook counting the queries run through it and the time they take"""
+    __slots__ = ('queries', 'sql_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - started
+
+
+class RequestMetricsMiddleware:
+    """
+    The one timing hook: records every request's latency per URL name in
+    Prometheus, and whether it found a database connection open. Sampled
+    requests also get their query count and SQL time recorded in
+    `aggregator`; skipped ones cost one random() call, and a sample rate of
+    0 samples none. A streamed response is timed until its view returns, and
+    queries made while streaming it are not counted.
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if connection.connection is not None:
+            metrics.inc('sakay_db_connection_reuses_total')
+        sampled = self.sample_rate >= 1 or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder) if sampled else nullcontext():
+            response = self.get_response(request)
+        latency = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else UNMATCHED
+        metrics.observe('sakay_http_request_duration_seconds', latency, view=view)
+        if sampled:
+            aggregator.record(view, latency, recorder.queries, recorder.sql_time)
+        return response
@@ -0,0 +1,185 @@
+# journeys.py
+"""
+Multi-route journey planner.
+
+The graph is built from the cached route catalog: stops on different routes
+that share a Place are one node where passengers can transfer, and
+every active schedule becomes a timed trip whose stop times are the schedule's
+departure plus each stop's offset along the route. Consecutive stops of a trip
+form connections, kept sorted by departure time per weekday.
+
+Queries run a round-based connection scan: round k only boards trips at stops
+reached in round k-1, so each round adds one trip and the search stops after
+max_transfers + 1 rounds. Every round that improves the arrival time yields a
+journey, giving the best option for each number of transfers. A query scans
+only the trips of the schedules running on its date (see
+service_calendar.py), taken from the weekdays they keep, so removed dates
+have no trips and added dates run the timetable they borrow.
+
+The graph is memoized per catalog version, so it is rebuilt only when the
+route network changes.
+"""
+from bisect import bisect_left
+from collections import namedtuple
+from heapq import merge
+from itertools import islice
+
+from .catalog import get_catalog, memoize_on_version
+from .models import Place
+
+MIN_TRANSFER_MINUTES = 5
+
+Connection = namedtuple('Connection', 'departure arrival from_node to_node trip')
+Leg = namedtuple('Leg', 'trip from_node departure to_node arrival')
+Label = namedtuple('Label', 'arrival leg parent')
+
+
+def minutes_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+def place_key(stop_name):
+    """Registry key of the place a stop name refers to"""
+    return Place.key_for(stop_name)
+
+
+class JourneyGraph:
+
+    def __init__(self, catalog):
+        self.nodes = []        # node -> display name
+        self.node_index = {}   # place key -> node
+        self.aliases = {}      # stop name key -> node
+        self.stop_node = {}    # Stop.id -> node
+        self.trips = []        # trip -> (route dict, schedule dict)
+        self.schedule_trip = {}  # Schedule.id -> trip
+        by_day = {}
+
+        for route in catalog['routes']:
+            stops = route['stops']
+            if len(stops) < 2:
+                continue
+            nodes = [self._node(stop) for stop in stops]
+            first = minutes_of_day(stops[0]['estimated_arrival_time'])
+            offsets = [(minutes_of_day(stop['estimated_arrival_time']) - first) % (24 * 60) for stop in stops]
+
+            for schedule in route['schedules']:
+                trip = len(self.trips)
+                self.trips.append((route, schedule))
+                self.schedule_trip[schedule['id']] = trip
+                start = minutes_of_day(schedule['departure_time'])
+                times = [start + offset for offset in offsets]
+                day = by_day.setdefault(schedule['weekday'], [])
+                for i in range(len(stops) - 1):
+                    day.append(Connection(times[i], times[i + 1], nodes[i], nodes[i + 1], trip))
+
+        self.connections = {}
+        self.departures = {}
+        for day, connections in by_day.items():
+            connections.sort()
+            self.connections[day] = connections
+            self.departures[day] = [c.departure for c in connections]
+
+    def _node(self, stop):
+        key = stop['place_key']
+        node = self.node_index.get(key)
+        if node is None:
+            node = self.node_index[key] = len(self.nodes)
+            self.nodes.append(stop['place_name'])
+        # Spellings merged into the place still resolve to it
+        self.aliases.setdefault(place_key(stop['stop_name']), node)
+        self.stop_node[stop['id']] = node
+        return node
+
+    def resolve(self, value):
+        """Node for a Stop id or a stop name, or None"""
+        value = str(value).strip()
+        if value.isdigit():
+            return self.stop_node.get(int(value))
+        key = place_key(value)
+        node = self.node_index.get(key)
+        return node if node is not None else self.aliases.get(key)
+
+    def earliest_arrivals(self, origin, destination, running, depart_at, max_transfers=2):
+        """
+        Best journey for each number of transfers up to max_transfers, on the
+        trips of the running schedule ids of a date, leaving origin no earlier
+        than depart_at (minutes after midnight). Only journeys that arrive
+        strictly earlier than all journeys with fewer transfers are returned.
+        """
+        trips = {self.schedule_trip[schedule_id] for schedule_id in running if schedule_id in self.schedule_trip}
+        streams = []
+        for day in sorted({self.trips[trip][1]['weekday'] for trip in trips}):
+            streams.append(islice(self.connections[day], bisect_left(self.departures[day], depart_at), None))
+        connections = [connection for connection in merge(*streams) if connection.trip in trips]
+        best = float('inf')
+        journeys = []
+        previous = {origin: Label(depart_at, None, None)}
+
+        for _ in range(max_transfers + 1):
+            labels = dict(previous)
+            boarded = {}
+            for connection in connections:
+                if connection.departure >= best:
+                    break
+                trip = connection.trip
+                if trip not in boarded:
+                    label = previous.get(connection.from_node)
+                    if label is None:
+                        continue
+                    ready = label.arrival if label.leg is None else label.arrival + MIN_TRANSFER_MINUTES
+                    if ready > connection.departure:
+                        continue
+                    boarded[trip] = (connection.from_node, connection.departure, label)
+                board_node, board_time, parent = boarded[trip]
+                current = labels.get(connection.to_node)
+                if current is None or connection.arrival < current.arrival:
+                    leg = Leg(trip, board_node, board_time, connection.to_node, connection.arrival)
+                    labels[connection.to_node] = Label(connection.arrival, leg, parent)
+
+            target = labels.get(destination)
+            if target is not None and target.arrival < best:
+                best = target.arrival
+                journeys.append(self._legs(target))
+            if not boarded:
+                break
+            previous = labels
+
+        return journeys
+
+    def _legs(self, label):
+        legs = []
+        while label.leg is not None:
+            legs.append(label.leg)
+            label = label.parent
+        legs.reverse()
+        return legs
+
+    def describe(self, legs):
+        """JSON-ready description of a journey"""
+        def clock(minutes):
+            return f'{(minutes // 60) % 24:02d}:{minutes % 60:02d}'
+
+        described = []
+        for leg in legs:
+            route, schedule = self.trips[leg.trip]
+            described.append({
+                'route_code': route['route_code'],
+                'route_name': route['route_name'],
+                'schedule_id': schedule['id'],
+                'from_stop': self.nodes[leg.from_node],
+                'to_stop': self.nodes[leg.to_node],
+                'departure': clock(leg.departure),
+                'arrival': clock(leg.arrival),
+            })
+        return {
+            'departure': described[0]['departure'],
+            'arrival': described[-1]['arrival'],
+            'duration_minutes': legs[-1].arrival - legs[0].departure,
+            'transfers': len(legs) - 1,
+            'legs': described,
+        }
+
+
+def get_journey_graph():
+    """Journey graph for the current catalog version"""
+    return memoize_on_version('journey_graph', lambda: JourneyGraph(get_catalog()))
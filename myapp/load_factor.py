@@ -0,0 +1,130 @@
+# load_factor.py
+"""
+Load factor per departure.
+
+The load factor of a departure (a schedule on a date) is the seats booked on
+it, cancellations aside, over the capacity of the route's vehicle. The weeks
+asked for come from one grouped query over their bookings, joined to the
+route's vehicle for the capacity, and departures nobody booked are
+filled in at zero from the cached catalog and service calendar. Each week is
+cached under the catalog version (so a new vehicle or timetable shows at
+once); the current and future weeks expire after a few minutes as bookings
+come in, past weeks after a day.
+"""
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models import F, FloatField, Q, Sum
+from django.db.models.functions import Cast, NullIf
+
+from .catalog import catalog_version, get_catalog
+from .models import Booking
+from .service_calendar import running_schedule_ids_on
+
+CACHE_KEY = 'load_factor:{version}:{week}'
+CURRENT_WEEK_TIMEOUT = 60 * 5
+PAST_WEEK_TIMEOUT = 60 * 60 * 24
+
+
+def week_of(day):
+    """Monday of the day's week"""
+    return day - timedelta(days=day.weekday())
+
+
+def booked_seats(start, end):
+    """{(schedule id, date): (seats, capacity, load factor)} from the bookings from start to end"""
+    rows = Booking.objects.filter(
+        booking_date__gte=start, booking_date__lte=end
+    ).filter(~Q(status='CANCELLED')).order_by().values(
+        'schedule_id', 'booking_date', capacity=F('route__vehicle__capacity'),
+    ).annotate(
+        seats=Sum('seats_booked'),
+        # NULL rather than a division error for a vehicle without capacity
+        load_factor=Cast(Sum('seats_booked'), FloatField()) / NullIf(F('route__vehicle__capacity'), 0),
+    )
+    return {(row['schedule_id'], row['booking_date']): (row['seats'], row['capacity'], row['load_factor'])
+            for row in rows}
+
+
+def build_week(week, booked=None):
+    """
+    Every departure of the week starting on the Monday `week`, with its booked
+    seats and load factor. `booked` is booked_seats() of a span covering the
+    week, when the caller already has it.
+    """
+    if booked is None:
+        booked = booked_seats(week, week + timedelta(days=6))
+    schedules = {
+        schedule['id']: (route, schedule)
+        for route in get_catalog()['routes'] for schedule in route['schedules']
+    }
+    # Departures that run, plus any that were booked regardless
+    end = week + timedelta(days=6)
+    keys = {(schedule_id, day) for schedule_id, day in booked if week <= day <= end}
+    days = [week + timedelta(days=offset) for offset in range(7)]
+    for day, running in running_schedule_ids_on(days).items():
+        keys.update((schedule_id, day) for schedule_id in running)
+
+    departures = []
+    for schedule_id, day in keys:
+        if schedule_id not in schedules:
+            continue  # Inactive schedule or route
+        route, schedule = schedules[schedule_id]
+        vehicle = route['vehicle']
+        seats, capacity, load_factor = booked.get((schedule_id, day), (0, vehicle['capacity'], 0.0))
+        departures.append({
+            'date': day,
+            'schedule_id': schedule_id,
+            'departure_time': schedule['departure_time'],
+            'route_id': route['id'],
+            'route_code': route['route_code'],
+            'route_name': route['route_name'],
+            'plate_number': vehicle['plate_number'],
+            'vehicle_type': vehicle['get_vehicle_type_display'],
+            'capacity': capacity,
+            'seats': seats,
+            'load_factor': load_factor or 0.0,
+        })
+    departures.sort(key=lambda departure: (departure['date'], departure['departure_time'], departure['route_code']))
+    return departures
+
+
+def get_weeks(weeks):
+    """
+    {Monday: departures of its week} for the given Mondays, from the cache
+    when it has them. The weeks it lacks are built off one bookings query.
+    """
+    version = catalog_version()
+    keys = {CACHE_KEY.format(version=version, week=week.isoformat()): week for week in weeks}
+    cached = cache.get_many(keys)
+    found = {keys[key]: departures for key, departures in cached.items()}
+
+    missing = [week for key, week in keys.items() if key not in cached]
+    if missing:
+        booked = booked_seats(min(missing), max(missing) + timedelta(days=6))
+        # Resolves the service calendar of all the days at once, for build_week to find memoized
+        running_schedule_ids_on([week + timedelta(days=offset) for week in missing for offset in range(7)])
+        current_week = week_of(date.today())
+        for week in missing:
+            found[week] = build_week(week, booked)
+            timeout = CURRENT_WEEK_TIMEOUT if week >= current_week else PAST_WEEK_TIMEOUT
+            cache.set(CACHE_KEY.format(version=version, week=week.isoformat()), found[week], timeout)
+    return {week: found[week] for week in weeks}
+
+
+def get_week(week):
+    """Departures of the week starting on the Monday `week`, from the cache when it has them"""
+    return get_weeks([week])[week]
+
+
+def heatmap(departures):
+    """
+    Mean load factor by weekday and departure hour:
+    {(weekday, hour): (mean load factor, departures)}
+    """
+    cells = {}
+    for departure in departures:
+        key = (departure['date'].weekday(), departure['departure_time'].hour)
+        total, count = cells.get(key, (0.0, 0))
+        cells[key] = (total + departure['load_factor'], count + 1)
+    return {key: (total / count, count) for key, (total, count) in cells.items()}
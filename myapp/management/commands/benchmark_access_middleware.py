@@ -0,0 +1,57 @@
+# myapp/management/commands/benchmark_access_middleware.py
+
+import time
+
+from django.contrib.auth import SESSION_KEY
+from django.contrib.messages.storage import default_storage as message_storage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import reverse
+
+from myapp.middleware import ThreeTierAccessMiddleware
+from myapp.roles import ROLE_SESSION_KEY
+
+CASES = [
+    ('static file', None, '/static/css/style.css'),
+    ('signed out', None, 'home'),
+    ('student, own page', 'student', 'my_bookings'),
+    ('student, open page', 'student', 'routes_list'),
+    ('driver, own page', 'driver', 'driver_trips'),
+    ('admin, own page', 'admin', 'admin_reports'),
+    ('student -> admin page', 'student', 'admin_dashboard'),
+    ('driver -> booking page', 'driver', 'my_bookings'),
+]
+
+
+class Command(BaseCommand):
+    help = ('Measures the per-request cost of ThreeTierAccessMiddleware: requests of each role and area '
+            'against a view that does nothing, with the session already loaded, and no database')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000, help='Requests per case')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        response = HttpResponse()
+        middleware = ThreeTierAccessMiddleware(lambda request: response)
+        factory = RequestFactory()
+
+        self.stdout.write(f'{count} requests per case')
+        for label, role, url in CASES:
+            request = factory.get(url if url.startswith('/') else reverse(url))
+            session = SessionBase()
+            session._session_cache = {SESSION_KEY: '1', ROLE_SESSION_KEY: ['1', role]} if role else {}
+            request.session = session
+            request._messages = message_storage(request)
+
+            started = time.perf_counter()
+            for _ in range(count):
+                middleware(request)
+            elapsed = time.perf_counter() - started
+            request._messages._queued_messages.clear()
+
+            outcome = middleware(request)
+            result = 'passed' if outcome is response else f'-> {outcome.url}'
+            self.stdout.write(f'{label:>24}: {elapsed * 1e6 / count:.2f} µs/request ({result})')
@@ -0,0 +1,108 @@
+# myapp/management/commands/benchmark_route_search.py
+
+import random
+import time
+from datetime import time as dtime
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from myapp.models import Vehicle, Route, Stop
+from myapp.search import route_index
+
+SYLLABLES = ['ba', 'ca', 'li', 'nan', 'to', 'gu', 'ma', 'ra', 'si', 'lo', 'pa', 'hin', 'ta', 'bu', 'yo', 'an']
+LANDMARKS = ['Terminal', 'Public Market', 'Junction', 'Town Center', 'Campus', 'Plaza', 'Church', 'Port']
+
+
+def place_names(rng, count):
+    """Barangay-like names, so each search term only matches a few routes"""
+    names = set()
+    while len(names) < count:
+        names.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize())
+    return sorted(names)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks route search (icontains scan vs. search index) on synthetic routes, then rolls back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=3000)
+        parser.add_argument('--stops', type=int, default=8, help='Stops per route')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        index = route_index()
+        self.stdout.write(f'Search backend: {type(index).__name__}')
+
+        places = place_names(rng, max(50, options['routes'] // 5))
+
+        with transaction.atomic():
+            self.create_routes(rng, places, options['routes'], options['stops'])
+            started = time.perf_counter()
+            index.rebuild()
+            self.stdout.write(f'Indexed {options["routes"]} routes in {time.perf_counter() - started:.2f}s')
+
+            # Whole names and typed-so-far prefixes, plus a few misses
+            queries = [rng.choice(places).lower()[:rng.randint(4, 12)] for _ in range(options['queries'])]
+            queries[::10] = ['zzqx'] * len(queries[::10])
+
+            # Same coverage as the index: route names plus stop names
+            def scan(query):
+                return list(Route.objects.filter(
+                    Q(route_name__icontains=query) |
+                    Q(origin__icontains=query) |
+                    Q(destination__icontains=query) |
+                    Q(stops__stop_name__icontains=query)
+                ).values_list('id', flat=True).distinct()[:50])
+
+            self.report('icontains scan', scan, queries)
+            self.report('search index', index.search, queries)
+
+            transaction.set_rollback(True)
+
+    def create_routes(self, rng, places, count, stops_per_route):
+        vehicle = Vehicle.objects.create(
+            plate_number=f'BENCH-{rng.randint(0, 10 ** 6)}', vehicle_type='VAN',
+            model='Benchmark', color='White', capacity=15, year=2024
+        )
+        routes = []
+        for i in range(count):
+            origin, destination = rng.sample(places, 2)
+            routes.append(Route(
+                route_code=f'BENCH-{i:05d}',
+                route_name=f'{origin} to {destination} {rng.choice(LANDMARKS)} Line',
+                origin=f'{origin} {rng.choice(LANDMARKS)}',
+                destination=f'{destination} {rng.choice(LANDMARKS)}',
+                distance_km=Decimal('10.00'),
+                fare=Decimal('50.00'),
+                estimated_duration='30 minutes',
+                route_type='PICKUP',
+                vehicle=vehicle,
+            ))
+        routes = Route.objects.bulk_create(routes, batch_size=500)
+
+        stops = []
+        for route in routes:
+            for order in range(1, stops_per_route + 1):
+                stops.append(Stop(
+                    route=route,
+                    stop_name=f'{rng.choice(places)} {rng.choice(LANDMARKS)}',
+                    stop_order=order,
+                    estimated_arrival_time=dtime(6, order % 60),
+                ))
+        Stop.objects.bulk_create(stops, batch_size=1000)
+
+    def report(self, label, search, queries):
+        hits = 0
+        started = time.perf_counter()
+        for query in queries:
+            hits += len(search(query))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{label:>15}: {elapsed * 1000 / len(queries):.3f} ms/query '
+            f'({len(queries)} queries, {hits} hits)'
+        )
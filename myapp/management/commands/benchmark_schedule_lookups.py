@@ -0,0 +1,107 @@
+# myapp/management/commands/benchmark_schedule_lookups.py
+
+import random
+import time
+from datetime import time as dtime
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from myapp.models import Vehicle, Route, Schedule
+
+BEFORE_TABLE = 'bench_schedule_before'
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks weekday-filtered schedule lookups: the old CharField day_of_week layout '
+            '(FK index only) vs. the integer weekday with its composite index. Rolls back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--routes', type=int, default=2000)
+        parser.add_argument('--departures', type=int, default=12, help='Departures per route per day')
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            route_ids = self.create_schedules(rng, options['routes'], options['departures'])
+            self.create_before_table()
+
+            lookups = [(rng.choice(route_ids), rng.randrange(7)) for _ in range(options['queries'])]
+            day_names = Schedule.DAY_NAMES
+
+            # Both sides run the same raw SQL, so only the column type and index differ
+            def lookup(sql):
+                def run(route_id, day):
+                    with connection.cursor() as cursor:
+                        cursor.execute(sql, [route_id, day])
+                        return cursor.fetchall()
+                return run
+
+            before = lookup(
+                f'SELECT id FROM {BEFORE_TABLE} WHERE route_id = %s AND day_of_week = %s ORDER BY departure_time'
+            )
+            after = lookup(
+                f'SELECT id FROM {Schedule._meta.db_table} WHERE route_id = %s AND weekday = %s '
+                'ORDER BY departure_time'
+            )
+
+            self.stdout.write(f'{Schedule.objects.count()} schedules, {len(lookups)} (route, weekday) lookups')
+            self.report('before (char day, FK index)', before,
+                        [(route_id, day_names[weekday]) for route_id, weekday in lookups])
+            self.report('after (int weekday, composite)', after, lookups)
+
+            self.stdout.write('\nQuery plan after:')
+            route_id, weekday = lookups[0]
+            self.stdout.write(Schedule.objects.filter(
+                route_id=route_id, weekday=weekday
+            ).order_by('departure_time').explain())
+
+            transaction.set_rollback(True)
+
+    def create_schedules(self, rng, routes, departures):
+        vehicle = Vehicle.objects.create(
+            plate_number=f'BENCH-{rng.randint(0, 10 ** 6)}', vehicle_type='VAN',
+            model='Benchmark', color='White', capacity=15, year=2024
+        )
+        created = Route.objects.bulk_create([
+            Route(
+                route_code=f'BENCH-{i:05d}', route_name=f'Benchmark route {i}',
+                origin='Origin', destination='Destination', distance_km=Decimal('10.00'),
+                fare=Decimal('50.00'), estimated_duration='30 minutes', route_type='PICKUP', vehicle=vehicle,
+            )
+            for i in range(routes)
+        ], batch_size=500)
+
+        schedules = []
+        for route in created:
+            for weekday in range(7):
+                for _ in range(departures):
+                    departure = dtime(rng.randrange(5, 21), rng.randrange(60))
+                    schedules.append(Schedule(
+                        route=route, weekday=weekday, departure_time=departure, arrival_time=departure,
+                    ))
+        Schedule.objects.bulk_create(schedules, batch_size=1000)
+        return [route.id for route in created]
+
+    def create_before_table(self):
+        """Copy of the schedules in the pre-migration layout, indexed the way Django indexed it"""
+        cases = ' '.join(f"WHEN {weekday} THEN '{name}'" for weekday, name in enumerate(Schedule.DAY_NAMES))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {BEFORE_TABLE} AS '
+                f'SELECT id, route_id, CASE weekday {cases} END AS day_of_week, departure_time, is_active '
+                f'FROM {Schedule._meta.db_table}'
+            )
+            cursor.execute(f'CREATE INDEX {BEFORE_TABLE}_route ON {BEFORE_TABLE} (route_id)')
+
+    def report(self, label, lookup, lookups):
+        rows = 0
+        started = time.perf_counter()
+        for route_id, weekday in lookups:
+            rows += len(lookup(route_id, weekday))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:>32}: {elapsed * 1e6 / len(lookups):.1f} µs/lookup ({rows} rows)')
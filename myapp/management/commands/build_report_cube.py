@@ -0,0 +1,36 @@
+# myapp/management/commands/build_report_cube.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.cube import rebuild, refresh
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the months of the report cube that bookings changed since the last build; '
+            'run it from cron to keep the reports page current')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every month, e.g. after bookings were written without the ORM')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['all']:
+            cells = rebuild(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ Rebuilt the report cube: {cells} cells in {time.perf_counter() - started:.1f}s'
+            ))
+            return
+
+        built = refresh(batch_size=options['batch_size'])
+        if not built:
+            self.stdout.write('Report cube is up to date')
+            return
+        months = ', '.join(f'{month:%Y-%m}' for month in built)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rebuilt {len(built)} month(s) ({months}): {sum(built.values())} cells '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,452 @@
+# myapp/management/commands/generate_dataset.py
+
+import math
+import random
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from myapp.catalog import bump_catalog_version
+from myapp.cube import rebuild as rebuild_report_cube
+from myapp.fares import build_fare_matrix
+from myapp.models import (Vehicle, Driver, Student, Route, Place, Stop, Schedule, Trip,
+                          Booking, Payment, VehicleLocation)
+from myapp.revenue import rebuild as rebuild_revenue
+from myapp.search import route_index
+
+FIRST_NAMES = ['Juan', 'Maria', 'Jose', 'Ana', 'Mark', 'Angel', 'John', 'Kristine', 'Paolo', 'Jasmine',
+               'Carlo', 'Nicole', 'Miguel', 'Camille', 'Rafael', 'Patricia', 'Gabriel', 'Andrea', 'Luis', 'Bea']
+LAST_NAMES = ['Dela Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Gonzales', 'Bautista',
+              'Villanueva', 'Ramos', 'Aquino', 'Castillo', 'Rivera', 'Navarro', 'Salazar', 'Morales', 'Lim']
+SYLLABLES = ['ba', 'ca', 'li', 'nan', 'to', 'gu', 'ma', 'ra', 'si', 'lo', 'pa', 'hin', 'ta', 'bu', 'yo', 'an']
+VEHICLE_MODELS = {
+    'VAN': ('Toyota Hiace', 15),
+    'BUS': ('Mitsubishi Rosa', 30),
+    'JEEPNEY': ('Modern Jeepney', 20),
+    'COASTER': ('Toyota Coaster', 25),
+}
+PAYMENT_METHODS = ['CASH', 'GCASH', 'CARD', 'BANK_TRANSFER']
+
+# Biliran province, roughly
+CENTER_LAT, CENTER_LNG, SPREAD = 11.58, 124.47, 0.2
+
+
+class Command(BaseCommand):
+    help = ('Generates a large synthetic dataset for benchmarking. The same --seed and --end always '
+            'produce the same network, trips, bookings, payments and GPS fixes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--drivers', type=int, default=60)
+        parser.add_argument('--vehicles', type=int, default=60)
+        parser.add_argument('--routes', type=int, default=60)
+        parser.add_argument('--stops', type=int, default=12, help='Stops per route')
+        parser.add_argument('--departures', type=int, default=8, help='Departures per route per day')
+        parser.add_argument('--days', type=int, default=90, help='Days of trips and bookings up to --end')
+        parser.add_argument('--bookings', type=int, default=50000)
+        parser.add_argument('--fixes', type=int, default=500000, help='GPS fixes (VehicleLocation rows)')
+        parser.add_argument('--end', help='Last day of history (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--tag', default='gen', help='Prefix of generated usernames, codes and ids')
+        parser.add_argument('--password', default='password123', help='Password of every generated user')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.tag = options['tag']
+        if not self.tag.isalnum() or len(self.tag) > 6:
+            raise CommandError('--tag must be alphanumeric and at most 6 characters')
+        try:
+            self.end = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else date.today()
+        except ValueError:
+            raise CommandError('--end must be a date in YYYY-MM-DD format')
+        for name in ('vehicles', 'drivers', 'routes'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be at least 1')
+        if options['stops'] < 2:
+            raise CommandError('--stops must be at least 2')
+        if options['bookings'] and options['students'] < 1:
+            raise CommandError('--bookings needs at least one student')
+        if User.objects.filter(username__startswith=f'{self.tag}_').exists():
+            raise CommandError(f'Users tagged "{self.tag}" already exist; use another --tag')
+
+        # Hashing is deliberately slow, so every generated user shares one hash
+        self.password = make_password(options['password'])
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            students = self.step('students', self.create_students, options['students'])
+            vehicles = self.step('vehicles', self.create_vehicles, options['vehicles'])
+            drivers = self.step('drivers', self.create_drivers, options['drivers'], vehicles)
+            routes = self.step('routes', self.create_routes, options['routes'], options['stops'],
+                               options['departures'], vehicles)
+            trips = self.step('trips', self.create_trips, routes, drivers, options['days'])
+            self.step('bookings', self.create_bookings, options['bookings'], students, routes, trips)
+            self.step('GPS fixes', self.create_fixes, options['fixes'], vehicles, options['days'])
+            # Bookings were inserted without signals, so the rollup and cube are computed once at the end
+            self.step('daily revenue rows', rebuild_revenue, None, None, self.batch_size)
+            self.step('report cube cells', rebuild_report_cube, self.batch_size)
+
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Trip, Booking, Payment, VehicleLocation]):
+                    cursor.execute(sql)
+            route_index().rebuild()
+            transaction.on_commit(bump_catalog_version)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Generated dataset in {time.perf_counter() - started:.1f}s'))
+
+    def step(self, label, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        count = result if isinstance(result, int) else len(result)
+        self.stdout.write(f'  {count} {label} in {time.perf_counter() - started:.1f}s')
+        return result
+
+    # ---------- helpers ----------
+
+    def batches(self, rows):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def bulk_create(self, model, objects):
+        created = []
+        for batch in self.batches(objects):
+            created.extend(model.objects.bulk_create(batch))
+        return created
+
+    def insert_rows(self, model, fields, rows):
+        """
+        Raw executemany for the high-volume tables: several times faster than
+        bulk_create, and keeps the generated created_at/timestamp values that
+        bulk_create would overwrite for auto_now_add fields. Rows carry their
+        own primary keys and values already adapted for the database.
+        """
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(field).column) for field in fields)
+        sql = (f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+               f'VALUES ({", ".join(["%s"] * len(fields))})')
+        count = 0
+        with connection.cursor() as cursor:
+            for batch in self.batches(rows):
+                cursor.executemany(sql, batch)
+                count += len(batch)
+        return count
+
+    def datetime_adapter(self):
+        """
+        Same result as connection.ops.adapt_datetimefield_value for the UTC
+        datetimes generated here, at a fraction of its per-row cost.
+        """
+        probe = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+        if isinstance(connection.ops.adapt_datetimefield_value(probe), str):
+            return lambda value: None if value is None else str(value.replace(tzinfo=None))
+        return connection.ops.adapt_datetimefield_value
+
+    def next_id(self, model):
+        return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+    def name(self):
+        return self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+
+    def phone(self):
+        return f'09{self.rng.randrange(10 ** 9):09d}'
+
+    def birthday(self, youngest, oldest):
+        return self.end - timedelta(days=self.rng.randint(youngest * 365, oldest * 365))
+
+    def create_users(self, role, count):
+        users = []
+        for i in range(count):
+            first, last = self.name()
+            username = f'{self.tag}_{role}_{i:07d}'
+            users.append(User(username=username, first_name=first, last_name=last,
+                              email=f'{username}@example.com', password=self.password))
+        return self.bulk_create(User, users)
+
+    # ---------- people and vehicles ----------
+
+    def create_students(self, count):
+        users = self.create_users('student', count)
+        return [student.pk for student in self.bulk_create(Student, (
+            Student(
+                user=user, student_id=f'{self.tag.upper()}-S{i:07d}', phone_number=self.phone(),
+                address='Naval, Biliran', date_of_birth=self.birthday(17, 25),
+                guardian_name=f'{self.rng.choice(FIRST_NAMES)} {user.last_name}', guardian_contact=self.phone(),
+                emergency_contact_name=f'{self.rng.choice(FIRST_NAMES)} {user.last_name}',
+                emergency_contact_number=self.phone(),
+            )
+            for i, user in enumerate(users)
+        ))]
+
+    def create_vehicles(self, count):
+        vehicles = []
+        for i in range(count):
+            vehicle_type = self.rng.choice(list(VEHICLE_MODELS))
+            model, capacity = VEHICLE_MODELS[vehicle_type]
+            vehicles.append(Vehicle(
+                plate_number=f'{self.tag.upper()}-{i:05d}', vehicle_type=vehicle_type, model=model,
+                color=self.rng.choice(['White', 'Silver', 'Blue', 'Red']), capacity=capacity,
+                year=self.rng.randint(2015, self.end.year),
+            ))
+        return self.bulk_create(Vehicle, vehicles)
+
+    def create_drivers(self, count, vehicles):
+        users = self.create_users('driver', count)
+        drivers = self.bulk_create(Driver, (
+            Driver(
+                user=user, driver_id=f'{self.tag.upper()}-D{i:05d}', license_number=f'{self.tag.upper()}-L{i:07d}',
+                license_expiry=self.end + timedelta(days=self.rng.randint(30, 1500)), phone_number=self.phone(),
+                address='Naval, Biliran', date_of_birth=self.birthday(25, 60),
+                emergency_contact_name=f'{self.rng.choice(FIRST_NAMES)} {user.last_name}',
+                emergency_contact_number=self.phone(), vehicle=vehicles[i % len(vehicles)], is_verified=True,
+            )
+            for i, user in enumerate(users)
+        ))
+        return [(driver.pk, driver.vehicle_id) for driver in drivers]
+
+    # ---------- network ----------
+
+    def create_places(self, count):
+        taken = set(Place.objects.values_list('key', flat=True))
+        names = set()
+        while len(names) < count:
+            name = ''.join(self.rng.choice(SYLLABLES) for _ in range(self.rng.randint(2, 4))).capitalize()
+            if Place.key_for(name) not in taken:
+                names.add(name)
+        places = [
+            Place(name=name, key=Place.key_for(name),
+                  latitude=Decimal(f'{CENTER_LAT + self.rng.uniform(-SPREAD, SPREAD):.6f}'),
+                  longitude=Decimal(f'{CENTER_LNG + self.rng.uniform(-SPREAD, SPREAD):.6f}'))
+            for name in sorted(names)
+        ]
+        return self.bulk_create(Place, places)
+
+    def create_routes(self, count, stops_per_route, departures, vehicles):
+        # Fewer places than stops, so routes share stops and allow transfers
+        places = self.create_places(max(stops_per_route, count * stops_per_route // 3))
+        routes = []
+        for i in range(count):
+            vehicle = vehicles[i % len(vehicles)]
+            route_places = self.rng.sample(places, stops_per_route)
+            routes.append(Route(
+                route_code=f'{self.tag.upper()}-R{i:04d}',
+                route_name=f'{route_places[0].name} to {route_places[-1].name}',
+                origin=route_places[0].name, destination=route_places[-1].name,
+                distance_km=Decimal(self.rng.randint(5, 40)), fare=Decimal(self.rng.choice([30, 40, 50, 60, 80, 100])),
+                estimated_duration=f'{stops_per_route * 5} minutes', route_type=self.rng.choice(['PICKUP', 'DROP', 'ROUND']),
+                vehicle=vehicle,
+            ))
+            routes[-1].places = route_places
+        routes = self.bulk_create(Route, routes)
+
+        stops = []
+        for route in routes:
+            step = route.distance_km / (stops_per_route - 1)
+            for order, place in enumerate(route.places, 1):
+                stops.append(Stop(
+                    route=route, place=place, stop_name=place.name, stop_order=order,
+                    estimated_arrival_time=dtime(6 + (order - 1) * 5 // 60, (order - 1) * 5 % 60),
+                    distance_km=(step * (order - 1)).quantize(Decimal('0.01')),
+                ))
+        self.bulk_create(Stop, stops)
+
+        schedules = []
+        for route in routes:
+            first = self.rng.randint(5 * 60, 7 * 60)
+            gap = max(30, (14 * 60) // departures)
+            duration = (stops_per_route - 1) * 5
+            for weekday in range(7):
+                for k in range(departures if weekday < 6 else max(1, departures // 2)):
+                    start = (first + k * gap) % (24 * 60)
+                    end = (start + duration) % (24 * 60)
+                    schedules.append(Schedule(route=route, weekday=weekday,
+                                              departure_time=dtime(start // 60, start % 60),
+                                              arrival_time=dtime(end // 60, end % 60)))
+        schedules = self.bulk_create(Schedule, schedules)
+
+        capacity = {vehicle.pk: vehicle.capacity for vehicle in vehicles}
+        by_route = {}
+        for schedule in schedules:
+            by_route.setdefault(schedule.route_id, []).append(schedule)
+        network = []
+        for route in routes:
+            matrix = build_fare_matrix(route)
+            segments = [
+                (pickup, dropoff, matrix.fare(pickup, dropoff))
+                for i, pickup in enumerate(matrix.stop_ids) for dropoff in matrix.stop_ids[i + 1:]
+            ]
+            network.append({
+                'route': route,
+                'segments': segments,
+                'schedules': by_route[route.pk],
+                'capacity': capacity[route.vehicle_id],
+            })
+        return network
+
+    # ---------- operations ----------
+
+    def create_trips(self, routes, drivers, days):
+        """Trips for every schedule from `days` days back to a week past --end"""
+        first_day = self.end - timedelta(days=days - 1)
+        adapt = self.datetime_adapter()
+        trips = []   # (trip id, route position, schedule, trip date, status, capacity)
+        rows = []
+        trip_id = self.next_id(Trip)
+        # The first driver of a vehicle drives its routes, as in materialize_trips
+        by_vehicle = {}
+        for driver_id, vehicle_id in drivers:
+            by_vehicle.setdefault(vehicle_id, driver_id)
+
+        for position, network in enumerate(routes):
+            route = network['route']
+            driver = by_vehicle.get(route.vehicle_id) or drivers[position % len(drivers)][0]
+            duration = (len(network['route'].places) - 1) * 5
+            for offset in range(days + 7):
+                day = first_day + timedelta(days=offset)
+                for schedule in network['schedules']:
+                    if schedule.weekday != day.weekday():
+                        continue
+                    departure = datetime.combine(day, schedule.departure_time, tzinfo=dt_timezone.utc)
+                    status, started, completed = 'SCHEDULED', None, None
+                    if day < self.end:
+                        status = 'CANCELLED' if self.rng.random() < 0.02 else 'COMPLETED'
+                        if status == 'COMPLETED':
+                            started = adapt(departure + timedelta(minutes=self.rng.randint(-2, 10)))
+                            completed = adapt(departure + timedelta(minutes=duration + self.rng.randint(0, 15)))
+                    created = adapt(departure - timedelta(days=7))
+                    rows.append((trip_id, route.pk, schedule.pk, driver, connection.ops.adapt_datefield_value(day),
+                                 status, started, completed, '', created))
+                    trips.append((trip_id, position, schedule, day, status, network['capacity']))
+                    trip_id += 1
+
+        self.insert_rows(Trip, ['id', 'route', 'schedule', 'driver', 'trip_date', 'status', 'started_at',
+                                'completed_at', 'notes', 'created_at'], rows)
+        return trips
+
+    def create_bookings(self, count, students, routes, trips):
+        if not count:
+            return 0
+        seats_left = [trip[5] for trip in trips]
+        if count * 1.3 > 0.8 * sum(seats_left):
+            raise CommandError(
+                f'{count} bookings do not fit in {sum(seats_left)} seats; raise --routes, --departures or --days'
+            )
+
+        adapt = self.datetime_adapter()
+        booking_id = self.next_id(Booking)
+        payment_id = self.next_id(Payment)
+        tag = self.tag.upper()
+        bookings, payments = [], []
+        inserted = 0
+
+        for i in range(count):
+            while True:
+                position = self.rng.randrange(len(trips))
+                seats = self.rng.choices((1, 2, 3), (80, 15, 5))[0]
+                if seats_left[position] >= seats:
+                    seats_left[position] -= seats
+                    break
+            trip_id, route_position, schedule, day, trip_status, _ = trips[position]
+            network = routes[route_position]
+            pickup, dropoff, fare = self.rng.choice(network['segments'])
+            total = (fare * seats).quantize(Decimal('0.01'))
+
+            created = datetime.combine(day, schedule.departure_time, tzinfo=dt_timezone.utc) - timedelta(
+                minutes=self.rng.randint(30, 14 * 24 * 60))
+            if trip_status == 'CANCELLED':
+                status = 'CANCELLED'
+            elif trip_status == 'COMPLETED':
+                status = 'CANCELLED' if self.rng.random() < 0.05 else 'COMPLETED'
+            else:
+                status = self.rng.choices(('CONFIRMED', 'PENDING', 'CANCELLED'), (70, 25, 5))[0]
+
+            bookings.append((
+                booking_id, f'{tag}B{i:010d}', self.rng.choice(students), network['route'].pk, schedule.pk, trip_id,
+                connection.ops.adapt_datefield_value(day), pickup, dropoff, seats, str(total), status, '',
+                adapt(created), adapt(created + timedelta(minutes=self.rng.randint(0, 600))),
+            ))
+
+            payment_status = {
+                'COMPLETED': 'COMPLETED',
+                'CONFIRMED': 'COMPLETED',
+                'PENDING': self.rng.choice(('PENDING', None)),
+                'CANCELLED': self.rng.choice(('REFUNDED', 'FAILED', None)),
+            }[status]
+            if payment_status:
+                paid = created + timedelta(minutes=self.rng.randint(1, 120))
+                payments.append((
+                    payment_id, f'{tag}P{i:010d}', booking_id, str(total), self.rng.choice(PAYMENT_METHODS),
+                    payment_status, adapt(paid) if payment_status != 'PENDING' else None,
+                    f'REF{i:012d}' if payment_status != 'PENDING' else '', adapt(created), adapt(paid),
+                ))
+                payment_id += 1
+            booking_id += 1
+
+            if len(bookings) >= self.batch_size:
+                inserted += self.flush_bookings(bookings, payments)
+                bookings, payments = [], []
+        return inserted + self.flush_bookings(bookings, payments)
+
+    def flush_bookings(self, bookings, payments):
+        count = self.insert_rows(Booking, [
+            'id', 'booking_id', 'student', 'route', 'schedule', 'trip', 'booking_date', 'pickup_stop', 'dropoff_stop',
+            'seats_booked', 'total_fare', 'status', 'notes', 'created_at', 'updated_at',
+        ], bookings)
+        self.insert_rows(Payment, [
+            'id', 'payment_id', 'booking', 'amount', 'payment_method', 'payment_status', 'payment_date',
+            'transaction_reference', 'created_at', 'updated_at',
+        ], payments)
+        return count
+
+    def create_fixes(self, count, vehicles, days):
+        """A random walk per vehicle, fixes evenly spaced over the history window"""
+        if not count:
+            return 0
+        per_vehicle = math.ceil(count / len(vehicles))
+        window = days * 24 * 60 * 60
+        interval = max(5, window // per_vehicle)
+        end = datetime.combine(self.end, dtime(23, 59, 59), tzinfo=dt_timezone.utc)
+        adapt = self.datetime_adapter()
+        rng = self.rng
+
+        def rows():
+            fix_id = self.next_id(VehicleLocation)
+            remaining = count
+            for vehicle in vehicles:
+                latitude = CENTER_LAT + rng.uniform(-SPREAD, SPREAD)
+                longitude = CENTER_LNG + rng.uniform(-SPREAD, SPREAD)
+                heading = rng.uniform(0, 360)
+                timestamp = end - timedelta(seconds=interval * per_vehicle)
+                step = timedelta(seconds=interval)
+                for _ in range(min(per_vehicle, remaining)):
+                    heading = (heading + rng.uniform(-20, 20)) % 360
+                    speed = rng.uniform(0, 60)
+                    distance = speed * interval / 3600 / 111.32
+                    latitude = min(max(latitude + distance * math.cos(math.radians(heading)), CENTER_LAT - SPREAD),
+                                   CENTER_LAT + SPREAD)
+                    longitude = min(max(longitude + distance * math.sin(math.radians(heading)), CENTER_LNG - SPREAD),
+                                    CENTER_LNG + SPREAD)
+                    timestamp += step
+                    yield (fix_id, vehicle.pk, round(latitude, 6), round(longitude, 6), round(speed, 2),
+                           round(heading, 2), adapt(timestamp))
+                    fix_id += 1
+                remaining -= per_vehicle
+                if remaining <= 0:
+                    return
+
+        return self.insert_rows(VehicleLocation, ['id', 'vehicle', 'latitude', 'longitude', 'speed', 'heading',
+                                                  'timestamp'], rows())
@@ -0,0 +1,33 @@
+# myapp/management/commands/import_gtfs.py
+
+import time
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.gtfs import FeedError, import_feed
+
+
+class Command(BaseCommand):
+    help = ('Imports routes, stops, schedules and vehicles from a GTFS zip in one transaction, '
+            'updating what already exists')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='GTFS zip file')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert or update')
+        parser.add_argument('--vehicle', help='Plate number of the vehicle for routes without a vehicle_plate column')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            counts = import_feed(options['path'], batch_size=options['batch_size'], default_vehicle=options['vehicle'])
+        except (FeedError, KeyError, ValueError, zipfile.BadZipFile) as error:
+            if isinstance(error, KeyError):
+                error = f'missing column {error}'
+            raise CommandError(f'Import failed, nothing was changed: {error}')
+
+        for name, count in counts.items():
+            self.stdout.write(f'  {name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Imported {options["path"]} in {time.perf_counter() - started:.2f}s'
+        ))
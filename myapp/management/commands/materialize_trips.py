@@ -0,0 +1,54 @@
+# myapp/management/commands/materialize_trips.py
+
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.models import Driver, Schedule, Trip
+from myapp.service_calendar import running_schedule_ids_on
+
+
+class Command(BaseCommand):
+    help = 'Creates Trip rows for every schedule that runs in the coming days, per the service calendar'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Number of days to materialize')
+        parser.add_argument('--start', help='First date (YYYY-MM-DD), defaults to today')
+
+    def handle(self, *args, **options):
+        try:
+            start = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else date.today()
+        except ValueError:
+            raise CommandError('--start must be a date in YYYY-MM-DD format')
+
+        schedules = {
+            schedule.id: schedule
+            for schedule in Schedule.objects.filter(is_active=True, route__is_active=True).select_related('route')
+        }
+
+        # The driver assigned to a route's vehicle drives its trips
+        drivers = {}
+        for driver in Driver.objects.filter(is_active=True, vehicle__isnull=False).order_by('-is_verified', 'id'):
+            drivers.setdefault(driver.vehicle_id, driver)
+
+        trips = []
+        skipped = 0
+        days = [start + timedelta(days=offset) for offset in range(options['days'])]
+        for day, running in running_schedule_ids_on(days).items():
+            for schedule_id in running:
+                schedule = schedules.get(schedule_id)
+                if schedule is None:
+                    continue
+                driver = drivers.get(schedule.route.vehicle_id)
+                if driver is None:
+                    skipped += 1
+                    continue
+                trips.append(Trip(route=schedule.route, schedule=schedule, driver=driver, trip_date=day))
+
+        # Existing trips are left alone thanks to the (route, schedule, trip_date) unique constraint
+        Trip.objects.bulk_create(trips, batch_size=500, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Materialized trips for {options["days"]} day(s) from {start}: '
+            f'{len(trips)} scheduled departures, {skipped} skipped for lack of a driver'
+        ))
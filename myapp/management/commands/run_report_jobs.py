@@ -0,0 +1,28 @@
+# myapp/management/commands/run_report_jobs.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.report_jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = ('Runs queued report jobs. Start it as a worker next to the web processes, or from cron with '
+            '--once')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the jobs queued now and exit')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls of the queue')
+
+    def handle(self, *args, **options):
+        while True:
+            for job in run_pending():
+                duration = (job.finished_at - job.started_at).total_seconds()
+                if job.status == 'DONE':
+                    self.stdout.write(self.style.SUCCESS(f'✓ {job} in {duration:.1f}s'))
+                else:
+                    self.stderr.write(self.style.ERROR(f'✗ {job} after {duration:.1f}s\n{job.error}'))
+            if options['once']:
+                return
+            time.sleep(options['interval'])
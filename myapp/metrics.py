@@ -0,0 +1,335 @@
+# metrics.py
+"""
+Prometheus metrics shared by every process on the host.
+
+Each process (gunicorn worker, management command) keeps its samples in its
+own memory-mapped file under METRICS_DIR. Recording a sample is a dict
+lookup and an in-place float update in that file: no lock, no system call,
+nothing shared with the other workers. Adding a new series appends to the
+file under a lock, which happens once per series. The /metrics view reads
+every file in the directory and adds them up.
+
+An update is a read and a write, so two threads updating one file could lose
+an increment. Each thread therefore records into a file of its own: the
+first into `<pid>.db`, any others running alongside it into `<pid>-<n>.db`.
+A thread that ends hands its file to the next thread that needs one, so a
+process has as many files as it ever had recording threads at once.
+
+Files are never reset, so totals only go up; a process that gets the pid of
+an earlier one carries on from its file. When a scrape finds files of
+processes that have exited (recycled workers, management commands, test
+runs), it adds them into a single archive file and deletes them, so the
+directory holds one file per live process plus the archive. Only counters
+and histograms are kept, since they can be added across processes.
+
+File layout: the bytes in use (uint64), then per series the length of its
+name (uint32), the name (the sample as written in the exposition format,
+e.g. `sakay_trip_transitions_total{status="COMPLETED"}`) padded to 8 bytes,
+and its value (float64, 8-byte aligned). A series is written before the
+length in use covers it, so readers never see half of one.
+"""
+import fcntl
+import itertools
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+
+# A module import, as instrumentation imports this module in turn
+from . import instrumentation
+
+# name -> (type, help)
+METRICS = {
+    'sakay_gps_fixes_total': ('counter', 'GPS fixes ingested.'),
+    'sakay_bookings_created_total': ('counter', 'Bookings created.'),
+    'sakay_bookings_cancelled_total': ('counter', 'Bookings cancelled.'),
+    'sakay_trip_transitions_total': ('counter', 'Trips moved to another status, by the status entered.'),
+    'sakay_http_request_duration_seconds': ('histogram', 'Request latency by URL name.'),
+    'sakay_db_connections_opened_total': ('counter', 'Database connections opened.'),
+    'sakay_db_connection_reuses_total': ('counter', 'Requests that found a database connection already open.'),
+}
+
+INITIAL_SIZE = 256 * 1024
+# Totals of the processes that have exited; merges into it hold LOCK_FILE
+ARCHIVE_FILE = 'archive.db'
+LOCK_FILE = 'archive.lock'
+HEADER = struct.Struct('Q')
+LENGTH = struct.Struct('I')
+VALUE = struct.Struct('d')
+
+
+def sample_name(name, labels=()):
+    """`name{label="value",...}` with the label values escaped"""
+    if not labels:
+        return name
+    pairs = ','.join('{}="{}"'.format(label, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+                     for label, value in labels)
+    return f'{name}{{{pairs}}}'
+
+
+class ProcessFile:
+    """One process's samples, in a memory-mapped file"""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < INITIAL_SIZE:
+            self._file.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._values = memoryview(self._map).cast('d')
+        # Values are 8-byte aligned, so a series is known by its index in _values
+        self._indexes = {name: offset // VALUE.size for name, offset, _ in read_entries(self._map)}
+        self._used = max(HEADER.unpack_from(self._map)[0], HEADER.size)
+
+    def add(self, name, amount):
+        index = self._indexes.get(name)
+        if index is None:
+            index = self._append(name)
+        self._values[index] += amount
+
+    def _append(self, name):
+        with self._lock:
+            index = self._indexes.get(name)
+            if index is not None:
+                return index
+            encoded = name.encode()
+            padded = LENGTH.size + len(encoded) + (-(LENGTH.size + len(encoded)) % 8)
+            end = self._used + padded + VALUE.size
+            if end > len(self._map):
+                size = len(self._map)
+                while size < end:
+                    size *= 2
+                self._file.truncate(size)
+                self._values.release()
+                self._map.close()
+                self._map = mmap.mmap(self._file.fileno(), size)
+                self._values = memoryview(self._map).cast('d')
+            LENGTH.pack_into(self._map, self._used, len(encoded))
+            self._map[self._used + LENGTH.size:self._used + LENGTH.size + len(encoded)] = encoded
+            offset = self._used + padded
+            VALUE.pack_into(self._map, offset, 0.0)
+            HEADER.pack_into(self._map, 0, end)
+            self._used = end
+            self._indexes[name] = offset // VALUE.size
+            return self._indexes[name]
+
+    def close(self):
+        self._values.release()
+        self._map.close()
+        self._file.close()
+
+
+def read_entries(data):
+    """(name, offset of the value, value) of each series in a process file's contents"""
+    used = HEADER.unpack_from(data)[0] if len(data) >= HEADER.size else 0
+    position = HEADER.size
+    while position < used:
+        length = LENGTH.unpack_from(data, position)[0]
+        name = bytes(data[position + LENGTH.size:position + LENGTH.size + length]).decode()
+        offset = position + LENGTH.size + length + (-(LENGTH.size + length) % 8)
+        yield name, offset, VALUE.unpack_from(data, offset)[0]
+        position = offset + VALUE.size
+
+
+# (histogram, labels) -> names of its bucket, sum and count samples
+_buckets = {}
+_thread = threading.local()
+# Files of threads that have ended, for the next thread to take; list.append and pop are atomic
+_free_files = []
+_file_numbers = itertools.count()
+# Bumped by reset(), which orphans every file taken before
+_generation = 0
+
+
+class _Claim:
+    """A thread's hold on one of the process's files, handed back when the thread ends and drops it"""
+    __slots__ = ('file', 'generation')
+
+    def __init__(self, process_file):
+        self.file = process_file
+        self.generation = _generation
+
+    def __del__(self):
+        if self.generation == _generation:
+            _free_files.append(self.file)
+
+
+def _file():
+    claim = getattr(_thread, 'claim', None)
+    if claim is None or claim.generation != _generation:
+        try:
+            process_file = _free_files.pop()
+        except IndexError:
+            number = next(_file_numbers)
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            filename = f'{os.getpid()}.db' if number == 0 else f'{os.getpid()}-{number}.db'
+            process_file = ProcessFile(os.path.join(settings.METRICS_DIR, filename))
+        claim = _thread.claim = _Claim(process_file)
+    return claim.file
+
+
+def reset():
+    """Forget this process's files, so the next sample opens one under the current METRICS_DIR"""
+    global _generation, _file_numbers
+    _generation += 1
+    _free_files.clear()
+    _file_numbers = itertools.count()
+    _buckets.clear()
+
+
+# A forked worker must not write to its parent's files
+os.register_at_fork(after_in_child=reset)
+
+
+def inc(name, amount=1, **labels):
+    """Add to a counter"""
+    _file().add(sample_name(name, sorted(labels.items())), amount)
+
+
+def observe(name, value, **labels):
+    """
+    Record a value in a histogram, with instrumentation.LATENCY_BUCKETS as
+    its buckets. The files hold the count of each bucket alone; exposition()
+    makes them cumulative.
+    """
+    labels = tuple(sorted(labels.items()))
+    store = _file()
+    names = _buckets.get((name, labels))
+    if names is None:
+        bounds = [str(bound) for bound in instrumentation.LATENCY_BUCKETS] + ['+Inf']
+        names = _buckets[name, labels] = (
+            [sample_name(f'{name}_bucket', labels + (('le', bound),)) for bound in bounds],
+            sample_name(f'{name}_sum', labels),
+            sample_name(f'{name}_count', labels),
+        )
+        # Every bucket is exposed, including the ones nothing has fallen in yet
+        for bucket in names[0]:
+            store.add(bucket, 0)
+    buckets, total, count = names
+    store.add(buckets[bisect_left(instrumentation.LATENCY_BUCKETS, value)], 1)
+    store.add(total, value)
+    store.add(count, 1)
+
+
+def collect():
+    """{sample name: value} added up over every process file in METRICS_DIR"""
+    totals = {}
+    try:
+        filenames = [filename for filename in os.listdir(settings.METRICS_DIR) if filename.endswith('.db')]
+    except FileNotFoundError:
+        return totals
+    if any(not _alive(pid) for pid in map(_pid_of, filenames) if pid is not None):
+        archive_dead(settings.METRICS_DIR)
+        filenames = [filename for filename in os.listdir(settings.METRICS_DIR) if filename.endswith('.db')]
+    for filename in filenames:
+        data = _read(os.path.join(settings.METRICS_DIR, filename))
+        for name, _, value in read_entries(data):
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def archive_dead(directory):
+    """
+    Add the files of processes that have exited into the archive file and
+    delete them. The new archive replaces the old one in a single rename, so
+    a scrape running alongside sees either, never half of it.
+    """
+    with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # Listed under the lock, as another scrape may have just archived some of them
+        dead = [filename for filename in os.listdir(directory)
+                if filename.endswith('.db') and (pid := _pid_of(filename)) is not None and not _alive(pid)]
+        if not dead:
+            return
+        totals = {}
+        for filename in [ARCHIVE_FILE] + dead:
+            for name, _, value in read_entries(_read(os.path.join(directory, filename))):
+                totals[name] = totals.get(name, 0) + value
+        staging = os.path.join(directory, ARCHIVE_FILE + '.new')
+        if os.path.exists(staging):
+            os.remove(staging)
+        archive = ProcessFile(staging)
+        for name, value in totals.items():
+            archive.add(name, value)
+        archive.close()
+        os.replace(staging, os.path.join(directory, ARCHIVE_FILE))
+        for filename in dead:
+            os.remove(os.path.join(directory, filename))
+
+
+def _pid_of(filename):
+    """The pid whose samples a file holds, or None for the archive"""
+    stem = filename[:-len('.db')].partition('-')[0]
+    return int(stem) if stem.isdigit() else None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as process_file:
+            return process_file.read()
+    except FileNotFoundError:
+        return b''
+
+
+def exposition():
+    """Every metric in the Prometheus text format"""
+    samples = collect()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        own = sorted((sample for sample in samples
+                      if sample.partition('{')[0] in ((name,) if kind == 'counter' else
+                                                      (f'{name}_bucket', f'{name}_sum', f'{name}_count'))),
+                     key=_sort_key)
+        if kind == 'counter' and not own:
+            lines.append(f'{name} 0')
+        below = {}
+        for sample in own:
+            value = samples[sample]
+            if kind == 'histogram' and sample.startswith(f'{name}_bucket'):
+                series = _sort_key(sample)[0]
+                value = below[series] = below.get(series, 0) + value
+            lines.append(f'{sample} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _sort_key(sample):
+    """Series by their labels, then a histogram's buckets in ascending order before its sum and count"""
+    name, _, labels = sample.partition('{')
+    labels = labels.rstrip('}')
+    bound = 0.0
+    if labels.startswith('le="') or ',le="' in labels:
+        start = labels.rfind('le="')
+        value = labels[start + 4:-1]
+        bound = float('inf') if value == '+Inf' else float(value)
+        labels = labels[:start].rstrip(',')
+    part = 1 if name.endswith('_sum') else 2 if name.endswith('_count') else 0
+    return labels, part, bound
+
+
+def _number(value):
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def inc_on_commit(name, amount=1, **labels):
+    """Add to a counter once the current transaction commits, so rolled-back changes are not counted"""
+    if amount:
+        transaction.on_commit(lambda: inc(name, amount, **labels))
+
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_driver_license_photo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stop',
+            name='distance_km',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Distance from the route origin, used for segment fares', max_digits=6, null=True),
+        ),
+    ]
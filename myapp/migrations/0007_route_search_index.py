@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# The index as of this migration, written out so later changes to myapp/search.py do not alter it
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS myapp_route_fts USING fts5("
+    "route_name, origin, destination, stop_names, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO myapp_route_fts (rowid, route_name, origin, destination, stop_names) "
+    "SELECT r.id, r.route_name, r.origin, r.destination, "
+    "(SELECT group_concat(s.stop_name, ' ') FROM myapp_stop s WHERE s.route_id = r.id) "
+    "FROM myapp_route r WHERE r.is_active",
+]
+SQLITE_DROP = ["DROP TABLE IF EXISTS myapp_route_fts"]
+
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE TABLE IF NOT EXISTS myapp_route_search ("
+    "route_id bigint PRIMARY KEY REFERENCES myapp_route (id) ON DELETE CASCADE, "
+    "document tsvector NOT NULL, "
+    "names text NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS myapp_route_search_document ON myapp_route_search USING gin (document)",
+    "CREATE INDEX IF NOT EXISTS myapp_route_search_names ON myapp_route_search USING gin (names gin_trgm_ops)",
+    "INSERT INTO myapp_route_search (route_id, document, names) "
+    "SELECT r.id, "
+    "setweight(to_tsvector('simple', r.route_name), 'A') || "
+    "setweight(to_tsvector('simple', r.origin || ' ' || r.destination), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(st.stop_names, '')), 'C'), "
+    "lower(concat_ws(' ', r.route_name, r.origin, r.destination, st.stop_names)) "
+    "FROM myapp_route r "
+    "LEFT JOIN LATERAL (SELECT string_agg(s.stop_name, ' ') AS stop_names "
+    "FROM myapp_stop s WHERE s.route_id = r.id) st ON true "
+    "WHERE r.is_active "
+    "ON CONFLICT (route_id) DO UPDATE SET document = EXCLUDED.document, names = EXCLUDED.names",
+]
+POSTGRES_DROP = ["DROP TABLE IF EXISTS myapp_route_search"]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_stop_distance_km'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}),
+            run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_route_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['start_date', 'name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='calendar',
+            field=models.ForeignKey(blank=True, help_text='Leave empty to run every week', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='schedules', to='myapp.servicecalendar'),
+        ),
+        migrations.CreateModel(
+            name='ServiceException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('exception_type', models.CharField(choices=[('ADDED', 'Service added'), ('REMOVED', 'Service removed')], max_length=10)),
+                ('service_day', models.CharField(blank=True, choices=[('MONDAY', 'Monday'), ('TUESDAY', 'Tuesday'), ('WEDNESDAY', 'Wednesday'), ('THURSDAY', 'Thursday'), ('FRIDAY', 'Friday'), ('SATURDAY', 'Saturday'), ('SUNDAY', 'Sunday')], help_text="For added service: run this weekday's timetable (defaults to the date's own weekday)", max_length=20)),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('calendar', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='myapp.servicecalendar')),
+            ],
+            options={
+                'ordering': ['date'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='serviceexception',
+            constraint=models.UniqueConstraint(condition=models.Q(('calendar__isnull', False)), fields=('calendar', 'date'), name='service_exception_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='serviceexception',
+            constraint=models.UniqueConstraint(condition=models.Q(('calendar__isnull', True)), fields=('date',), name='service_exception_key_no_calendar'),
+        ),
+    ]
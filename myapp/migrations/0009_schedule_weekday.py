@@ -0,0 +1,73 @@
+from django.db import migrations, models
+
+DAY_PREFIXES = ['MON', 'TUE', 'WED', 'THU', 'FRI', 'SAT', 'SUN']
+
+
+def day_names_to_weekdays(apps, schema_editor):
+    Schedule = apps.get_model('myapp', 'Schedule')
+    ServiceException = apps.get_model('myapp', 'ServiceException')
+    for prefix, weekday in zip(DAY_PREFIXES, range(7)):
+        Schedule.objects.filter(day_of_week__istartswith=prefix).update(weekday=weekday)
+        ServiceException.objects.filter(service_day__istartswith=prefix).update(service_weekday=weekday)
+    unknown = list(Schedule.objects.filter(weekday__isnull=True).values_list('id', 'day_of_week'))
+    if unknown:
+        raise ValueError(f'Schedules with unrecognised day_of_week: {unknown}')
+
+
+def weekdays_to_day_names(apps, schema_editor):
+    Schedule = apps.get_model('myapp', 'Schedule')
+    ServiceException = apps.get_model('myapp', 'ServiceException')
+    names = ['MONDAY', 'TUESDAY', 'WEDNESDAY', 'THURSDAY', 'FRIDAY', 'SATURDAY', 'SUNDAY']
+    for weekday, name in enumerate(names):
+        Schedule.objects.filter(weekday=weekday).update(day_of_week=name)
+        ServiceException.objects.filter(service_weekday=weekday).update(service_day=name)
+
+
+WEEKDAY_CHOICES = [(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_service_calendar'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='weekday',
+            field=models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, null=True),
+        ),
+        migrations.AddField(
+            model_name='serviceexception',
+            name='service_weekday',
+            field=models.PositiveSmallIntegerField(blank=True, choices=WEEKDAY_CHOICES, help_text="For added service: run this weekday's timetable (defaults to the date's own weekday)", null=True),
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='day_of_week',
+            field=models.CharField(max_length=20, blank=True),
+        ),
+        migrations.RunPython(day_names_to_weekdays, weekdays_to_day_names),
+        migrations.AlterModelOptions(
+            name='schedule',
+            options={'ordering': ['route', 'weekday', 'departure_time']},
+        ),
+        migrations.RemoveField(
+            model_name='schedule',
+            name='day_of_week',
+        ),
+        migrations.RemoveField(
+            model_name='serviceexception',
+            name='service_day',
+        ),
+        migrations.AlterField(
+            model_name='schedule',
+            name='weekday',
+            field=models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, help_text='Same numbering as date.weekday()'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['route', 'weekday', 'departure_time'], name='schedule_route_weekday_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Spellings of the same place used by the seed commands: populate_biliran_routes
+# names the Almeria circuit's barangays without the town, add_biliran_routes
+# calls the town proper Poblacion. Mapped to the name the merged place keeps.
+# Stop.match_place folds new stops with models.PLACE_ALIASES, the same table;
+# this copy stays so the migration does not change with the models.
+SEEDED_ALIASES = {
+    'Back to Town Center': 'Almeria Town Center',
+    'Poblacion, Almeria': 'Almeria Town Center',
+    'Poblacion, Kawayan': 'Kawayan Town Proper',
+    'Caucab': 'Caucab, Almeria',
+    'Iyosan': 'Iyosan, Almeria',
+    'Jamorawon': 'Jamorawon, Almeria',
+    'Lo-ok': 'Lo-ok, Almeria',
+    'Matanga': 'Matanga, Almeria',
+    'Pili': 'Pili, Almeria',
+    'Salangi': 'Salangi, Almeria',
+    'Tamarindo': 'Tamarindo, Almeria',
+}
+
+
+def normalise(name):
+    return ' '.join(name.casefold().split())
+
+
+def link_stops_to_places(apps, schema_editor):
+    """One Place per distinct stop name, after merging known seeded spellings"""
+    Place = apps.get_model('myapp', 'Place')
+    Stop = apps.get_model('myapp', 'Stop')
+    aliases = {normalise(alias): name for alias, name in SEEDED_ALIASES.items()}
+
+    places = {}
+    for stop in Stop.objects.order_by('id'):
+        name = aliases.get(normalise(stop.stop_name), stop.stop_name.strip())
+        key = normalise(name)
+        place = places.get(key)
+        if place is None:
+            place = places[key] = Place.objects.create(name=name, key=key)
+        stop.place = place
+        stop.save(update_fields=['place'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_schedule_weekday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Place',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key', models.CharField(editable=False, help_text='Normalised name, used to match stop names to places', max_length=200, unique=True)),
+                ('latitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('longitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='stop',
+            name='place',
+            field=models.ForeignKey(blank=True, help_text='Left empty, it is matched from the stop name', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='stops', to='myapp.place'),
+        ),
+        migrations.RunPython(link_stops_to_places, migrations.RunPython.noop),
+    ]
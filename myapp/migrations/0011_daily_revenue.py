@@ -0,0 +1,59 @@
+# Generated by Django 5.0.14 on 2026-10-19 06:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_daily_revenue(apps, schema_editor):
+    """Same rows as myapp.revenue.rebuild(), from the historical models"""
+    Booking = apps.get_model('myapp', 'Booking')
+    DailyRevenue = apps.get_model('myapp', 'DailyRevenue')
+    rows = Booking.objects.order_by().values(
+        'booking_date', 'route_id', 'trip__driver_id', 'route__vehicle__vehicle_type', 'status'
+    ).annotate(count=Count('pk'), seats=Sum('seats_booked'), revenue=Sum('total_fare'))
+    DailyRevenue.objects.bulk_create([
+        DailyRevenue(
+            date=row['booking_date'], route_id=row['route_id'], driver_id=row['trip__driver_id'],
+            vehicle_type=row['route__vehicle__vehicle_type'], status=row['status'],
+            bookings=row['count'], seats=row['seats'], revenue=row['revenue'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_place_registry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('vehicle_type', models.CharField(choices=[('VAN', 'Van'), ('BUS', 'Bus'), ('JEEPNEY', 'Jeepney'), ('COASTER', 'Coaster')], max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('CANCELLED', 'Cancelled'), ('COMPLETED', 'Completed')], max_length=20)),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('seats', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('driver', models.ForeignKey(blank=True, help_text='Driver of the booked trip, empty for bookings not yet on a trip', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myapp.driver')),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myapp.route')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily revenue',
+                'ordering': ['-date', 'route'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenue',
+            constraint=models.UniqueConstraint(condition=models.Q(('driver__isnull', False)), fields=('date', 'route', 'driver', 'vehicle_type', 'status'), name='daily_revenue_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenue',
+            constraint=models.UniqueConstraint(condition=models.Q(('driver__isnull', True)), fields=('date', 'route', 'vehicle_type', 'status'), name='daily_revenue_key_no_driver'),
+        ),
+        migrations.RunPython(backfill_daily_revenue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.14 on 2026-10-19 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_daily_revenue'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created_at'], name='payment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['trip_date'], name='trip_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehiclelocation',
+            index=models.Index(fields=['timestamp'], name='location_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.0.14 on 2026-10-19 07:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractHour, TruncMonth
+
+
+def backfill_report_cube(apps, schema_editor):
+    """Same cells as myapp.cube.rebuild(), from the historical models"""
+    Booking = apps.get_model('myapp', 'Booking')
+    ReportCell = apps.get_model('myapp', 'ReportCell')
+    ReportMonth = apps.get_model('myapp', 'ReportMonth')
+    not_cancelled = ~Q(status='CANCELLED')
+    cells = Booking.objects.order_by().values(
+        'route_id',
+        month=TruncMonth('booking_date'),
+        vehicle_type=F('route__vehicle__vehicle_type'),
+        hour=ExtractHour('schedule__departure_time'),
+    ).annotate(
+        bookings=Count('pk', filter=not_cancelled),
+        seats=Sum('seats_booked', filter=not_cancelled, default=0),
+        revenue=Sum('total_fare', filter=Q(status='COMPLETED'), default=0),
+        cancellations=Count('pk', filter=Q(status='CANCELLED')),
+    )
+    now = django.utils.timezone.now()
+    created = ReportCell.objects.bulk_create([ReportCell(**cell) for cell in cells], batch_size=1000)
+    ReportMonth.objects.bulk_create([
+        ReportMonth(month=month, is_dirty=False, built_at=now)
+        for month in {cell.month for cell in created}
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_booking_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month', unique=True)),
+                ('is_dirty', models.BooleanField(default=True)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReportCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('vehicle_type', models.CharField(choices=[('VAN', 'Van'), ('BUS', 'Bus'), ('JEEPNEY', 'Jeepney'), ('COASTER', 'Coaster')], max_length=20)),
+                ('hour', models.PositiveSmallIntegerField(help_text='Hour of the schedule departure, 0-23')),
+                ('bookings', models.PositiveIntegerField(default=0, help_text='Bookings not cancelled')),
+                ('seats', models.PositiveIntegerField(default=0, help_text='Seats of the bookings not cancelled')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, help_text='Fares of completed bookings', max_digits=12)),
+                ('cancellations', models.PositiveIntegerField(default=0)),
+                ('route', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myapp.route')),
+            ],
+            options={
+                'ordering': ['-month', 'route', 'hour'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reportcell',
+            constraint=models.UniqueConstraint(fields=('month', 'route', 'vehicle_type', 'hour'), name='report_cell_key'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['booking_date'], name='booking_date_idx'),
+        ),
+        migrations.RunPython(backfill_report_cube, migrations.RunPython.noop),
+    ]
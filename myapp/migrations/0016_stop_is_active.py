@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-19 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_report_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stop',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text='Inactive stops keep their bookings but are no longer served'),
+        ),
+    ]
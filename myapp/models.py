@@ -1,9 +1,12 @@
 # models.py
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
 
+from . import metrics
+
 class Vehicle(models.Model):
     VEHICLE_TYPE_CHOICES = [
         ('VAN', 'Van'),
@@ -95,11 +98,70 @@ class Route(models.Model):
     def __str__(self):
         return f"{self.route_code} - {self.route_name}"
 
+# Spellings of one place used by the seed commands, by their Place.key_for:
+# populate_biliran_routes names the Almeria circuit's barangays without the
+# town, add_biliran_routes calls the town proper Poblacion. Mapped to the name
+# the place goes by.
+PLACE_ALIASES = {
+    'back to town center': 'Almeria Town Center',
+    'poblacion, almeria': 'Almeria Town Center',
+    'poblacion, kawayan': 'Kawayan Town Proper',
+    'caucab': 'Caucab, Almeria',
+    'iyosan': 'Iyosan, Almeria',
+    'jamorawon': 'Jamorawon, Almeria',
+    'lo-ok': 'Lo-ok, Almeria',
+    'matanga': 'Matanga, Almeria',
+    'pili': 'Pili, Almeria',
+    'salangi': 'Salangi, Almeria',
+    'tamarindo': 'Tamarindo, Almeria',
+}
+
+class Place(models.Model):
+    """A physical stop location shared by every route that serves it"""
+    name = models.CharField(max_length=200)
+    key = models.CharField(max_length=200, unique=True, editable=False,
+                           help_text='Normalised name, used to match stop names to places')
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    @staticmethod
+    def key_for(name):
+        """Names that differ only in case or spacing are the same place"""
+        return ' '.join(name.casefold().split())
+    
+    def clean(self):
+        """A rename onto another place's name would break the unique key; merge the stops instead"""
+        super().clean()
+        if self.name and Place.objects.filter(key=self.key_for(self.name)).exclude(pk=self.pk).exists():
+            raise ValidationError({'name': 'Another place already has this name. Move its stops here instead.'})
+    
+    def save(self, *args, **kwargs):
+        self.key = self.key_for(self.name)
+        super().save(*args, **kwargs)
+    
+    @property
+    def has_coordinates(self):
+        return self.latitude is not None and self.longitude is not None
+
 class Stop(models.Model):
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='stops')
+    place = models.ForeignKey(Place, on_delete=models.PROTECT, null=True, blank=True, related_name='stops',
+                              help_text='Left empty, it is matched from the stop name')
     stop_name = models.CharField(max_length=200)
     stop_order = models.IntegerField()
     estimated_arrival_time = models.TimeField()
+    distance_km = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True,
+                                      help_text='Distance from the route origin, used for segment fares')
+    is_active = models.BooleanField(default=True,
+                                    help_text='Inactive stops keep their bookings but are no longer served')
     
     class Meta:
         ordering = ['route', 'stop_order']
@@ -107,29 +169,122 @@ class Stop(models.Model):
     
     def __str__(self):
         return f"{self.route.route_code} - Stop {self.stop_order}: {self.stop_name}"
+    
+    def save(self, *args, **kwargs):
+        if self.place_id is None and self.stop_name:
+            self.place = self.match_place(self.stop_name)
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def match_place(cls, stop_name):
+        """
+        Place for a stop name: the place other stops with this name already
+        use (which keeps merged spellings together), else the place with the
+        same normalised name, or that of a known alias, created if needed.
+        """
+        linked = cls.objects.filter(stop_name=stop_name, place__isnull=False).values_list('place', flat=True).first()
+        if linked is not None:
+            return Place.objects.get(pk=linked)
+        name = PLACE_ALIASES.get(Place.key_for(stop_name), stop_name.strip())
+        place, _ = Place.objects.get_or_create(key=Place.key_for(name), defaults={'name': name})
+        return place
+
+class ServiceCalendar(models.Model):
+    """Date range during which the schedules attached to it run"""
+    name = models.CharField(max_length=100, unique=True)
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    
+    class Meta:
+        ordering = ['start_date', 'name']
+    
+    def __str__(self):
+        return self.name
+    
+    def covers(self, day):
+        return self.is_active and self.start_date <= day and (self.end_date is None or day <= self.end_date)
 
 class Schedule(models.Model):
-    DAY_CHOICES = [
-        ('MONDAY', 'Monday'),
-        ('TUESDAY', 'Tuesday'),
-        ('WEDNESDAY', 'Wednesday'),
-        ('THURSDAY', 'Thursday'),
-        ('FRIDAY', 'Friday'),
-        ('SATURDAY', 'Saturday'),
-        ('SUNDAY', 'Sunday'),
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
     ]
+    # Legacy names, still accepted through the day_of_week property
+    DAY_NAMES = ['MONDAY', 'TUESDAY', 'WEDNESDAY', 'THURSDAY', 'FRIDAY', 'SATURDAY', 'SUNDAY']
     
     route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='schedules')
-    day_of_week = models.CharField(max_length=20, choices=DAY_CHOICES)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES, help_text='Same numbering as date.weekday()')
     departure_time = models.TimeField()
     arrival_time = models.TimeField()
+    calendar = models.ForeignKey(ServiceCalendar, on_delete=models.SET_NULL, null=True, blank=True, related_name='schedules',
+                                 help_text='Leave empty to run every week')
     is_active = models.BooleanField(default=True)
     
     class Meta:
-        ordering = ['route', 'day_of_week', 'departure_time']
+        ordering = ['route', 'weekday', 'departure_time']
+        indexes = [
+            models.Index(fields=['route', 'weekday', 'departure_time'], name='schedule_route_weekday_idx'),
+        ]
     
     def __str__(self):
         return f"{self.route.route_code} - {self.day_of_week} {self.departure_time}"
+    
+    @classmethod
+    def parse_weekday(cls, value):
+        """Weekday number for 0-6, 'MONDAY' or 'MON'"""
+        if isinstance(value, int):
+            return value
+        return [name[:3] for name in cls.DAY_NAMES].index(str(value).strip().upper()[:3])
+    
+    @property
+    def day_of_week(self):
+        return self.DAY_NAMES[self.weekday] if self.weekday is not None else None
+    
+    @day_of_week.setter
+    def day_of_week(self, value):
+        self.weekday = self.parse_weekday(value)
+    
+    def get_day_of_week_display(self):
+        return self.get_weekday_display()
+
+class ServiceException(models.Model):
+    """
+    A date on which service differs from the regular timetable. Exceptions
+    without a calendar apply to the whole network (e.g. holidays); an
+    exception for a calendar takes precedence over a network-wide one.
+    """
+    EXCEPTION_CHOICES = [
+        ('ADDED', 'Service added'),
+        ('REMOVED', 'Service removed'),
+    ]
+    
+    calendar = models.ForeignKey(ServiceCalendar, on_delete=models.CASCADE, null=True, blank=True, related_name='exceptions')
+    date = models.DateField()
+    exception_type = models.CharField(max_length=10, choices=EXCEPTION_CHOICES)
+    service_weekday = models.PositiveSmallIntegerField(choices=Schedule.WEEKDAY_CHOICES, null=True, blank=True,
+                                                       help_text='For added service: run this weekday\'s timetable (defaults to the date\'s own weekday)')
+    description = models.CharField(max_length=200, blank=True)
+    
+    class Meta:
+        ordering = ['date']
+        # A nullable column never clashes in a plain unique constraint, so
+        # network-wide exceptions (no calendar) get their own key on date
+        constraints = [
+            models.UniqueConstraint(fields=['calendar', 'date'], condition=models.Q(calendar__isnull=False),
+                                    name='service_exception_key'),
+            models.UniqueConstraint(fields=['date'], condition=models.Q(calendar__isnull=True),
+                                    name='service_exception_key_no_calendar'),
+        ]
+    
+    def __str__(self):
+        scope = self.calendar.name if self.calendar_id else 'All routes'
+        return f"{self.date} - {self.get_exception_type_display()} ({scope})"
 
 class Trip(models.Model):
     """Represents an actual trip instance for a specific date"""
@@ -153,9 +308,48 @@ class Trip(models.Model):
     class Meta:
         ordering = ['-trip_date', '-schedule__departure_time']
         unique_together = ['route', 'schedule', 'trip_date']
+        indexes = [
+            models.Index(fields=['trip_date'], name='trip_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.route.route_code} - {self.trip_date} - {self.driver.user.get_full_name()}"
+    
+    def cancel(self):
+        """
+        Cancel this trip together with all of its active bookings and refund
+        completed payments. Runs as a fixed number of set-based UPDATEs in one
+        transaction, so the cost does not grow with the passenger count.
+        Returns a summary dict.
+        """
+        from .revenue import update_bookings
+        
+        with transaction.atomic():
+            trip = Trip.objects.select_for_update().get(pk=self.pk)
+            if trip.status in ('COMPLETED', 'CANCELLED'):
+                raise ValueError(f'Cannot cancel a {trip.get_status_display().lower()} trip.')
+            
+            now = timezone.now()
+            active_bookings = Booking.objects.filter(trip=trip, status__in=['PENDING', 'CONFIRMED'])
+            refundable = Payment.objects.filter(
+                booking__in=active_bookings,
+                payment_status='COMPLETED'
+            )
+            refund_total = refundable.aggregate(total=models.Sum('amount'))['total'] or 0
+            
+            # Payments first: their filter depends on the booking status
+            payments_refunded = refundable.update(payment_status='REFUNDED', updated_at=now)
+            bookings_cancelled = update_bookings(active_bookings, status='CANCELLED', updated_at=now)
+            Trip.objects.filter(pk=trip.pk).update(status='CANCELLED')
+            metrics.inc_on_commit('sakay_trip_transitions_total', status='CANCELLED')
+        
+        self.status = 'CANCELLED'
+        return {
+            'trip_id': self.pk,
+            'bookings_cancelled': bookings_cancelled,
+            'payments_refunded': payments_refunded,
+            'refund_total': refund_total,
+        }
 
 class Booking(models.Model):
     STATUS_CHOICES = [
@@ -182,6 +376,10 @@ class Booking(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='booking_created_idx'),
+            models.Index(fields=['booking_date'], name='booking_date_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.booking_id:
@@ -191,6 +389,72 @@ class Booking(models.Model):
     def __str__(self):
         return f"{self.booking_id} - {self.student.user.get_full_name()}"
 
+class DailyRevenue(models.Model):
+    """
+    Booking totals per service date, route, driver, vehicle type and booking
+    status. Kept current by myapp.revenue on every booking and trip change;
+    rebuild_revenue_rollup recomputes it from the bookings.
+    """
+    date = models.DateField()
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='+')
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, null=True, blank=True, related_name='+',
+                               help_text='Driver of the booked trip, empty for bookings not yet on a trip')
+    vehicle_type = models.CharField(max_length=20, choices=Vehicle.VEHICLE_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    bookings = models.PositiveIntegerField(default=0)
+    seats = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['-date', 'route']
+        verbose_name_plural = 'Daily revenue'
+        # NULLs never clash in a unique index, so rows without a driver get their own constraint
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'route', 'driver', 'vehicle_type', 'status'],
+                                    condition=models.Q(driver__isnull=False), name='daily_revenue_key'),
+            models.UniqueConstraint(fields=['date', 'route', 'vehicle_type', 'status'],
+                                    condition=models.Q(driver__isnull=True), name='daily_revenue_key_no_driver'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} - {self.route.route_code} - {self.get_status_display()}: ₱{self.revenue}"
+
+class ReportCell(models.Model):
+    """
+    One cell of the report cube: booking totals per month, route, vehicle type
+    and departure hour. Built a month at a time by myapp.cube from the
+    bookings, for the months ReportMonth marks as dirty.
+    """
+    month = models.DateField(help_text='First day of the month')
+    route = models.ForeignKey(Route, on_delete=models.CASCADE, related_name='+')
+    vehicle_type = models.CharField(max_length=20, choices=Vehicle.VEHICLE_TYPE_CHOICES)
+    hour = models.PositiveSmallIntegerField(help_text='Hour of the schedule departure, 0-23')
+    bookings = models.PositiveIntegerField(default=0, help_text='Bookings not cancelled')
+    seats = models.PositiveIntegerField(default=0, help_text='Seats of the bookings not cancelled')
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text='Fares of completed bookings')
+    cancellations = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-month', 'route', 'hour']
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'route', 'vehicle_type', 'hour'], name='report_cell_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} - {self.route.route_code} - {self.hour:02d}:00"
+
+class ReportMonth(models.Model):
+    """A month of the report cube and whether its cells still need rebuilding"""
+    month = models.DateField(unique=True, help_text='First day of the month')
+    is_dirty = models.BooleanField(default=True)
+    built_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}{' (dirty)' if self.is_dirty else ''}"
+
 class Payment(models.Model):
     PAYMENT_METHOD_CHOICES = [
         ('CASH', 'Cash'),
@@ -216,6 +480,11 @@ class Payment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='payment_created_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.payment_id:
             self.payment_id = f"PY{timezone.now().strftime('%Y%m%d')}{str(uuid.uuid4())[:6].upper()}"
@@ -238,7 +507,44 @@ class VehicleLocation(models.Model):
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['vehicle', '-timestamp']),
+            models.Index(fields=['timestamp'], name='location_timestamp_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.vehicle.plate_number} - {self.timestamp}"
+
+class ReportJob(models.Model):
+    """
+    A report computed off-request (see myapp/report_jobs.py). Jobs for the
+    same report and parameters share a key; at most one of them is queued
+    or running at a time.
+    """
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    report = models.CharField(max_length=50)
+    key = models.CharField(max_length=64, help_text='Hash of the report name and its parameters')
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    result_file = models.CharField(max_length=255, blank=True, help_text='Result JSON in the default storage')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['key', 'status', '-finished_at'], name='report_job_key_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(status__in=['QUEUED', 'RUNNING']),
+                                    name='report_job_one_active'),
         ]
     
     def __str__(self):
-        return f"{self.vehicle.plate_number} - {self.timestamp}"
\ No newline at end of file
+        return f"{self.report} #{self.pk} - {self.get_status_display()}"
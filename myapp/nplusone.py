@@ -0,0 +1,99 @@
+# nplusone.py
+"""
+N+1 query detection for development and the test suite.
+
+NPlusOneMiddleware hooks query execution with connection.execute_wrapper and
+counts the SELECTs of each request by shape, i.e. their SQL with the
+parameters left out. A shape run more than NPLUSONE_THRESHOLD times is almost
+always a related manager touched inside a loop (`route.stops.count` in a
+template, `trip.driver` in a view). Where it came from is read off the stack:
+the template and line being rendered, and the innermost line of app code.
+
+With DEBUG on, each such shape is logged once the request is done. Under
+`manage.py test` (see myapp/test_runner.py) the query that crosses the threshold
+raises RepeatedQueryError, so the test that hits the page fails. Otherwise
+the middleware is not loaded at all.
+"""
+import logging
+import os
+import re
+import sys
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# IN (%s, %s, ...) lists differ in length but not in shape
+PLACEHOLDER_LIST = re.compile(r'IN \(%s(?:, %s)*\)')
+
+
+class RepeatedQueryError(AssertionError):
+    """A query shape ran more than NPLUSONE_THRESHOLD times in one request"""
+
+
+def query_shape(sql):
+    return PLACEHOLDER_LIST.sub('IN (%s, ...)', sql)
+
+
+def query_location():
+    """Where the query being executed comes from: the template line and the innermost app code, when there are any"""
+    template = code = None
+    frame = sys._getframe(1)
+    while frame is not None and not (template and code):
+        if template is None and frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            if isinstance(node, Node) and node.origin is not None and node.token is not None:
+                template = f'{node.origin.template_name or node.origin.name}, line {node.token.lineno}'
+        filename = frame.f_code.co_filename
+        if code is None and filename.startswith(APP_DIR) and filename != __file__:
+            code = f'{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return ' from '.join(location for location in (template, code) if location) or 'unknown location'
+
+
+class QueryShapeCounter:
+    """
+    execute_wrapper hook counting SELECTs by shape. The first time a shape
+    goes past `threshold` its location is noted in `repeated`, or
+    RepeatedQueryError is raised instead of running it when `fail` is set.
+    """
+
+    def __init__(self, threshold, fail=False):
+        self.threshold = threshold
+        self.fail = fail
+        self.counts = {}
+        self.repeated = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            shape = query_shape(sql)
+            count = self.counts[shape] = self.counts.get(shape, 0) + 1
+            if count == self.threshold + 1:
+                location = query_location()
+                if self.fail:
+                    raise RepeatedQueryError(
+                        f'Query run more than {self.threshold} times in one request, at {location}: {shape}')
+                self.repeated[shape] = location
+        return execute(sql, params, many, context)
+
+
+class NPlusOneMiddleware:
+    """Flags repeated query shapes per request; loaded only with DEBUG on or under the test runner"""
+
+    def __init__(self, get_response):
+        if not (settings.DEBUG or settings.NPLUSONE_RAISE):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryShapeCounter(settings.NPLUSONE_THRESHOLD, fail=settings.NPLUSONE_RAISE)
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        for shape, location in counter.repeated.items():
+            logger.warning('Possible N+1 on %s: query run %d times, at %s: %s',
+                           request.path, counter.counts[shape], location, shape)
+        return response
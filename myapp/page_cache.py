@@ -0,0 +1,107 @@
+# page_cache.py
+"""
+Full-page cache of the public pages for anonymous visitors.
+
+Signed-out visitors all get the same home, about, contact, terms and route
+pages, so the first one to ask renders the page and the rest get it from the
+cache. Pages are keyed on the path and the query parameters the view reads
+(stripped, blank ones dropped), under the catalog version (so any change to
+the route network shows at once) and the date (the home page offers bookings
+from today on). A query string with any other parameter, a repeated one or
+an overlong value is rendered without the cache, as is a response the view
+marks `Cache-Control: no-store`, so made-up URLs cannot crowd the real pages
+out of the cache.
+
+Every visitor still gets their own CSRF token: the token of a form is stored
+as a placeholder and filled in per request. Pages carry a weak ETag and
+Last-Modified with `Cache-Control: no-cache`, so a browser revalidates on
+each visit and usually gets a bodiless 304. Signed-in users, requests other
+than GET and HEAD, and visitors with messages waiting (e.g. just signed out)
+get the page rendered as usual.
+"""
+import hashlib
+import re
+import time
+from datetime import date
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, urlencode
+
+from .catalog import catalog_version
+
+PAGE_KEY = 'page:{version}:{day}:{path}'
+MAX_PARAM_LENGTH = 100
+# As rendered by {% csrf_token %}
+CSRF_INPUT = re.compile(r'(<input type="hidden" name="csrfmiddlewaretoken" value=")[^"]*(">)')
+CSRF_PLACEHOLDER = '{{csrf-token}}'
+
+
+def cache_anonymous_page(view=None, params=()):
+    """
+    Serve the view's page to anonymous visitors from the cache; see the module
+    docstring. `params` are the query parameters the view reads.
+    """
+    if view is None:
+        return lambda view: cache_anonymous_page(view, params)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (request.method not in ('GET', 'HEAD') or request.user.is_authenticated
+                or len(messages.get_messages(request))):
+            return view(request, *args, **kwargs)
+        query = page_query(request, params)
+        if query is None:
+            return view(request, *args, **kwargs)
+
+        key = PAGE_KEY.format(version=catalog_version(), day=date.today().isoformat(),
+                              path=hashlib.sha256(f'{request.path}?{query}'.encode()).hexdigest())
+        page = cache.get(key)
+        if page is None:
+            response = view(request, *args, **kwargs)
+            if (response.status_code != 200 or response.streaming or response.cookies
+                    or 'no-store' in response.get('Cache-Control', '')):
+                return response
+            body = CSRF_INPUT.sub(rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', response.content.decode(response.charset))
+            page = {
+                'body': body,
+                'content_type': response['Content-Type'],
+                'etag': 'W/"{}"'.format(hashlib.md5(body.encode(), usedforsecurity=False).hexdigest()),
+                'last_modified': int(time.time()),
+            }
+            cache.set(key, page, settings.PAGE_CACHE_TIMEOUT)
+
+        response = get_conditional_response(request, etag=page['etag'], last_modified=page['last_modified'])
+        if response is None:
+            body = page['body']
+            if CSRF_PLACEHOLDER in body:
+                body = body.replace(CSRF_PLACEHOLDER, get_token(request))
+            response = HttpResponse(body, content_type=page['content_type'])
+        response['ETag'] = page['etag']
+        response['Last-Modified'] = http_date(page['last_modified'])
+        # The same URL is dynamic once signed in, so browsers must ask every time
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    return wrapper
+
+
+def page_query(request, params):
+    """The query string normalised to the given parameters, or None when the page should not be cached"""
+    if not set(request.GET) <= set(params):
+        return None
+    pairs = []
+    for param in params:
+        values = request.GET.getlist(param)
+        if len(values) > 1 or (values and len(values[0]) > MAX_PARAM_LENGTH):
+            return None
+        value = values[0].strip() if values else ''
+        if value:
+            pairs.append((param, value))
+    return urlencode(pairs)
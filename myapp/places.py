@@ -0,0 +1,135 @@
+# places.py
+"""
+Nearest-stop lookup over the place registry.
+
+Places with coordinates that are served by an active route are projected onto
+a local flat grid (kilometres, equirectangular around the network's mean
+latitude, which is accurate to well under a percent across a province) and
+bucketed into square cells. A query scans rings of cells outward from its own
+cell and stops once the next ring cannot hold anything closer than what it
+has already found, so a lookup touches a handful of cells however large the
+registry is.
+
+The index is built from the cached catalog and memoized per catalog version;
+saving or deleting a Place starts a new version, so it is rebuilt on the next
+lookup after a place changes.
+"""
+import heapq
+import math
+
+from .catalog import get_catalog, memoize_on_version
+
+CELL_KM = 0.5
+KM_PER_DEGREE = 111.32
+
+
+class PlaceIndex:
+
+    def __init__(self, catalog):
+        self.places = []   # position -> place dict
+        self.points = []   # position -> (x, y) in km
+        self.cells = {}    # (column, row) -> [position]
+        by_id = {}
+
+        for route in catalog['routes']:
+            for stop in route['stops']:
+                if stop['place_id'] is None or stop['latitude'] is None or stop['longitude'] is None:
+                    continue
+                place = by_id.get(stop['place_id'])
+                if place is None:
+                    place = by_id[stop['place_id']] = {
+                        'place_id': stop['place_id'],
+                        'name': stop['place_name'],
+                        'latitude': float(stop['latitude']),
+                        'longitude': float(stop['longitude']),
+                        'stops': [],
+                    }
+                place['stops'].append({
+                    'stop_id': stop['id'],
+                    'stop_name': stop['stop_name'],
+                    'route_code': route['route_code'],
+                    'route_name': route['route_name'],
+                })
+
+        places = list(by_id.values())
+        self.reference_latitude = sum(p['latitude'] for p in places) / len(places) if places else 0.0
+        self.x_scale = KM_PER_DEGREE * math.cos(math.radians(self.reference_latitude))
+
+        for place in places:
+            point = self._project(place['latitude'], place['longitude'])
+            position = len(self.places)
+            self.places.append(place)
+            self.points.append(point)
+            self.cells.setdefault(self._cell(point), []).append(position)
+
+        if self.cells:
+            columns = [cell[0] for cell in self.cells]
+            rows = [cell[1] for cell in self.cells]
+            self.bounds = (min(columns), min(rows), max(columns), max(rows))
+
+    def _project(self, latitude, longitude):
+        return (longitude * self.x_scale, latitude * KM_PER_DEGREE)
+
+    def _cell(self, point):
+        return (math.floor(point[0] / CELL_KM), math.floor(point[1] / CELL_KM))
+
+    def _ring_span(self, center):
+        """First and last ring around center that can hold occupied cells"""
+        min_column, min_row, max_column, max_row = self.bounds
+        column, row = center
+        first = max(min_column - column, column - max_column, min_row - row, row - max_row, 0)
+        last = max(abs(column - min_column), abs(column - max_column), abs(row - min_row), abs(row - max_row))
+        return first, last
+
+    def _ring(self, center, radius):
+        column, row = center
+        if radius == 0:
+            yield center
+            return
+        for dx in range(-radius, radius + 1):
+            yield (column + dx, row - radius)
+            yield (column + dx, row + radius)
+        for dy in range(-radius + 1, radius):
+            yield (column - radius, row + dy)
+            yield (column + radius, row + dy)
+
+    def nearest(self, latitude, longitude, limit=5, max_km=None):
+        """
+        Up to `limit` places closest to a coordinate, nearest first, each with
+        its distance in metres and the route stops it serves. Places further
+        than max_km are left out.
+        """
+        if not self.places or limit < 1:
+            return []
+        origin = self._project(latitude, longitude)
+        center = self._cell(origin)
+        first_ring, last_ring = self._ring_span(center)
+        if max_km is not None:
+            last_ring = min(last_ring, math.ceil(max_km / CELL_KM) + 1)
+
+        found = []  # max-heap of (-distance, position) holding the best `limit`
+        for radius in range(first_ring, last_ring + 1):
+            for cell in self._ring(center, radius):
+                for position in self.cells.get(cell, ()):
+                    point = self.points[position]
+                    distance = math.hypot(point[0] - origin[0], point[1] - origin[1])
+                    if max_km is not None and distance > max_km:
+                        continue
+                    if len(found) < limit:
+                        heapq.heappush(found, (-distance, position))
+                    elif distance < -found[0][0]:
+                        heapq.heapreplace(found, (-distance, position))
+            # Anything in ring radius + 1 is at least radius * CELL_KM away
+            if len(found) == limit and -found[0][0] <= radius * CELL_KM:
+                break
+
+        results = []
+        for negative_distance, position in sorted(found, reverse=True):
+            place = self.places[position]
+            results.append({**place, 'distance_m': round(-negative_distance * 1000)})
+        return results
+
+
+def get_place_index():
+    """Nearest-stop index for the current catalog version"""
+    return memoize_on_version('place_index', lambda: PlaceIndex(get_catalog()))
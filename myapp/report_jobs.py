@@ -0,0 +1,191 @@
+# report_jobs.py
+"""
+Reports computed off-request.
+
+A page asks for a report with request_report(). It gets back the latest
+completed result for those parameters, however old, and a job is queued
+when there is none yet or it is older than REPORT_MAX_AGE. Jobs share a key
+per report and parameters, and a partial unique constraint allows only one
+queued or running job per key, so identical concurrent requests wait on the
+same computation.
+
+With REPORT_JOBS_IN_PROCESS on (the default) a job runs in a background
+thread of the web process; turned off, jobs wait for the run_report_jobs
+worker.
+Either way a job is claimed with a conditional UPDATE, so it never runs
+twice. Results are JSON files in the default storage, cached once read.
+"""
+import hashlib
+import json
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .cube import MEASURES, slice_cube
+from .models import DailyRevenue, ReportJob, Vehicle
+
+ACTIVE = ['QUEUED', 'RUNNING']
+REPORT_MAX_AGE = timedelta(minutes=5)
+# A job not finished by then is taken for lost (e.g. its process restarted)
+STALE_AFTER = timedelta(minutes=15)
+RESULT_CACHE_KEY = 'report_job:{key}:{pk}'
+RESULT_CACHE_TIMEOUT = 60 * 60
+
+
+def job_key(report, params):
+    canonical = json.dumps([report, params], sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def enqueue(report, params):
+    """The queued or running job for this report and parameters, queued now if there is none"""
+    key = job_key(report, params)
+    cutoff = timezone.now() - STALE_AFTER
+    ReportJob.objects.filter(
+        Q(status='QUEUED', created_at__lt=cutoff) | Q(status='RUNNING', started_at__lt=cutoff), key=key,
+    ).update(status='FAILED', error='Timed out', finished_at=timezone.now())
+    try:
+        with transaction.atomic():
+            job = ReportJob.objects.create(report=report, key=key, params=params)
+    except IntegrityError:
+        # An identical job is already queued or running
+        job = ReportJob.objects.filter(key=key, status__in=ACTIVE).first()
+        if job is not None:
+            return job
+        return enqueue(report, params)
+    if settings.REPORT_JOBS_IN_PROCESS:
+        transaction.on_commit(lambda: threading.Thread(
+            target=_run_in_thread, args=(job.pk,), name=f'report-job-{job.pk}', daemon=True,
+        ).start())
+    return job
+
+
+def request_report(report, params, refresh=False):
+    """
+    (latest completed job or None, queued or running job or None) for the
+    report and parameters, queueing a job when the latest result is missing,
+    older than REPORT_MAX_AGE, or refresh is set
+    """
+    key = job_key(report, params)
+    latest = ReportJob.objects.filter(key=key, status='DONE').order_by('-finished_at').first()
+    active = ReportJob.objects.filter(key=key, status__in=ACTIVE).first()
+    if active is None and (refresh or latest is None or latest.finished_at < timezone.now() - REPORT_MAX_AGE):
+        active = enqueue(report, params)
+    return latest, active
+
+
+def load_result(job):
+    """A completed job's result, or None if its file is gone"""
+    key = RESULT_CACHE_KEY.format(key=job.key, pk=job.pk)
+    result = cache.get(key)
+    if result is None:
+        try:
+            with default_storage.open(job.result_file) as result_file:
+                result = json.load(result_file)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        cache.set(key, result, RESULT_CACHE_TIMEOUT)
+    return result
+
+
+def run_job(job_id):
+    """Claim and compute a queued job. Returns the job, or None if another runner claimed it."""
+    if not ReportJob.objects.filter(pk=job_id, status='QUEUED').update(status='RUNNING', started_at=timezone.now()):
+        return None
+    job = ReportJob.objects.get(pk=job_id)
+    try:
+        result = REPORTS[job.report](job.params)
+        name = default_storage.save(f'reports/{job.report}/{job.key}-{job.pk}.json',
+                                    ContentFile(json.dumps(result, cls=DjangoJSONEncoder).encode()))
+    except Exception:
+        ReportJob.objects.filter(pk=job.pk).update(status='FAILED', error=traceback.format_exc(),
+                                                   finished_at=timezone.now())
+    else:
+        ReportJob.objects.filter(pk=job.pk).update(status='DONE', result_file=name, finished_at=timezone.now())
+        _prune(job)
+    job.refresh_from_db()
+    return job
+
+
+def run_pending():
+    """Run the queued jobs, oldest first. Returns the jobs this call ran."""
+    ran = []
+    while True:
+        job_id = ReportJob.objects.filter(status='QUEUED').order_by('created_at').values_list('pk', flat=True).first()
+        if job_id is None:
+            return ran
+        job = run_job(job_id)
+        if job is not None:
+            ran.append(job)
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        connection.close()
+
+
+def _prune(job):
+    """Drop the finished jobs, and result files, that this job's result supersedes"""
+    older = ReportJob.objects.filter(key=job.key, status__in=['DONE', 'FAILED'], pk__lt=job.pk)
+    for name in older.exclude(result_file='').values_list('result_file', flat=True):
+        default_storage.delete(name)
+    older.delete()
+
+
+def build_admin_report(params):
+    """Figures of the admin reports page, sliced by the filters in params (see views.report_params)"""
+    total_revenue = DailyRevenue.objects.filter(
+        status='COMPLETED'
+    ).aggregate(Sum('revenue'))['revenue__sum'] or 0
+
+    bookings_by_status = list(DailyRevenue.objects.values('status').annotate(
+        count=Sum('bookings')
+    ).order_by('status'))
+
+    monthly_revenue = [{'month': row['month'].strftime('%b'), 'total': row['total']}
+                       for row in DailyRevenue.objects.filter(status='COMPLETED').annotate(
+                           month=TruncMonth('date')
+                       ).values('month').annotate(total=Sum('revenue')).order_by('-month')[:12]]
+
+    by = params.get('by', 'month')
+    vehicle_types = dict(Vehicle.VEHICLE_TYPE_CHOICES)
+    filters = {name: value for name, value in params.items() if name != 'by'}
+    for name in ('start', 'end'):
+        if name in filters:
+            filters[name] = datetime.strptime(filters[name], '%Y-%m').date()
+    cube_rows = list(slice_cube(by, **filters))
+    for row in cube_rows:
+        if by == 'month':
+            row['label'] = row['value'].strftime('%B %Y')
+        elif by == 'vehicle_type':
+            row['label'] = vehicle_types.get(row['value'], row['value'])
+        elif by == 'hour':
+            row['label'] = f"{row['value']:02d}:00"
+        else:
+            row['label'] = row['value']
+        del row['value']
+
+    return {
+        'total_revenue': total_revenue,
+        'bookings_by_status': bookings_by_status,
+        'monthly_revenue': monthly_revenue,
+        'cube_rows': cube_rows,
+        'cube_totals': {measure: sum(row[measure] for row in cube_rows) for measure in MEASURES},
+    }
+
+
+REPORTS = {
+    'admin_reports': build_admin_report,
+}
@@ -0,0 +1,144 @@
+# revenue.py
+"""
+Daily revenue rollup.
+
+DailyRevenue holds booking counts, seats and fares per (service date, route,
+driver, vehicle type, booking status). Whenever bookings move between keys
+(a booking is created, saved or deleted, a set of bookings changes status, a
+trip gets another driver, a route another vehicle) the difference is applied
+to the affected rollup rows, so the rollup always equals what rebuild() would
+compute, and reports aggregate a few hundred rows instead of every booking.
+
+Saves and deletes are handled in signals.py; set-based status changes go
+through update_bookings(). rebuild() recomputes the rollup from scratch for
+backfills and after raw inserts or bulk updates (e.g. a GTFS import). The dates of every applied difference are
+also marked dirty in the report cube (cube.py).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .cube import mark_dirty
+from .metrics import inc_on_commit
+from .models import Booking, DailyRevenue
+
+KEY_FIELDS = ('date', 'route_id', 'driver_id', 'vehicle_type', 'status')
+
+
+def contributions(bookings):
+    """[(key, (bookings, seats, revenue))] of a booking queryset, one entry per rollup key"""
+    rows = bookings.order_by().values(
+        'booking_date', 'route_id', 'trip__driver_id', 'route__vehicle__vehicle_type', 'status'
+    ).annotate(count=Count('pk'), seats=Sum('seats_booked'), revenue=Sum('total_fare'))
+    return [(
+        (row['booking_date'], row['route_id'], row['trip__driver_id'], row['route__vehicle__vehicle_type'],
+         row['status']),
+        (row['count'], row['seats'], row['revenue']),
+    ) for row in rows]
+
+
+def _collect(deltas, rows, sign, **changes):
+    """Add rows to deltas, optionally re-keyed with changed key fields"""
+    for key, (count, seats, revenue) in rows:
+        if changes:
+            key = tuple(changes.get(field, value) for field, value in zip(KEY_FIELDS, key))
+        total = deltas[key]
+        total[0] += sign * count
+        total[1] += sign * seats
+        total[2] += sign * revenue
+
+
+def _apply(deltas):
+    for key, (count, seats, revenue) in deltas.items():
+        lookup = dict(zip(KEY_FIELDS, key))
+        rows = DailyRevenue.objects.filter(**lookup)
+        increment = {
+            'bookings': F('bookings') + count,
+            'seats': F('seats') + seats,
+            'revenue': F('revenue') + revenue,
+        }
+        if rows.update(**increment):
+            if count < 0:
+                rows.filter(bookings=0).delete()
+            continue
+        if count <= 0:
+            # Nothing to take from, e.g. the route's rows were deleted with it
+            continue
+        try:
+            with transaction.atomic():
+                DailyRevenue.objects.create(**lookup, bookings=count, seats=seats, revenue=revenue)
+        except IntegrityError:
+            # Created concurrently since the update above
+            rows.update(**increment)
+    mark_dirty(key[0] for key in deltas)
+
+
+def _new_deltas():
+    return defaultdict(lambda: [0, 0, Decimal('0')])
+
+
+def _changed(deltas):
+    return {key: total for key, total in deltas.items() if any(total)}
+
+
+def snapshot(bookings):
+    """Current totals of a booking queryset; pass to settle() once the bookings have changed"""
+    return bookings, contributions(bookings)
+
+
+def settle(taken):
+    """Apply the difference between a snapshot and the bookings' totals now"""
+    bookings, before = taken
+    deltas = _new_deltas()
+    _collect(deltas, before, -1)
+    _collect(deltas, contributions(bookings), 1)
+    deltas = _changed(deltas)
+    if deltas:
+        with transaction.atomic():
+            _apply(deltas)
+
+
+def update_bookings(bookings, **changes):
+    """
+    bookings.update(**changes) that moves the updated bookings to their new
+    rollup keys. Returns the number of bookings updated.
+    """
+    with transaction.atomic():
+        rows = contributions(bookings)
+        updated = bookings.update(**changes)
+        deltas = _new_deltas()
+        _collect(deltas, rows, -1)
+        _collect(deltas, rows, 1, **{field: changes[field] for field in KEY_FIELDS if field in changes})
+        _apply(_changed(deltas))
+        if changes.get('status') == 'CANCELLED':
+            inc_on_commit('sakay_bookings_cancelled_total',
+                          sum(count for key, (count, _, _) in rows if key[4] != 'CANCELLED'))
+    return updated
+
+
+def rebuild(start=None, end=None, batch_size=1000, route_ids=None):
+    """
+    Recompute the rollup, or the dates from start to end and optionally only
+    the given routes, from the bookings. Returns the rows written.
+    """
+    bookings = Booking.objects.all()
+    rollup = DailyRevenue.objects.all()
+    if route_ids is not None:
+        bookings = bookings.filter(route_id__in=route_ids)
+        rollup = rollup.filter(route_id__in=route_ids)
+    if start:
+        bookings = bookings.filter(booking_date__gte=start)
+        rollup = rollup.filter(date__gte=start)
+    if end:
+        bookings = bookings.filter(booking_date__lte=end)
+        rollup = rollup.filter(date__lte=end)
+
+    with transaction.atomic():
+        rollup.delete()
+        created = DailyRevenue.objects.bulk_create([
+            DailyRevenue(**dict(zip(KEY_FIELDS, key)), bookings=count, seats=seats, revenue=revenue)
+            for key, (count, seats, revenue) in contributions(bookings)
+        ], batch_size=batch_size)
+    return len(created)
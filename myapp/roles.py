@@ -0,0 +1,56 @@
+# roles.py
+"""
+User roles. With RoleModelBackend the request's user arrives with its
+driver and student profiles already joined, so these checks run no queries;
+get_user_type() is also memoized on the user object, which lives for one
+request.
+
+The role is also stored in the session at sign-in, for
+ThreeTierAccessMiddleware. A role that changes afterwards (a user made
+staff, say) takes effect at the next sign-in.
+"""
+ROLE_SESSION_KEY = '_sakay_role'
+
+
+def is_admin(user):
+    """Check if user is admin/staff"""
+    return user.is_staff or user.is_superuser
+
+
+def is_driver(user):
+    """Check if user is a driver"""
+    return hasattr(user, 'driver')
+
+
+def is_student(user):
+    """Check if user is a student"""
+    return hasattr(user, 'student')
+
+
+def get_user_type(user):
+    """Get the type of user: 'admin', 'driver', 'student' or None"""
+    try:
+        return user._user_type
+    except AttributeError:
+        pass
+    if is_admin(user):
+        user_type = 'admin'
+    elif is_driver(user):
+        user_type = 'driver'
+    elif is_student(user):
+        user_type = 'student'
+    else:
+        user_type = None
+    user._user_type = user_type
+    return user_type
+
+
+def remember_role(session, user):
+    """Store the user's role in their session"""
+    session[ROLE_SESSION_KEY] = [user._meta.pk.value_to_string(user), get_user_type(user)]
+
+
+def cached_role(session, user_id):
+    """The role stored in the session for this user id (as kept under auth's SESSION_KEY), or False"""
+    stored = session.get(ROLE_SESSION_KEY)
+    return stored[1] if stored and stored[0] == user_id else False
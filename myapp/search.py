@@ -0,0 +1,208 @@
+# search.py
+"""
+Ranked full-text search over routes.
+
+Each active route is indexed with its name, origin, destination and the
+names of its active stops; a route leaves the index when it is deactivated. The
+index lives next to the regular tables and is kept in sync by signals (see
+signals.py). search() takes the route type too, so that filter applies
+before the limit rather than after it:
+
+- SQLite: an FTS5 virtual table ranked with bm25().
+- PostgreSQL: a weighted tsvector with a GIN index, plus pg_trgm similarity
+  on the raw names so typos and partial words still match.
+- Anything else falls back to icontains filtering.
+
+route_index() picks the implementation for the current database; callers
+only use search(), index_route(), remove_route() and rebuild().
+"""
+import re
+
+from django.db import connection as default_connection
+from django.db.models import Q
+
+from .models import Route
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _tokens(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+class RouteIndex:
+    """icontains fallback for databases without a dedicated implementation"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create(self):
+        pass
+
+    def drop(self):
+        pass
+
+    def index_route(self, route_id):
+        pass
+
+    def remove_route(self, route_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, route_type=None, limit=50):
+        """Ids of matching active routes, of the given type if any, best match first"""
+        tokens = _tokens(query)
+        if not tokens:
+            return []
+        routes = Route.objects.filter(is_active=True)
+        if route_type:
+            routes = routes.filter(route_type=route_type)
+        for token in tokens:
+            routes = routes.filter(
+                Q(route_name__icontains=token) |
+                Q(origin__icontains=token) |
+                Q(destination__icontains=token) |
+                Q(stops__stop_name__icontains=token, stops__is_active=True)
+            )
+        return list(routes.values_list('id', flat=True).distinct()[:limit])
+
+
+class SQLiteRouteIndex(RouteIndex):
+    TABLE = 'myapp_route_fts'
+
+    # Column weights for bm25(): name, origin, destination, stops
+    WEIGHTS = '10.0, 5.0, 5.0, 2.0'
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.TABLE} USING fts5("
+                "route_name, origin, destination, stop_names, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+
+    def _insert_sql(self, where=''):
+        return (
+            f"INSERT INTO {self.TABLE} (rowid, route_name, origin, destination, stop_names) "
+            "SELECT r.id, r.route_name, r.origin, r.destination, "
+            "(SELECT group_concat(s.stop_name, ' ') FROM myapp_stop s WHERE s.route_id = r.id AND s.is_active) "
+            f"FROM myapp_route r WHERE r.is_active {where}"
+        )
+
+    def index_route(self, route_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.TABLE} WHERE rowid = %s", [route_id])
+            cursor.execute(self._insert_sql('AND r.id = %s'), [route_id])
+
+    def remove_route(self, route_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.TABLE} WHERE rowid = %s", [route_id])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.TABLE}")
+            cursor.execute(self._insert_sql())
+
+    def search(self, query, route_type=None, limit=50):
+        tokens = _tokens(query)
+        if not tokens:
+            return []
+        # Quote every token and allow prefix matches so "nav" finds "Naval"
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        if route_type:
+            sql = (f"SELECT {self.TABLE}.rowid FROM {self.TABLE} JOIN myapp_route r ON r.id = {self.TABLE}.rowid "
+                   f"WHERE {self.TABLE} MATCH %s AND r.route_type = %s ")
+            params = [match, route_type]
+        else:
+            sql = f"SELECT rowid FROM {self.TABLE} WHERE {self.TABLE} MATCH %s "
+            params = [match]
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql + f"ORDER BY bm25({self.TABLE}, {self.WEIGHTS}) LIMIT %s", params + [limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresRouteIndex(RouteIndex):
+    TABLE = 'myapp_route_search'
+
+    def create(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE} ("
+                "route_id bigint PRIMARY KEY REFERENCES myapp_route (id) ON DELETE CASCADE, "
+                "document tsvector NOT NULL, "
+                "names text NOT NULL)"
+            )
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.TABLE}_document ON {self.TABLE} USING gin (document)")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.TABLE}_names ON {self.TABLE} USING gin (names gin_trgm_ops)")
+
+    def drop(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+
+    def _upsert_sql(self, where=''):
+        return (
+            f"INSERT INTO {self.TABLE} (route_id, document, names) "
+            "SELECT r.id, "
+            "setweight(to_tsvector('simple', r.route_name), 'A') || "
+            "setweight(to_tsvector('simple', r.origin || ' ' || r.destination), 'B') || "
+            "setweight(to_tsvector('simple', coalesce(st.stop_names, '')), 'C'), "
+            "lower(concat_ws(' ', r.route_name, r.origin, r.destination, st.stop_names)) "
+            "FROM myapp_route r "
+            "LEFT JOIN LATERAL (SELECT string_agg(s.stop_name, ' ') AS stop_names "
+            "FROM myapp_stop s WHERE s.route_id = r.id AND s.is_active) st ON true "
+            f"WHERE r.is_active {where} "
+            "ON CONFLICT (route_id) DO UPDATE SET document = EXCLUDED.document, names = EXCLUDED.names"
+        )
+
+    def index_route(self, route_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.TABLE} WHERE route_id = %s", [route_id])
+            cursor.execute(self._upsert_sql('AND r.id = %s'), [route_id])
+
+    def remove_route(self, route_id):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.TABLE} WHERE route_id = %s", [route_id])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.TABLE}")
+            cursor.execute(self._upsert_sql())
+
+    def search(self, query, route_type=None, limit=50):
+        tokens = _tokens(query)
+        if not tokens:
+            return []
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        text = ' '.join(tokens)
+        params = [tsquery, text, tsquery, text]
+        type_filter = ''
+        if route_type:
+            type_filter = "AND route_id IN (SELECT id FROM myapp_route WHERE route_type = %s) "
+            params.append(route_type)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT route_id FROM ("
+                f"SELECT route_id, ts_rank(document, to_tsquery('simple', %s)) + similarity(names, %s) AS rank "
+                f"FROM {self.TABLE} "
+                f"WHERE (document @@ to_tsquery('simple', %s) OR names %% %s) {type_filter}"
+                ") ranked ORDER BY rank DESC LIMIT %s",
+                params + [limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def route_index(connection=None):
+    """Search index implementation for the given (default) database connection"""
+    connection = connection or default_connection
+    if connection.vendor == 'sqlite':
+        return SQLiteRouteIndex(connection)
+    if connection.vendor == 'postgresql':
+        return PostgresRouteIndex(connection)
+    return RouteIndex(connection)
@@ -0,0 +1,99 @@
+# service_calendar.py
+"""
+Resolves which schedules run on a given date.
+
+A schedule runs on its weekday, limited to its calendar's date range when it
+has one. Service exceptions then add or remove dates: an exception for the
+schedule's calendar wins over a network-wide one (calendar left empty). An
+added date runs the timetable of its service_weekday, or of its own weekday.
+
+The answer for each date is cached as a frozenset of schedule ids under the
+catalog version, which signals bump whenever schedules, calendars or
+exceptions change, so callers never re-derive it per request. Dates missing
+from the cache are resolved together, in three queries however many there
+are.
+"""
+from django.core.cache import cache
+
+from .catalog import catalog_version
+from .models import Schedule, ServiceCalendar, ServiceException
+
+CACHE_KEY = 'service:{version}:{date}'
+CACHE_TIMEOUT = 60 * 60 * 24
+
+_memo = {}
+
+
+def _resolve(days):
+    """{day: frozenset of running schedule ids} for the given dates, in three queries however many there are"""
+    calendars = {calendar.id: calendar for calendar in ServiceCalendar.objects.all()}
+    network_exceptions = {}
+    calendar_exceptions = {}
+    for exception in ServiceException.objects.filter(date__in=days):
+        if exception.calendar_id is None:
+            # REMOVED wins if the network has conflicting entries for one date
+            current = network_exceptions.get(exception.date)
+            if current is None or exception.exception_type == 'REMOVED':
+                network_exceptions[exception.date] = exception
+        else:
+            calendar_exceptions[exception.date, exception.calendar_id] = exception
+    schedules = list(Schedule.objects.filter(is_active=True).values_list('id', 'weekday', 'calendar_id'))
+
+    resolved = {}
+    for day in days:
+        weekday = day.weekday()
+        network_exception = network_exceptions.get(day)
+        running = set()
+        for schedule_id, schedule_weekday, calendar_id in schedules:
+            exception = calendar_exceptions.get((day, calendar_id), network_exception)
+            if exception is not None and exception.exception_type == 'REMOVED':
+                continue
+            if exception is not None and exception.exception_type == 'ADDED':
+                service_weekday = exception.service_weekday if exception.service_weekday is not None else weekday
+                if schedule_weekday == service_weekday:
+                    running.add(schedule_id)
+                continue
+            if schedule_weekday != weekday:
+                continue
+            if calendar_id is not None and not calendars[calendar_id].covers(day):
+                continue
+            running.add(schedule_id)
+        resolved[day] = frozenset(running)
+    return resolved
+
+
+def running_schedule_ids_on(days):
+    """{day: ids of the active schedules that run on it} for each of the given dates"""
+    version = catalog_version()
+    found = {}
+    for day in days:
+        hit = _memo.get(day)
+        if hit is not None and hit[0] == version:
+            found[day] = hit[1]
+
+    missing = [day for day in days if day not in found]
+    if missing:
+        keys = {CACHE_KEY.format(version=version, date=day.isoformat()): day for day in missing}
+        cached = cache.get_many(keys)
+        found.update((keys[key], running) for key, running in cached.items())
+        unresolved = [day for key, day in keys.items() if key not in cached]
+        if unresolved:
+            resolved = _resolve(unresolved)
+            cache.set_many({CACHE_KEY.format(version=version, date=day.isoformat()): running
+                            for day, running in resolved.items()}, CACHE_TIMEOUT)
+            found.update(resolved)
+
+        if len(_memo) + len(missing) > 366:
+            _memo.clear()
+        for day in missing:
+            _memo[day] = (version, found[day])
+    return {day: found[day] for day in days}
+
+
+def running_schedule_ids(day):
+    """Ids of the active schedules that run on the given date"""
+    return running_schedule_ids_on([day])[day]
+
+
+def runs_on(schedule_id, day):
+    return schedule_id in running_schedule_ids(day)
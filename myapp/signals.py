@@ -0,0 +1,181 @@
+# signals.py
+from django.contrib.auth.signals import user_logged_in
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .models import (Place, Route, Stop, Schedule, Vehicle, ServiceCalendar, ServiceException, Trip, Booking,
+                     VehicleLocation)
+from . import metrics
+from .catalog import bump_catalog_version
+from .cube import mark_dirty
+from .fares import invalidate_fare_matrix
+from .revenue import snapshot, settle
+from .roles import remember_role
+from .search import route_index
+
+
+@receiver([post_save, post_delete], sender=Route)
+def route_changed(sender, instance, **kwargs):
+    """Fares scale with Route.fare, so drop the route's fare matrix"""
+    invalidate_fare_matrix(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Stop)
+def stop_changed(sender, instance, **kwargs):
+    """Rebuild the fare matrix of the stop's route on next use"""
+    invalidate_fare_matrix(instance.route_id)
+
+
+@receiver([post_save, post_delete], sender=Route)
+@receiver([post_save, post_delete], sender=Stop)
+@receiver([post_save, post_delete], sender=Schedule)
+@receiver([post_save, post_delete], sender=Vehicle)
+@receiver([post_save, post_delete], sender=Place)
+@receiver([post_save, post_delete], sender=ServiceCalendar)
+@receiver([post_save, post_delete], sender=ServiceException)
+def catalog_changed(sender, **kwargs):
+    """Any change to the route network, place registry or service calendar starts a new catalog version"""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Route)
+def index_route(sender, instance, **kwargs):
+    """Keep the route search index in step with route names"""
+    route_index().index_route(instance.pk)
+
+
+@receiver(post_delete, sender=Route)
+def unindex_route(sender, instance, **kwargs):
+    route_index().remove_route(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Stop)
+def reindex_stop_route(sender, instance, **kwargs):
+    """Stop names are searchable, so reindex the stop's route"""
+    route_index().index_route(instance.route_id)
+
+
+def field_changed(instance, field):
+    """Whether a saved instance's field differs from the stored row"""
+    if instance.pk is None:
+        return False
+    stored = type(instance).objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    return stored is not None and stored != getattr(instance, field)
+
+
+@receiver([pre_save, pre_delete], sender=Booking)
+def snapshot_booking(sender, instance, **kwargs):
+    """The booking's rollup key can change with its status, date or trip"""
+    instance._revenue = snapshot(Booking.objects.filter(pk=instance.pk)) if instance.pk else None
+    # One booking has a single rollup key, which holds its stored status
+    instance._stored_status = next((key[4] for key, _ in instance._revenue[1]), None) if instance._revenue else None
+
+
+@receiver(pre_save, sender=Trip)
+def snapshot_trip_bookings(sender, instance, **kwargs):
+    """A trip's bookings move to the new driver's revenue; the stored status tells whether the trip changes status"""
+    stored = (Trip.objects.filter(pk=instance.pk).values_list('driver_id', 'status').first()
+              if instance.pk is not None else None)
+    instance._revenue = (snapshot(Booking.objects.filter(trip_id=instance.pk))
+                         if stored is not None and stored[0] != instance.driver_id else None)
+    instance._stored_status = stored[1] if stored is not None else None
+
+
+@receiver(post_save, sender=Trip)
+def count_trip_transition(sender, instance, created, **kwargs):
+    if not created and getattr(instance, '_stored_status', None) not in (None, instance.status):
+        metrics.inc_on_commit('sakay_trip_transitions_total', status=instance.status)
+    instance._stored_status = instance.status
+
+
+@receiver(pre_delete, sender=Trip)
+def snapshot_deleted_trip_bookings(sender, instance, **kwargs):
+    """Bookings of a deleted trip are kept without a trip, so without a driver"""
+    booking_ids = list(Booking.objects.filter(trip_id=instance.pk).values_list('pk', flat=True))
+    instance._revenue = snapshot(Booking.objects.filter(pk__in=booking_ids))
+
+
+@receiver(pre_save, sender=Route)
+def snapshot_route_bookings(sender, instance, **kwargs):
+    instance._revenue = (snapshot(Booking.objects.filter(route_id=instance.pk))
+                         if field_changed(instance, 'vehicle_id') else None)
+
+
+@receiver(pre_save, sender=Vehicle)
+def snapshot_vehicle_bookings(sender, instance, **kwargs):
+    instance._revenue = (snapshot(Booking.objects.filter(route__vehicle_id=instance.pk))
+                         if field_changed(instance, 'vehicle_type') else None)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=Trip)
+@receiver(post_save, sender=Route)
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=Trip)
+def revenue_changed(sender, instance, created=False, **kwargs):
+    """Apply the saved or deleted rows' effect on the daily revenue rollup"""
+    if created and sender is Booking:
+        instance._revenue = (Booking.objects.filter(pk=instance.pk), [])
+    taken = getattr(instance, '_revenue', None)
+    if taken is not None:
+        instance._revenue = None
+        settle(taken)
+
+
+@receiver(post_save, sender=Booking)
+def count_booking(sender, instance, created, **kwargs):
+    """Bookings made, and bookings moved to CANCELLED, once their transaction commits"""
+    if created:
+        metrics.inc_on_commit('sakay_bookings_created_total')
+    elif instance.status == 'CANCELLED' and getattr(instance, '_stored_status', None) not in (None, 'CANCELLED'):
+        metrics.inc_on_commit('sakay_bookings_cancelled_total')
+    instance._stored_status = instance.status
+
+
+@receiver(pre_save, sender=Booking)
+def booking_cube_months(sender, instance, **kwargs):
+    """
+    Revenue rollup differences mark the cube months of most booking changes;
+    a move to another schedule changes only the departure hour, which the
+    rollup does not key on
+    """
+    instance._cube_months = [instance.booking_date] if field_changed(instance, 'schedule_id') else []
+
+
+@receiver(post_save, sender=Booking)
+def booking_cube_changed(sender, instance, **kwargs):
+    mark_dirty(getattr(instance, '_cube_months', []))
+    instance._cube_months = []
+
+
+@receiver(pre_save, sender=Schedule)
+def schedule_cube_months(sender, instance, **kwargs):
+    """The schedule's bookings move to another departure hour in the report cube"""
+    instance._cube_months = (list(Booking.objects.filter(schedule_id=instance.pk).dates('booking_date', 'month'))
+                             if field_changed(instance, 'departure_time') else [])
+
+
+@receiver(post_save, sender=Schedule)
+def schedule_cube_changed(sender, instance, **kwargs):
+    mark_dirty(getattr(instance, '_cube_months', []))
+    instance._cube_months = []
+
+
+@receiver(user_logged_in)
+def remember_signed_in_role(sender, request, user, **kwargs):
+    """Access control reads the role from the session instead of loading the user"""
+    if request is not None and hasattr(request, 'session'):
+        remember_role(request.session, user)
+
+
+@receiver(post_save, sender=VehicleLocation)
+def count_gps_fix(sender, instance, created, **kwargs):
+    if created:
+        metrics.inc_on_commit('sakay_gps_fixes_total')
+
+
+@receiver(connection_created)
+def count_db_connection(sender, connection, **kwargs):
+    metrics.inc('sakay_db_connections_opened_total')
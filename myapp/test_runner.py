@@ -0,0 +1,33 @@
+# test_runner.py
+"""
+Test runner that keeps the suite apart from the development site.
+
+Tests get a cache of their own in memory, so clearing it leaves the site's
+file cache alone, and a temporary METRICS_DIR, removed after the run. A query
+repeated past NPLUSONE_THRESHOLD in one request raises RepeatedQueryError
+(see myapp/nplusone.py), so the test that hits the page fails.
+"""
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """The default runner, with the test settings above for the whole run"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._metrics_dir = tempfile.mkdtemp(prefix='sakay-test-metrics-')
+        self._test_settings = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'}},
+            METRICS_DIR=self._metrics_dir,
+            NPLUSONE_RAISE=True,
+        )
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        shutil.rmtree(self._metrics_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
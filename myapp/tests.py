@@ -1,3 +1,1415 @@
-from django.test import TestCase
+import io
+import os
+import re
+import subprocess
+import tempfile
+import threading
+import zipfile
+from datetime import date, datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import authenticate
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.template import Template, Context
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils import timezone
+
+from .catalog import catalog_version, get_route
+from .cube import cells, rebuild, refresh
+from .exports import EXPORTS
+from .fares import segment_fare
+from .gtfs import export_feed, import_feed
+from .load_factor import build_week, heatmap
+from .models import (Vehicle, Driver, Student, Route, Stop, Place, Schedule, ServiceCalendar, ServiceException, Trip,
+                     Booking, Payment, VehicleLocation, DailyRevenue, ReportCell, ReportMonth, ReportJob)
+from .report_jobs import enqueue, request_report, run_job, run_pending
+from .backends import RoleModelBackend
+from .roles import get_user_type, is_admin, is_driver, is_student
+from .instrumentation import aggregator
+from . import metrics
+from .nplusone import QueryShapeCounter, RepeatedQueryError
+from .search import route_index
+from .service_calendar import runs_on
+from .middleware import AREAS, ThreeTierAccessMiddleware
+from . import urls as app_urls
+from .revenue import rebuild as rebuild_revenue, update_bookings
+
+# Plain static storage, so templates render without a collectstatic manifest
+TEST_STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Report result files go to a scratch directory
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix='sakay-test-media-')
+
+
+def make_vehicle(n):
+    return Vehicle.objects.create(plate_number=f'TST-{n:03d}', vehicle_type='VAN', model='Toyota Hiace',
+                                  color='White', capacity=15, year=2022)
+
+
+def make_route(n, vehicle):
+    """A route with three stops"""
+    route = Route.objects.create(route_code=f'TST-{n}', route_name=f'Naval to Almeria {n}', origin='Naval',
+                                 destination='Almeria', distance_km=Decimal('12.00'), fare=Decimal('50.00'),
+                                 estimated_duration='30 minutes', route_type='PICKUP', vehicle=vehicle)
+    for order, name in enumerate(['Naval', 'Caraycaray', 'Almeria'], start=1):
+        Stop.objects.create(route=route, stop_name=name, stop_order=order, estimated_arrival_time=time(6, order * 10))
+    return route
+
+
+def make_driver(n, vehicle):
+    user = User.objects.create_user(f'driver{n}', password='driver-pass-123', first_name='Juan', last_name=f'Reyes{n}')
+    return Driver.objects.create(
+        user=user, driver_id=f'DRV-{n}', license_number=f'N01-23-{n:06d}', license_expiry=date(2030, 1, 1),
+        phone_number='09170000000', address='Naval', date_of_birth=date(1985, 1, 1),
+        emergency_contact_name='Maria Reyes', emergency_contact_number='09170000001',
+        vehicle=vehicle, is_verified=True,
+    )
+
+
+def make_student(n):
+    user = User.objects.create_user(f'student{n}', password='student-pass-123',
+                                    first_name=f'Student{n}', last_name='Santos')
+    return Student.objects.create(
+        user=user, student_id=f'STU-{n}', phone_number='09180000000', address='Almeria',
+        date_of_birth=date(2008, 1, 1), guardian_name='Guardian', guardian_contact='09180000001',
+        emergency_contact_name='Guardian', emergency_contact_number='09180000001',
+    )
+
+
+class TripCancelTests(TestCase):
+    """Cancelling a trip cancels its active bookings and refunds their completed payments in fixed queries"""
+
+    def setUp(self):
+        vehicle = make_vehicle(1)
+        self.route = make_route(1, vehicle)
+        self.stops = list(self.route.stops.order_by('stop_order'))
+        self.schedule = Schedule.objects.create(route=self.route, weekday=0, departure_time=time(7),
+                                                arrival_time=time(7, 20))
+        self.driver = make_driver(1, vehicle)
+        self.student = make_student(1)
+
+    def trip_with(self, statuses, trip_date=date(2026, 6, 1)):
+        trip = Trip.objects.create(route=self.route, schedule=self.schedule, driver=self.driver, trip_date=trip_date)
+        for status, payment_status in statuses:
+            booking = Booking.objects.create(student=self.student, route=self.route, schedule=self.schedule,
+                                             trip=trip, booking_date=trip.trip_date, pickup_stop=self.stops[0],
+                                             dropoff_stop=self.stops[-1], seats_booked=1,
+                                             total_fare=Decimal('50.00'), status=status)
+            Payment.objects.create(booking=booking, amount=Decimal('50.00'), payment_method='CASH',
+                                   payment_status=payment_status)
+        return trip
+
+    def test_cancel(self):
+        trip = self.trip_with([('PENDING', 'PENDING'), ('CONFIRMED', 'COMPLETED'), ('CONFIRMED', 'COMPLETED'),
+                               ('CANCELLED', 'COMPLETED')])
+        summary = trip.cancel()
+        self.assertEqual((summary['bookings_cancelled'], summary['payments_refunded'], summary['refund_total']),
+                         (3, 2, Decimal('100.00')))
+        self.assertEqual(Trip.objects.get(pk=trip.pk).status, 'CANCELLED')
+        self.assertFalse(trip.bookings.exclude(status='CANCELLED').exists())
+        self.assertEqual(sorted(Payment.objects.values_list('payment_status', flat=True)),
+                         ['COMPLETED', 'PENDING', 'REFUNDED', 'REFUNDED'])
+        with self.assertRaisesMessage(ValueError, 'Cannot cancel a cancelled trip.'):
+            trip.cancel()
+
+    def test_queries_do_not_grow_with_bookings(self):
+        small = self.trip_with([('CONFIRMED', 'COMPLETED')])
+        large = self.trip_with([('CONFIRMED', 'COMPLETED')] * 10, date(2026, 6, 8))
+        with CaptureQueriesContext(connection) as queries:
+            small.cancel()
+        with self.assertNumQueries(len(queries)):
+            large.cancel()
+
+
+class SegmentFareTests(TestCase):
+    """Segments cost their share of the route fare, by distance when every stop has one and by time otherwise"""
+
+    def test_fares(self):
+        route = make_route(1, make_vehicle(1))  # 50.00, stops 10 minutes apart
+        naval, caraycaray, almeria = route.stops.order_by('stop_order')
+        self.assertEqual(segment_fare(route, naval, caraycaray), Decimal('25'))
+        self.assertEqual(segment_fare(route, naval, almeria), Decimal('50'))
+        self.assertIsNone(segment_fare(route, almeria, naval))
+        self.assertIsNone(segment_fare(route, naval, naval))
+
+        for stop, distance in [(naval, 0), (caraycaray, 3), (almeria, 12)]:
+            stop.distance_km = Decimal(distance)
+            stop.save()
+        self.assertEqual(segment_fare(route, naval, caraycaray), Decimal('12.5'))
+        self.assertEqual(segment_fare(route, caraycaray, almeria), Decimal('37.5'))
+
+
+class CatalogTests(TestCase):
+    """Saving a route, stop or schedule starts a new catalog version"""
+
+    def test_saves_bump_the_version(self):
+        route = make_route(1, make_vehicle(1))
+        self.assertEqual(get_route('TST-1')['schedules'], [])
+
+        def bumps(change):
+            version = catalog_version()
+            change()
+            return catalog_version() != version
+
+        route.route_name = 'Naval to Almeria via Caraycaray'
+        self.assertTrue(bumps(route.save))
+        stop = route.stops.get(stop_order=2)
+        stop.stop_name = 'Caraycaray Crossing'
+        self.assertTrue(bumps(stop.save))
+        self.assertTrue(bumps(lambda: Schedule.objects.create(route=route, weekday=0, departure_time=time(7),
+                                                              arrival_time=time(7, 30))))
+
+        cached = get_route('TST-1')
+        self.assertEqual(cached['route_name'], 'Naval to Almeria via Caraycaray')
+        self.assertEqual([stop['stop_name'] for stop in cached['stops']], ['Naval', 'Caraycaray Crossing', 'Almeria'])
+        self.assertEqual([schedule['departure_time'] for schedule in cached['schedules']], [time(7)])
+
+
+class RouteSearchTests(TestCase):
+    """The search index holds active routes only, and filters on type before the limit"""
+
+    def test_active_routes_of_a_type(self):
+        vehicle = make_vehicle(1)
+        routes = [make_route(n, vehicle) for n in range(4)]
+        routes[1].route_type = 'DROP'
+        routes[1].save()
+        routes[2].is_active = False
+        routes[2].save()
+        index = route_index()
+        self.assertEqual(sorted(index.search('naval')), [routes[0].pk, routes[1].pk, routes[3].pk])
+        self.assertEqual(index.search('naval', route_type='DROP'), [routes[1].pk])
+        self.assertIn(index.search('naval', route_type='PICKUP', limit=1)[0], [routes[0].pk, routes[3].pk])
+
+        routes[2].is_active = True
+        routes[2].save()
+        self.assertIn(routes[2].pk, index.search('almeria'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class JourneyPlannerTests(TestCase):
+    """Journeys change routes at shared places, leaving time to transfer"""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicle = make_vehicle(1)
+        first = make_route(1, vehicle)  # Naval 0, Caraycaray +10, Almeria +20 minutes
+        second = Route.objects.create(route_code='TST-2', route_name='Almeria to Caucab', origin='Almeria',
+                                      destination='Caucab', distance_km=Decimal('5.00'), fare=Decimal('30.00'),
+                                      estimated_duration='10 minutes', route_type='PICKUP', vehicle=vehicle)
+        Stop.objects.create(route=second, stop_name='Almeria', stop_order=1, estimated_arrival_time=time(8))
+        Stop.objects.create(route=second, stop_name='Caucab', stop_order=2, estimated_arrival_time=time(8, 10))
+        Schedule.objects.create(route=first, weekday=0, departure_time=time(7), arrival_time=time(7, 20))
+        # Leaves two minutes after the first trip arrives, too soon to transfer
+        Schedule.objects.create(route=second, weekday=0, departure_time=time(7, 22), arrival_time=time(7, 32))
+        Schedule.objects.create(route=second, weekday=0, departure_time=time(7, 30), arrival_time=time(7, 40))
+
+    def setUp(self):
+        # Running schedules are cached under the catalog version, which outlives each test's rollback
+        cache.clear()
+
+    def test_transfer(self):
+        response = self.client.get(reverse('journey_planner_api'), {
+            'from': 'Naval', 'to': 'Caucab', 'date': '2026-06-01', 'time': '06:45',
+        })
+        journeys = response.json()['journeys']
+        self.assertEqual(len(journeys), 1)
+        self.assertEqual(journeys[0]['transfers'], 1)
+        self.assertEqual([(leg['route_code'], leg['from_stop'], leg['departure'], leg['to_stop'], leg['arrival'])
+                          for leg in journeys[0]['legs']],
+                         [('TST-1', 'Naval', '07:00', 'Almeria', '07:20'),
+                          ('TST-2', 'Almeria', '07:30', 'Caucab, Almeria', '07:40')])
+        self.assertEqual(journeys[0]['duration_minutes'], 40)
+
+        response = self.client.get(reverse('journey_planner_api'), {
+            'from': 'Naval', 'to': 'Caucab', 'date': '2026-06-01', 'time': '06:45', 'max_transfers': 0,
+        })
+        self.assertEqual(response.json()['journeys'], [])
+
+    def test_service_calendar(self):
+        # A holiday Monday, and a Saturday running the Monday timetable
+        ServiceException.objects.create(date=date(2026, 6, 1), exception_type='REMOVED')
+        ServiceException.objects.create(date=date(2026, 6, 6), exception_type='ADDED', service_weekday=0)
+
+        def arrivals(day):
+            response = self.client.get(reverse('journey_planner_api'), {
+                'from': 'Naval', 'to': 'Caucab', 'date': day, 'time': '06:45',
+            })
+            return [journey['arrival'] for journey in response.json()['journeys']]
+
+        self.assertEqual(arrivals('2026-06-01'), [])
+        self.assertEqual(arrivals('2026-06-06'), ['07:40'])
+        self.assertEqual(arrivals('2026-06-08'), ['07:40'])
+
+    def test_defaults_to_local_now(self):
+        # Sunday night in UTC is Monday 06:45 in Manila
+        sunday_night = datetime(2026, 5, 31, 22, 45, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=sunday_night):
+            response = self.client.get(reverse('journey_planner_api'), {'from': 'Naval', 'to': 'Caucab'})
+        self.assertEqual(response.json()['date'], '2026-06-01')
+        self.assertEqual(response.json()['journeys'][0]['departure'], '07:00')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class StopDeparturesTests(TestCase):
+    """The next departures from a stop come from every route through it, in time order"""
+
+    def test_next_departures(self):
+        vehicle = make_vehicle(1)
+        outbound = make_route(1, vehicle)  # Caraycaray 10 minutes in
+        inbound = Route.objects.create(route_code='TST-2', route_name='Almeria to Naval', origin='Almeria',
+                                       destination='Naval', distance_km=Decimal('12.00'), fare=Decimal('50.00'),
+                                       estimated_duration='30 minutes', route_type='DROP', vehicle=vehicle)
+        for order, name in enumerate(['Almeria', 'Caraycaray', 'Naval'], start=1):
+            Stop.objects.create(route=inbound, stop_name=name, stop_order=order,
+                                estimated_arrival_time=time(16, order * 10))
+        for route, hour, minute in [(outbound, 7, 0), (outbound, 8, 0), (inbound, 7, 30)]:
+            Schedule.objects.create(route=route, weekday=0, departure_time=time(hour, minute),
+                                    arrival_time=time(hour, minute + 20))
+
+        def departures(after):
+            response = self.client.get(reverse('stop_departures_api'), {
+                'stop': 'caraycaray', 'date': '2026-06-01', 'time': after, 'limit': 2,
+            })
+            return [(row['route_code'], row['departure']) for row in response.json()['departures']]
+
+        self.assertEqual(departures('07:05'), [('TST-1', '07:10'), ('TST-2', '07:40')])
+        self.assertEqual(departures('07:15'), [('TST-2', '07:40'), ('TST-1', '08:10')])
+        self.assertEqual(departures('08:15'), [])
+
+        # Sunday night in UTC is Monday 07:15 in Manila
+        sunday_night = datetime(2026, 5, 31, 23, 15, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=sunday_night):
+            response = self.client.get(reverse('stop_departures_api'), {'stop': 'caraycaray', 'limit': 1})
+        self.assertEqual(response.json()['date'], '2026-06-01')
+        self.assertEqual(response.json()['departures'][0]['departure'], '07:40')
+
+    def test_service_calendar(self):
+        route = make_route(1, make_vehicle(1))
+        Schedule.objects.create(route=route, weekday=0, departure_time=time(7), arrival_time=time(7, 20))
+        Schedule.objects.create(route=route, weekday=5, departure_time=time(9), arrival_time=time(9, 20))
+        # A holiday Monday, and a Saturday running the Monday timetable
+        ServiceException.objects.create(date=date(2026, 6, 1), exception_type='REMOVED')
+        ServiceException.objects.create(date=date(2026, 6, 6), exception_type='ADDED', service_weekday=0)
+
+        def departures(day):
+            response = self.client.get(reverse('stop_departures_api'), {'stop': 'caraycaray', 'date': day,
+                                                                        'time': '06:00'})
+            return [row['departure'] for row in response.json()['departures']]
+
+        self.assertEqual(departures('2026-06-01'), [])
+        self.assertEqual(departures('2026-06-06'), ['07:10'])
+        self.assertEqual(departures('2026-06-08'), ['07:10'])
+        self.assertEqual(departures('2026-06-13'), ['09:10'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class CreateBookingTests(TestCase):
+    """Bookings stop at the vehicle's capacity"""
+
+    def test_capacity(self):
+        route = make_route(1, make_vehicle(1))  # 15 seats
+        stops = list(route.stops.order_by('stop_order'))
+        day = date.today() + timedelta(days=7)
+        schedule = Schedule.objects.create(route=route, weekday=day.weekday(), departure_time=time(7),
+                                           arrival_time=time(7, 30))
+        self.client.force_login(make_student(1).user)
+
+        def book(seats):
+            return self.client.post(reverse('create_booking', args=[route.route_code]), {
+                'schedule': schedule.pk, 'pickup_stop': stops[0].pk, 'dropoff_stop': stops[-1].pk,
+                'booking_date': day.isoformat(), 'seats': seats,
+            })
+
+        book(14)
+        response = book(2)
+        self.assertRedirects(response, reverse('create_booking', args=[route.route_code]),
+                             fetch_redirect_response=False)
+        self.assertIn('Only 1 seat(s) left on this trip.',
+                      [str(message) for message in get_messages(response.wsgi_request)])
+        book(1)
+        self.assertEqual(Booking.objects.aggregate(Sum('seats_booked'))['seats_booked__sum'], 15)
+
+
+class ServiceCalendarTests(TestCase):
+    """Schedules run on their weekday within their calendar, with exceptions adding and removing dates"""
+
+    def test_exceptions(self):
+        route = make_route(1, make_vehicle(1))
+        term = ServiceCalendar.objects.create(name='First term', start_date=date(2026, 6, 1),
+                                              end_date=date(2026, 8, 31))
+        monday = Schedule.objects.create(route=route, weekday=0, departure_time=time(7), arrival_time=time(7, 30),
+                                         calendar=term)
+        # A holiday for the whole network, which the term's own make-up day overrides
+        ServiceException.objects.create(date=date(2026, 6, 8), exception_type='REMOVED')
+        ServiceException.objects.create(date=date(2026, 6, 15), exception_type='REMOVED')
+        ServiceException.objects.create(calendar=term, date=date(2026, 6, 15), exception_type='ADDED')
+        # A Saturday running Monday's timetable
+        ServiceException.objects.create(calendar=term, date=date(2026, 6, 13), exception_type='ADDED',
+                                        service_weekday=0)
+
+        self.assertTrue(runs_on(monday.pk, date(2026, 6, 1)))
+        self.assertFalse(runs_on(monday.pk, date(2026, 5, 25)))
+        self.assertFalse(runs_on(monday.pk, date(2026, 6, 8)))
+        self.assertTrue(runs_on(monday.pk, date(2026, 6, 13)))
+        self.assertTrue(runs_on(monday.pk, date(2026, 6, 15)))
+
+        ServiceException.objects.create(calendar=term, date=date(2026, 6, 22), exception_type='REMOVED')
+        self.assertFalse(runs_on(monday.pk, date(2026, 6, 22)))
+
+    def test_one_exception_per_date(self):
+        term = ServiceCalendar.objects.create(name='First term', start_date=date(2026, 6, 1))
+        ServiceException.objects.create(date=date(2026, 6, 8), exception_type='REMOVED')
+        ServiceException.objects.create(calendar=term, date=date(2026, 6, 8), exception_type='ADDED')
+        for calendar in [None, term]:
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                ServiceException.objects.create(calendar=calendar, date=date(2026, 6, 8), exception_type='ADDED')
+
+
+class ScheduleWeekdayTests(TestCase):
+    """Weekdays are stored as date.weekday() numbers and still read and written as day names"""
+
+    def test_day_names_and_order(self):
+        route = make_route(1, make_vehicle(1))
+        for day in ['SUNDAY', 'tue', 'Monday']:
+            schedule = Schedule(route=route, departure_time=time(7), arrival_time=time(7, 20))
+            schedule.day_of_week = day
+            schedule.save()
+        schedules = list(Schedule.objects.filter(route=route))
+        self.assertEqual([schedule.weekday for schedule in schedules], [0, 1, 6])
+        self.assertEqual([schedule.day_of_week for schedule in schedules], ['MONDAY', 'TUESDAY', 'SUNDAY'])
+        self.assertEqual(schedules[2].get_day_of_week_display(), 'Sunday')
+        self.assertEqual(Schedule.objects.filter(weekday=date(2026, 6, 2).weekday()).get(), schedules[1])
+
+
+class PlaceRegistryTests(TestCase):
+    """Stops fold onto one place per location, known spellings included"""
+
+    def test_aliases_fold_onto_one_place(self):
+        route = make_route(1, make_vehicle(1))
+        caucab = Stop.objects.create(route=route, stop_name='Caucab', stop_order=4, estimated_arrival_time=time(6, 40))
+        spelled_out = Stop.objects.create(route=route, stop_name=' caucab,  ALMERIA', stop_order=5,
+                                          estimated_arrival_time=time(6, 50))
+        self.assertEqual(caucab.place, spelled_out.place)
+        self.assertEqual(caucab.place.name, 'Caucab, Almeria')
+
+    def test_renaming_onto_another_place_is_invalid(self):
+        make_route(1, make_vehicle(1))
+        naval = Place.objects.get(key='naval')
+        naval.name = 'ALMERIA '
+        with self.assertRaisesMessage(ValidationError, 'Another place already has this name'):
+            naval.full_clean()
+        naval.name = 'Naval Port'
+        naval.full_clean()
+
+
+class GTFSTests(TestCase):
+    """A feed imported into an empty network exports the same again"""
+
+    def export(self, directory, name):
+        path = os.path.join(directory, name)
+        export_feed(path)
+        with zipfile.ZipFile(path) as feed:
+            members = {member: feed.read(member).decode() for member in feed.namelist()}
+        # Place and schedule ids are renumbered on import; compare them by order of appearance
+        ids = {}
+        return {member: re.sub(r'\b[PS]\d+\b', lambda match: ids.setdefault(match.group(), f'#{len(ids)}'), text)
+                for member, text in sorted(members.items())}
+
+    def test_round_trip(self):
+        vehicle = make_vehicle(1)
+        first = make_route(1, vehicle)
+        second = make_route(2, make_vehicle(2))
+        Place.objects.filter(key='naval').update(latitude=Decimal('11.560000'), longitude=Decimal('124.400000'))
+        term = ServiceCalendar.objects.create(name='First term', start_date=date(2026, 6, 1),
+                                              end_date=date(2026, 8, 31))
+        Schedule.objects.create(route=first, weekday=0, departure_time=time(7), arrival_time=time(7, 20))
+        Schedule.objects.create(route=first, weekday=2, departure_time=time(16), arrival_time=time(16, 20),
+                                calendar=term)
+        Schedule.objects.create(route=second, weekday=0, departure_time=time(7, 30), arrival_time=time(7, 50))
+
+        with tempfile.TemporaryDirectory() as directory:
+            exported = self.export(directory, 'before.zip')
+            Route.objects.all().delete()
+            Place.objects.all().delete()
+            Vehicle.objects.all().delete()
+            ServiceCalendar.objects.all().delete()
+            import_feed(os.path.join(directory, 'before.zip'))
+            self.assertEqual(self.export(directory, 'after.zip'), exported)
+        self.assertEqual(Route.objects.get(route_code='TST-1').stops.count(), 3)
+
+    def test_reimport_updates_rollups(self):
+        vehicle = make_vehicle(1)
+        coaster = make_vehicle(2)
+        Vehicle.objects.filter(pk=coaster.pk).update(vehicle_type='COASTER')
+        route = make_route(1, vehicle)
+        stops = list(route.stops.order_by('stop_order'))
+        schedule = Schedule.objects.create(route=route, weekday=0, departure_time=time(7), arrival_time=time(7, 20))
+        Booking.objects.create(student=make_student(1), route=route, schedule=schedule, booking_date=date(2026, 6, 1),
+                               pickup_stop=stops[0], dropoff_stop=stops[-1], seats_booked=1,
+                               total_fare=Decimal('50.00'), status='CONFIRMED')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.zip')
+            export_feed(path)
+            # Changed since the export; the import puts the van back on the route
+            vehicle.vehicle_type = 'BUS'
+            vehicle.save()
+            route.vehicle = Vehicle.objects.get(pk=coaster.pk)
+            route.save()
+            refresh()
+            import_feed(path)
+
+        self.assertEqual(list(DailyRevenue.objects.values_list('route_id', 'vehicle_type', 'bookings')),
+                         [(route.pk, 'VAN', 1)])
+        self.assertEqual(list(ReportMonth.objects.filter(is_dirty=True).values_list('month', flat=True)),
+                         [date(2026, 6, 1)])
+
+    def test_reimport_deactivates_stops_past_the_pattern(self):
+        route = make_route(1, make_vehicle(1))
+        Schedule.objects.create(route=route, weekday=0, departure_time=time(7), arrival_time=time(7, 20))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.zip')
+            export_feed(path)
+            extra = Stop.objects.create(route=route, stop_name='Kawayan', stop_order=4,
+                                        estimated_arrival_time=time(6, 40))
+            with self.captureOnCommitCallbacks(execute=True):
+                counts = import_feed(path)
+
+        extra.refresh_from_db()
+        self.assertFalse(extra.is_active)
+        self.assertEqual(counts['stops deactivated'], 1)
+        self.assertEqual([stop['stop_name'] for stop in get_route('TST-1')['stops']],
+                         ['Naval', 'Caraycaray', 'Almeria'])
+        self.assertIsNone(segment_fare(route, route.stops.get(stop_order=1), extra))
+
+
+class GenerateDatasetTests(TestCase):
+    """generate_dataset writes the requested volumes, with the rollups built to match"""
+
+    def test_small_dataset(self):
+        call_command('generate_dataset', students=20, drivers=3, vehicles=3, routes=3, stops=4, departures=2,
+                     days=7, bookings=200, fixes=300, end='2026-06-07', stdout=io.StringIO())
+        self.assertEqual(Student.objects.count(), 20)
+        self.assertEqual(Route.objects.count(), 3)
+        self.assertEqual(Stop.objects.count(), 12)
+        self.assertEqual(Booking.objects.count(), 200)
+        self.assertEqual(VehicleLocation.objects.count(), 300)
+        # The history up to --end, and a week of upcoming trips
+        self.assertFalse(Booking.objects.exclude(booking_date__range=(date(2026, 6, 1), date(2026, 6, 14))).exists())
+        self.assertEqual(DailyRevenue.objects.aggregate(Sum('bookings'))['bookings__sum'], 200)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class AdminDashboardTests(TestCase):
+    """The dashboard snapshot holds exactly the counters the page shows"""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123'))
+
+    def test_counters(self):
+        route = make_route(1, make_vehicle(1))
+        stops = list(route.stops.order_by('stop_order'))
+        schedule = Schedule.objects.create(route=route, weekday=0, departure_time=time(7), arrival_time=time(7, 20))
+        student = make_student(1)
+        for status in ['PENDING', 'PENDING', 'CONFIRMED']:
+            Booking.objects.create(student=student, route=route, schedule=schedule, booking_date=date(2026, 6, 1),
+                                   pickup_stop=stops[0], dropoff_stop=stops[-1], seats_booked=1,
+                                   total_fare=Decimal('50.00'), status=status)
+
+        page = self.client.get(reverse('admin_dashboard')).content.decode()
+        shown = dict(re.findall(r'data-stat="(\w+)">(\d+)<', page))
+        numbers = self.client.get(reverse('admin_dashboard_stats')).json()['numbers']
+        self.assertEqual(shown, {name: str(value) for name, value in numbers.items()})
+        self.assertEqual(numbers, {'total_students': 1, 'total_routes': 1, 'total_bookings': 3,
+                                   'pending_bookings': 2})
+
+
+class RevenueRollupTests(TestCase):
+    """The rollup kept up booking by booking equals one rebuilt from scratch"""
+
+    def rollup(self):
+        fields = ('date', 'route_id', 'driver_id', 'vehicle_type', 'status')
+        return list(DailyRevenue.objects.order_by(*fields).values_list(*fields, 'bookings', 'seats', 'revenue'))
+
+    def assertMatchesRebuild(self):
+        kept = self.rollup()
+        rebuild_revenue()
+        self.assertEqual(kept, self.rollup())
+
+    def test_incremental_equals_rebuild(self):
+        vehicle = make_vehicle(1)
+        route = make_route(1, vehicle)
+        stops = list(route.stops.order_by('stop_order'))
+        schedule = Schedule.objects.create(route=route, weekday=0, departure_time=time(7), arrival_time=time(7, 20))
+        student = make_student(1)
+        trip = Trip.objects.create(route=route, schedule=schedule, driver=make_driver(1, vehicle),
+                                   trip_date=date(2026, 6, 1))
+
+        def book(booking_date, seats, **fields):
+            return Booking.objects.create(student=student, route=route, schedule=schedule, booking_date=booking_date,
+                                          pickup_stop=stops[0], dropoff_stop=stops[-1], seats_booked=seats,
+                                          total_fare=Decimal('50.00') * seats, **fields)
+
+        first = book(date(2026, 6, 1), 2, trip=trip, status='CONFIRMED')
+        second = book(date(2026, 6, 1), 1, trip=trip, status='CONFIRMED')
+        moved = book(date(2026, 6, 1), 3, status='PENDING')
+        self.assertMatchesRebuild()
+        self.assertEqual(DailyRevenue.objects.get(status='CONFIRMED').revenue, Decimal('150.00'))
+
+        first.status = 'CANCELLED'
+        first.save()
+        self.assertMatchesRebuild()
+        update_bookings(Booking.objects.filter(pk=second.pk), status='CANCELLED')
+        self.assertMatchesRebuild()
+        moved.booking_date = date(2026, 6, 8)
+        moved.save()
+        self.assertMatchesRebuild()
+        trip.driver = make_driver(2, vehicle)
+        trip.save()
+        self.assertMatchesRebuild()
+        moved.delete()
+        self.assertMatchesRebuild()
+        self.assertFalse(DailyRevenue.objects.filter(date=date(2026, 6, 8), bookings__gt=0).exists())
+
+    @override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+    def test_driver_earnings(self):
+        vehicle = make_vehicle(1)
+        route = make_route(1, vehicle)
+        stops = list(route.stops.order_by('stop_order'))
+        driver = make_driver(1, vehicle)
+        student = make_student(1)
+        for trip_date, trip_status, statuses in [(date(2026, 6, 29), 'COMPLETED', ['COMPLETED', 'CANCELLED']),
+                                                 (date(2026, 7, 6), 'IN_PROGRESS', ['COMPLETED', 'CONFIRMED'])]:
+            schedule = Schedule.objects.create(route=route, weekday=0, departure_time=time(7 + trip_date.month),
+                                               arrival_time=time(7 + trip_date.month, 20))
+            trip = Trip.objects.create(route=route, schedule=schedule, driver=driver, trip_date=trip_date,
+                                       status=trip_status)
+            for status in statuses:
+                # created_at is today; the service date picks the month
+                Booking.objects.create(student=student, route=route, schedule=schedule, trip=trip,
+                                       booking_date=trip_date, pickup_stop=stops[0], dropoff_stop=stops[-1],
+                                       seats_booked=1, total_fare=Decimal('50.00'), status=status)
+
+        self.client.force_login(driver.user)
+        response = self.client.get(reverse('driver_earnings'))
+        # The July booking counts although an admin completed it before its trip
+        self.assertEqual(response.context['total_earnings'], Decimal('100.00'))
+        self.assertEqual([(row['month'], row['total']) for row in response.context['monthly_earnings']],
+                         [(date(2026, 7, 1), Decimal('50.00')), (date(2026, 6, 1), Decimal('50.00'))])
+        self.assertEqual(self.client.get(reverse('driver_dashboard')).context['total_earnings'], Decimal('100.00'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class DriverTripViewQueryTests(TestCase):
+    """Driver trip pages run a fixed number of queries however many trips and passengers there are"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = make_vehicle(1)
+        cls.route = make_route(1, cls.vehicle)
+        cls.stops = list(cls.route.stops.order_by('stop_order'))
+        cls.driver = make_driver(1, cls.vehicle)
+        cls.students = [make_student(i) for i in range(4)]
+
+    def setUp(self):
+        self.client.force_login(self.driver.user)
+        self.departures = 0
+
+    def add_trips(self, count, trip_date=None, passengers=3):
+        """Trips for the driver, each on its own departure, with a few booked passengers"""
+        trip_date = trip_date or date.today()
+        for _ in range(count):
+            self.departures += 1
+            departure = time(5 + self.departures // 6, self.departures % 6 * 10)
+            schedule = Schedule.objects.create(route=self.route, weekday=trip_date.weekday(),
+                                               departure_time=departure, arrival_time=departure)
+            trip = Trip.objects.create(route=self.route, schedule=schedule, driver=self.driver, trip_date=trip_date)
+            for student in self.students[:passengers]:
+                Booking.objects.create(student=student, route=self.route, schedule=schedule, trip=trip,
+                                       booking_date=trip_date, pickup_stop=self.stops[0], dropoff_stop=self.stops[-1],
+                                       seats_booked=2, total_fare=Decimal('100.00'), status='CONFIRMED')
+
+    def assert_constant_queries(self, url, queries, add_trips):
+        """The page runs exactly `queries` queries with one trip and with many"""
+        add_trips(1)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        add_trips(9)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_dashboard(self):
+        # session, user with profiles and vehicle, today's trips, their passengers, completed trips, earnings
+        response = self.assert_constant_queries(reverse('driver_dashboard'), 6, self.add_trips)
+        self.assertEqual(response.context['today_trips'], 10)
+        self.assertEqual(response.context['today_passengers'], 30)
+        trip = response.context['trips'][0]
+        self.assertEqual((trip.passenger_count, trip.seat_count, len(trip.passengers)), (3, 6, 3))
+        self.assertContains(response, 'Student0 Santos')
+
+    def test_dashboard_leaves_out_cancelled_bookings(self):
+        self.add_trips(1)
+        Booking.objects.filter(student=self.students[0]).update(status='CANCELLED')
+        response = self.client.get(reverse('driver_dashboard'))
+        trip = response.context['trips'][0]
+        self.assertEqual((trip.passenger_count, trip.seat_count, len(trip.passengers)), (2, 4, 2))
+        self.assertEqual(response.context['today_passengers'], 2)
+
+    def test_trips(self):
+        # session, user with profiles, trips with their counts
+        response = self.assert_constant_queries(reverse('driver_trips'), 3, self.add_trips)
+        self.assertEqual(len(response.context['trips']), 10)
+        self.assertEqual(response.context['trips'][0].passenger_count, 3)
+
+    def test_schedule(self):
+        tomorrow = date.today() + timedelta(days=1)
+        # session, user with profiles, upcoming trips with their counts
+        response = self.assert_constant_queries(reverse('driver_schedule'), 3,
+                                                lambda count: self.add_trips(count, tomorrow))
+        self.assertEqual(len(response.context['trips']), 10)
+        self.assertContains(response, '3 booked')
+
+
+class ExportTests(TestCase):
+    """Exports hold the rows of the date range, in date order"""
+
+    def test_date_range(self):
+        route = make_route(1, make_vehicle(1))
+        stops = list(route.stops.order_by('stop_order'))
+        student = make_student(1)
+        schedule = Schedule.objects.create(route=route, weekday=0, departure_time=time(7), arrival_time=time(7, 30))
+        days = [date(2026, 10, day) for day in (14, 12, 13, 11)]
+        for day in days:
+            booking = Booking.objects.create(student=student, route=route, schedule=schedule, booking_date=day,
+                                             pickup_stop=stops[0], dropoff_stop=stops[-1], seats_booked=1,
+                                             total_fare=Decimal('50.00'))
+            payment = Payment.objects.create(booking=booking, amount=Decimal('50.00'), payment_method='CASH')
+            # Late in the day, so a date range must cover the whole of its last day
+            Payment.objects.filter(pk=payment.pk).update(
+                created_at=timezone.make_aware(datetime.combine(day, time(23, 30))))
+
+        bookings = list(EXPORTS['bookings'].rows(date(2026, 10, 12), date(2026, 10, 13)))
+        self.assertEqual([row[5] for row in bookings], [date(2026, 10, 12), date(2026, 10, 13)])
+        payments = list(EXPORTS['payments'].rows(date(2026, 10, 12), date(2026, 10, 13)))
+        self.assertEqual([timezone.localtime(row[-1]).date() for row in payments],
+                         [date(2026, 10, 12), date(2026, 10, 13)])
+        self.assertEqual(len(list(EXPORTS['payments'].rows(start=date(2026, 10, 12)))), 3)
+
+        csv_rows = ''.join(EXPORTS['bookings'].stream('csv', end=date(2026, 10, 11))).splitlines()
+        self.assertEqual(len(csv_rows), 2)
+        self.assertTrue(csv_rows[0].startswith('booking_id,student_id,'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class AdminChangelistQueryTests(TestCase):
+    """Admin changelists stay within a fixed query budget however many rows they list"""
+
+    # Queries per changelist page: session, user, the page, its count, plus prefetches and filter choices
+    BUDGETS = {
+        'student': 5,
+        'driver': 5,
+        'vehicle': 6,
+        'route': 5,
+        'place': 5,
+        'stop': 6,
+        'schedule': 7,
+        'servicecalendar': 5,
+        'serviceexception': 6,
+        'booking': 4,
+        'payment': 5,
+        'dailyrevenue': 5,
+        'vehiclelocation': 4,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, first, count):
+        """`count` of every kind of row the admin lists, numbered from `first`"""
+        for n in range(first, first + count):
+            vehicle = make_vehicle(n)
+            route = make_route(n, vehicle)
+            stops = list(route.stops.order_by('stop_order'))
+            driver = make_driver(n, vehicle)
+            student = make_student(n)
+            calendar = ServiceCalendar.objects.create(name=f'Term {n}', start_date=date(2026, 6, 1),
+                                                      end_date=date(2027, 3, 31))
+            ServiceException.objects.create(calendar=calendar, date=date(2026, 12, 25), exception_type='REMOVED')
+            schedule = Schedule.objects.create(route=route, weekday=0, departure_time=time(6), arrival_time=time(7),
+                                               calendar=calendar)
+            trip = Trip.objects.create(route=route, schedule=schedule, driver=driver, trip_date=date(2026, 10, 19))
+            booking = Booking.objects.create(student=student, route=route, schedule=schedule, trip=trip,
+                                             booking_date=trip.trip_date, pickup_stop=stops[0],
+                                             dropoff_stop=stops[-1], total_fare=Decimal('50.00'), status='CONFIRMED')
+            Payment.objects.create(booking=booking, amount=booking.total_fare, payment_method='CASH')
+            VehicleLocation.objects.create(vehicle=vehicle, latitude=Decimal('11.560000'),
+                                           longitude=Decimal('124.400000'))
+
+    def changelist_queries(self, model, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:myapp_{model}_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return queries, response
+
+    def test_query_budgets(self):
+        self.add_rows(0, 2)
+        before = {model: len(self.changelist_queries(model)[0]) for model in self.BUDGETS}
+        self.add_rows(2, 6)
+        for model, budget in self.BUDGETS.items():
+            with self.subTest(model=model):
+                queries = len(self.changelist_queries(model)[0])
+                self.assertEqual(queries, before[model], 'query count grows with the rows listed')
+                self.assertLessEqual(queries, budget)
+
+    def test_large_tables_skip_full_count(self):
+        self.add_rows(0, 3)
+        for model, rows in (('booking', Booking.objects.count()), ('vehiclelocation', VehicleLocation.objects.count())):
+            with self.subTest(model=model):
+                queries, response = self.changelist_queries(model)
+                self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+                self.assertEqual(response.context['cl'].result_count, rows)
+
+    def test_filtered_changelist_counts_exactly(self):
+        self.add_rows(0, 3)
+        Booking.objects.filter(pk=Booking.objects.first().pk).update(status='CANCELLED')
+        queries, response = self.changelist_queries('booking', status__exact='CONFIRMED')
+        self.assertTrue([query for query in queries if 'COUNT(' in query['sql']])
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES, MEDIA_ROOT=TEST_MEDIA_ROOT,
+                   REPORT_JOBS_IN_PROCESS=False)
+class ReportCubeTests(TestCase):
+    """The report cube follows booking changes through dirty months and serves the reports page alone"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = make_vehicle(1)
+        cls.route = make_route(1, cls.vehicle)
+        cls.stops = list(cls.route.stops.order_by('stop_order'))
+        cls.student = make_student(1)
+        cls.morning = Schedule.objects.create(route=cls.route, weekday=0, departure_time=time(6, 30),
+                                              arrival_time=time(7))
+        cls.evening = Schedule.objects.create(route=cls.route, weekday=0, departure_time=time(17),
+                                              arrival_time=time(17, 30))
+
+    def book(self, booking_date, schedule=None, status='COMPLETED', seats=1):
+        return Booking.objects.create(student=self.student, route=self.route, schedule=schedule or self.morning,
+                                      booking_date=booking_date, pickup_stop=self.stops[0],
+                                      dropoff_stop=self.stops[-1], seats_booked=seats,
+                                      total_fare=Decimal('50.00') * seats, status=status)
+
+    def cube(self):
+        return sorted(ReportCell.objects.values_list('month', 'route_id', 'vehicle_type', 'hour', 'bookings', 'seats',
+                                                     'revenue', 'cancellations'))
+
+    def expected(self):
+        return sorted((cell['month'], cell['route_id'], cell['vehicle_type'], cell['hour'], cell['bookings'],
+                       cell['seats'], cell['revenue'], cell['cancellations']) for cell in cells(Booking.objects.all()))
+
+    def dirty(self):
+        return set(ReportMonth.objects.filter(is_dirty=True).values_list('month', flat=True))
+
+    def test_refresh_rebuilds_dirty_months_only(self):
+        self.book(date(2026, 9, 7))
+        self.book(date(2026, 10, 5), seats=2)
+        self.assertEqual(self.dirty(), {date(2026, 9, 1), date(2026, 10, 1)})
+        self.assertEqual(set(refresh()), {date(2026, 9, 1), date(2026, 10, 1)})
+        self.assertEqual(self.cube(), self.expected())
+        self.assertEqual(self.dirty(), set())
+
+        cancelled = self.book(date(2026, 10, 12), status='CONFIRMED')
+        update_bookings(Booking.objects.filter(pk=cancelled.pk), status='CANCELLED')
+        self.assertEqual(set(refresh()), {date(2026, 10, 1)})
+        self.assertEqual(self.cube(), self.expected())
+        october = ReportCell.objects.get(month=date(2026, 10, 1))
+        self.assertEqual((october.bookings, october.seats, october.revenue, october.cancellations),
+                         (1, 2, Decimal('100.00'), 1))
+
+    def test_booking_and_schedule_moves(self):
+        booking = self.book(date(2026, 9, 7))
+        refresh()
+        booking.booking_date = date(2026, 10, 5)
+        booking.schedule = self.evening
+        booking.save()
+        self.assertEqual(self.dirty(), {date(2026, 9, 1), date(2026, 10, 1)})
+        refresh()
+        self.assertEqual(self.cube(), self.expected())
+
+        self.evening.departure_time = time(18)
+        self.evening.save()
+        self.assertEqual(self.dirty(), {date(2026, 10, 1)})
+        refresh()
+        self.assertEqual(self.cube(), self.expected())
+        self.assertEqual(ReportCell.objects.get().hour, 18)
+
+        # Same date, another departure hour
+        booking.schedule = self.morning
+        booking.save()
+        self.assertEqual(self.dirty(), {date(2026, 10, 1)})
+        refresh()
+        self.assertEqual(ReportCell.objects.get().hour, self.morning.departure_time.hour)
+
+        # Marked once, through the revenue rollup
+        booking.status = 'CANCELLED'
+        with CaptureQueriesContext(connection) as queries:
+            booking.save()
+        self.assertEqual(len([query for query in queries if '"myapp_reportmonth"' in query['sql']]), 1)
+        booking.save()
+        self.assertEqual(self.dirty(), {date(2026, 10, 1)})
+
+        booking.delete()
+        refresh()
+        self.assertEqual(self.cube(), [])
+
+    def test_rebuild(self):
+        self.book(date(2026, 9, 7))
+        self.book(date(2026, 9, 8), schedule=self.evening, status='CANCELLED')
+        ReportCell.objects.all().delete()
+        self.assertEqual(rebuild(), 2)
+        self.assertEqual(self.cube(), self.expected())
+        self.assertEqual(self.dirty(), set())
+
+    def test_reports_page_reads_the_cube_only(self):
+        self.book(date(2026, 9, 7))
+        self.book(date(2026, 10, 5), schedule=self.evening, seats=3)
+        refresh()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123'))
+        params = {'by': 'hour', 'start': '2026-10', 'hour': 'x'}
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin_reports'), params)
+            run_pending()
+            response = self.client.get(reverse('admin_reports'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries if '"myapp_booking"' in query['sql']])
+        self.assertEqual([(row['label'], row['bookings'], row['seats'])
+                          for row in response.context['report']['cube_rows']], [('17:00', 1, 3)])
+        self.assertContains(response, 'Route & Vehicle Breakdown')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES, MEDIA_ROOT=TEST_MEDIA_ROOT,
+                   REPORT_JOBS_IN_PROCESS=False)
+class ReportJobTests(TestCase):
+    """Reports are computed by jobs, one per set of parameters at a time, and shown from their result files"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_page_shows_latest_result_with_its_age(self):
+        response = self.client.get(reverse('admin_reports'))
+        self.assertIsNone(response.context['report'])
+        self.assertTrue(response.context['pending'])
+        self.assertContains(response, 'The report is being generated')
+
+        [job] = run_pending()
+        self.assertEqual(job.status, 'DONE')
+        self.assertTrue(default_storage.exists(job.result_file))
+        response = self.client.get(reverse('admin_reports'))
+        self.assertEqual(response.context['report']['cube_rows'], [])
+        self.assertEqual(response.context['generated_at'], job.finished_at)
+        self.assertFalse(response.context['pending'])
+        self.assertContains(response, 'Generated 0')
+
+    def test_identical_requests_share_one_job(self):
+        for _ in range(3):
+            self.client.get(reverse('admin_reports'), {'by': 'route'})
+        self.client.get(reverse('admin_reports'), {'by': 'hour'})
+        self.assertEqual(ReportJob.objects.filter(status='QUEUED').count(), 2)
+        self.assertEqual(enqueue('admin_reports', {'by': 'route'}), request_report('admin_reports', {'by': 'route'})[1])
+        self.assertEqual(len(run_pending()), 2)
+
+    def test_stale_result_is_refreshed_and_superseded(self):
+        self.client.get(reverse('admin_reports'))
+        [first] = run_pending()
+        self.client.get(reverse('admin_reports'))
+        self.assertEqual(run_pending(), [])
+
+        ReportJob.objects.filter(pk=first.pk).update(finished_at=first.finished_at - timedelta(hours=1))
+        response = self.client.get(reverse('admin_reports'))
+        self.assertIsNotNone(response.context['report'])
+        self.assertTrue(response.context['pending'])
+        [second] = run_pending()
+        self.assertFalse(ReportJob.objects.filter(pk=first.pk).exists())
+        self.assertFalse(default_storage.exists(first.result_file))
+        self.assertTrue(default_storage.exists(second.result_file))
+
+    def test_failed_job_records_its_error(self):
+        job = enqueue('admin_reports', {'by': 'month', 'start': 'not-a-month'})
+        job = run_job(job.pk)
+        self.assertEqual(job.status, 'FAILED')
+        self.assertIn('ValueError', job.error)
+        self.assertIsNone(run_job(job.pk))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class LoadFactorTests(TestCase):
+    """Load factor per departure, from one grouped booking query for all the weeks shown"""
+
+    WEEK = date(2026, 10, 12)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = make_vehicle(1)  # 15 seats
+        cls.route = make_route(1, cls.vehicle)
+        cls.stops = list(cls.route.stops.order_by('stop_order'))
+        cls.student = make_student(1)
+        cls.morning = Schedule.objects.create(route=cls.route, weekday=0, departure_time=time(7),
+                                              arrival_time=time(7, 30))
+        cls.evening = Schedule.objects.create(route=cls.route, weekday=0, departure_time=time(17),
+                                              arrival_time=time(17, 30))
+        for seats, status in ((6, 'CONFIRMED'), (3, 'COMPLETED'), (4, 'CANCELLED')):
+            Booking.objects.create(student=cls.student, route=cls.route, schedule=cls.morning, booking_date=cls.WEEK,
+                                   pickup_stop=cls.stops[0], dropoff_stop=cls.stops[-1], seats_booked=seats,
+                                   total_fare=Decimal('50.00') * seats, status=status)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_build_week(self):
+        build_week(self.WEEK)  # Warm the catalog and service calendar
+        with self.assertNumQueries(1):
+            departures = build_week(self.WEEK)
+        self.assertEqual([(d['date'], d['departure_time'], d['seats'], d['capacity'], d['load_factor'])
+                          for d in departures],
+                         [(self.WEEK, time(7), 9, 15, 0.6), (self.WEEK, time(17), 0, 15, 0.0)])
+        self.assertEqual(heatmap(departures + departures), {(0, 7): (0.6, 2), (0, 17): (0.0, 2)})
+
+    def test_page_is_cached_per_week(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123'))
+        params = {'week': '2026-10-14', 'weeks': '1'}
+        response = self.client.get(reverse('admin_load_factor'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['week'], self.WEEK)
+        self.assertEqual(response.context['departure_count'], 2)
+        self.assertEqual(response.context['full_count'], 0)
+        self.assertEqual(response.context['empty_count'], 1)
+        self.assertEqual([cell and cell['percent'] for cell in response.context['heatmap_rows'][0]['cells']], [60, 0])
+        self.assertContains(response, '9 / 15')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin_load_factor'), params)
+        self.assertFalse([query for query in queries if '"myapp_booking"' in query['sql']])
+
+    def test_cold_page_query_count(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123'))
+        counts = []
+        for weeks in ('4', '12'):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('admin_load_factor'), {'week': '2026-10-14', 'weeks': weeks})
+            counts.append((len(queries), len([query for query in queries if '"myapp_booking"' in query['sql']])))
+        # However many weeks are shown: the session and user, one bookings query, and three queries each
+        # for the service calendar and the catalog
+        self.assertEqual(counts, [(9, 1), (9, 1)])
+
+
+class RoleResolutionTests(TestCase):
+    """The session user arrives with its profiles, so role checks are attribute reads"""
+
+    def test_roles_run_no_queries(self):
+        vehicle = make_vehicle(1)
+        users = {
+            'admin': User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123'),
+            'driver': make_driver(1, vehicle).user,
+            'student': make_student(1).user,
+            None: User.objects.create_user('nobody', password='nobody-pass-123'),
+        }
+        for user_type, user in users.items():
+            with self.subTest(user_type=user_type):
+                with self.assertNumQueries(1):
+                    user = RoleModelBackend().get_user(user.pk)
+                with self.assertNumQueries(0):
+                    self.assertEqual(get_user_type(user), user_type)
+                    self.assertEqual((is_admin(user), is_driver(user), is_student(user)),
+                                     (user_type == 'admin', user_type == 'driver', user_type == 'student'))
+                    if user_type == 'driver':
+                        self.assertEqual(user.driver.vehicle, vehicle)
+
+    @override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+    def test_older_sessions_still_resolve(self):
+        student = make_student(1)
+        self.client.force_login(student.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+
+    def test_passwords_are_checked_once(self):
+        make_student(1)
+        with mock.patch.object(ModelBackend, 'authenticate', autospec=True,
+                               side_effect=ModelBackend.authenticate) as checked:
+            self.assertIsNone(authenticate(username='student1', password='wrong-pass-123'))
+            self.assertEqual(checked.call_count, 1)
+            self.assertEqual(authenticate(username='student1', password='student-pass-123').username, 'student1')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class AccessMiddlewareTests(TestCase):
+    """Each role reaches its own area and is sent home from the others, without redirect loops"""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicle = make_vehicle(1)
+        cls.users = {
+            'admin': User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123'),
+            'driver': make_driver(1, vehicle).user,
+            'student': make_student(1).user,
+        }
+
+    def test_access(self):
+        cases = [
+            ('admin', 'admin_dashboard', 200),
+            ('admin', 'driver_dashboard', 'admin_dashboard'),
+            ('admin', 'dashboard', 'admin_dashboard'),
+            ('admin', 'my_bookings', 'admin_dashboard'),
+            ('driver', 'driver_trips', 200),
+            ('driver', 'admin_dashboard', 'driver_dashboard'),
+            ('driver', 'my_bookings', 'driver_dashboard'),
+            ('student', 'admin_reports', 'dashboard'),
+            ('student', 'driver_schedule', 'dashboard'),
+            ('student', 'routes_list', 200),
+        ]
+        for role, name, expected in cases:
+            with self.subTest(role=role, url=name):
+                self.client.force_login(self.users[role])
+                response = self.client.get(reverse(name))
+                if expected == 200:
+                    self.assertEqual(response.status_code, 200)
+                else:
+                    self.assertRedirects(response, reverse(expected), fetch_redirect_response=False)
+
+    def test_role_comes_from_the_session(self):
+        self.client.force_login(self.users['student'])
+        User.objects.filter(pk=self.users['student'].pk).update(is_staff=True)
+        response = self.client.get(reverse('driver_schedule'))
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_user_without_profile_is_signed_out(self):
+        self.client.force_login(User.objects.create_user('nobody', password='nobody-pass-123'))
+        response = self.client.get(reverse('dashboard'))
+        self.assertRedirects(response, reverse('login'))
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_areas_follow_the_urlconf(self):
+        area = ThreeTierAccessMiddleware(lambda request: None).area
+        routes = {pattern.name: '/' + str(pattern.pattern) for pattern in app_urls.urlpatterns}
+        for name, route in routes.items():
+            with self.subTest(url=name):
+                if name.startswith('admin_'):
+                    self.assertEqual(area(route), 'admin')
+                elif name.startswith('driver_') and name != 'driver_register':
+                    self.assertEqual(area(route), 'driver')
+                elif name in ('login', 'logout') or name.endswith('register'):
+                    self.assertEqual(area(route), 'public')
+                else:
+                    self.assertNotIn(area(route), ('admin', 'driver'))
+        for prefix in AREAS:
+            if prefix not in ('/static/', '/media/', '/admin/'):
+                with self.subTest(prefix=prefix):
+                    self.assertTrue([route for route in routes.values() if route.startswith(prefix)])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES, REQUEST_METRICS_SAMPLE_RATE=1)
+class RequestMetricsTests(TestCase):
+    """Sampled requests are recorded per URL name with their query count"""
+
+    def setUp(self):
+        aggregator.reset()
+
+    def test_requests_are_recorded_per_view(self):
+        route = make_route(1, make_vehicle(1))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('route_detail', args=[route.route_code]))
+        first_queries = len(queries)
+        self.client.get(reverse('route_detail', args=[route.route_code]))
+        self.client.get('/no-such-page/')
+
+        rows = {row['view']: row for row in aggregator.snapshot()}
+        self.assertEqual(set(rows), {'route_detail', '<unmatched>'})
+        self.assertEqual(rows['route_detail']['requests'], 2)
+        self.assertEqual(rows['route_detail']['max_queries'], first_queries)
+        self.assertEqual(sum(rows['route_detail']['histogram'].values()), 2)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_sample_rate_zero_records_nothing(self):
+        self.client.get(reverse('home'))
+        self.assertEqual(aggregator.snapshot(), [])
+
+    def test_endpoint_is_admin_only(self):
+        self.client.force_login(make_student(1).user)
+        self.assertEqual(self.client.get(reverse('admin_performance')).status_code, 302)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123'))
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('admin_performance'))
+        self.assertEqual([row['view'] for row in response.json()['views'] if row['view'] == 'home'], ['home'])
+        self.client.post(reverse('admin_performance'))
+        self.assertEqual([row['view'] for row in aggregator.snapshot()], ['admin_performance'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class NPlusOneTests(TestCase):
+    """Query shapes repeated within a request are caught with their template line"""
+
+    @classmethod
+    def setUpTestData(cls):
+        vehicle = make_vehicle(1)
+        cls.routes = [make_route(n, vehicle) for n in range(8)]
+
+    def render_stop_counts(self, counter):
+        template = Template('<ul>\n{% for route in routes %}<li>{{ route.stops.count }}</li>{% endfor %}\n</ul>')
+        with connection.execute_wrapper(counter):
+            return template.render(Context({'routes': Route.objects.all()}))
+
+    def test_repeats_raise_past_the_threshold(self):
+        with self.assertRaisesMessage(RepeatedQueryError, 'more than 5 times in one request, at <unknown source>, '
+                                                          'line 2 from myapp/tests.py'):
+            self.render_stop_counts(QueryShapeCounter(5, fail=True))
+
+    def test_repeats_are_noted_with_their_count(self):
+        counter = QueryShapeCounter(5)
+        self.render_stop_counts(counter)
+        [(shape, location)] = counter.repeated.items()
+        self.assertIn('COUNT(*)', shape)
+        self.assertEqual(counter.counts[shape], 8)
+        self.assertTrue(location.startswith('<unknown source>, line 2'))
+
+    def test_in_lists_share_a_shape(self):
+        counter = QueryShapeCounter(5)
+        with connection.execute_wrapper(counter):
+            for size in range(1, 9):
+                list(Route.objects.filter(pk__in=[route.pk for route in self.routes[:size]]))
+        self.assertEqual(list(counter.counts.values()), [8])
+
+    @override_settings(DEBUG=True, NPLUSONE_RAISE=False)
+    def test_admin_routes_counts_stops_in_one_query(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123'))
+        with self.assertNoLogs('myapp.nplusone'):
+            response = self.client.get(reverse('admin_routes'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<strong>3</strong>', count=8)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class MetricsTests(TestCase):
+    """Counters from every process file add up in the Prometheus exposition"""
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp(prefix='sakay-test-metrics-')
+        override = override_settings(METRICS_DIR=self.metrics_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_process_files_add_up(self):
+        # Live processes, so their files are not archived
+        workers = [metrics.ProcessFile(f'{self.metrics_dir}/{pid}.db') for pid in (os.getppid(), os.getpid())]
+        workers[0].add('sakay_gps_fixes_total', 3)
+        workers[1].add('sakay_gps_fixes_total', 4)
+        workers[1].add('sakay_trip_transitions_total{status="COMPLETED"}', 1)
+        for n in range(2000):  # Grows past the initial file size
+            workers[1].add(f'sakay_trip_transitions_total{{status="S{n}"}}', 1)
+        self.assertEqual(metrics.collect()['sakay_gps_fixes_total'], 7)
+
+        # A worker reopening its file carries on from it
+        metrics.ProcessFile(f'{self.metrics_dir}/{os.getppid()}.db').add('sakay_gps_fixes_total', 1)
+        metrics.observe('sakay_http_request_duration_seconds', 0.02, view='home')
+        metrics.observe('sakay_http_request_duration_seconds', 3, view='home')
+        lines = metrics.exposition().splitlines()
+        self.assertIn('# TYPE sakay_gps_fixes_total counter', lines)
+        self.assertIn('sakay_gps_fixes_total 8', lines)
+        self.assertIn('sakay_bookings_created_total 0', lines)
+        self.assertIn('sakay_trip_transitions_total{status="COMPLETED"} 1', lines)
+        buckets = [line for line in lines if line.startswith('sakay_http_request_duration_seconds_bucket')]
+        self.assertEqual(buckets[0], 'sakay_http_request_duration_seconds_bucket{view="home",le="0.005"} 0')
+        self.assertEqual(buckets[2], 'sakay_http_request_duration_seconds_bucket{view="home",le="0.025"} 1')
+        self.assertEqual(buckets[-1], 'sakay_http_request_duration_seconds_bucket{view="home",le="+Inf"} 2')
+        self.assertIn('sakay_http_request_duration_seconds_count{view="home"} 2', lines)
+
+    def test_exited_processes_are_archived(self):
+        def exited_worker(fixes):
+            process = subprocess.Popen(['true'])
+            process.wait()
+            metrics.ProcessFile(f'{self.metrics_dir}/{process.pid}.db').add('sakay_gps_fixes_total', fixes)
+
+        metrics.inc('sakay_gps_fixes_total')
+        exited_worker(2)
+        exited_worker(3)
+        self.assertEqual(metrics.collect()['sakay_gps_fixes_total'], 6)
+        exited_worker(4)
+        self.assertEqual(metrics.collect()['sakay_gps_fixes_total'], 10)
+        self.assertEqual(sorted(name for name in os.listdir(self.metrics_dir) if name.endswith('.db')),
+                         [f'{os.getpid()}.db', 'archive.db'])
+
+    def test_threads_record_into_files_of_their_own(self):
+        def record(together):
+            metrics.inc('sakay_gps_fixes_total')
+            together.wait()  # All four hold a file at once
+            for _ in range(999):
+                metrics.inc('sakay_gps_fixes_total')
+
+        for _ in range(2):  # The second round takes over the files of the first
+            together = threading.Barrier(4)
+            threads = [threading.Thread(target=record, args=(together,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(metrics.collect()['sakay_gps_fixes_total'], 8000)
+        self.assertEqual(len([name for name in os.listdir(self.metrics_dir) if name.endswith('.db')]), 4)
+
+    def test_business_events_are_counted(self):
+        vehicle = make_vehicle(1)
+        route = make_route(1, vehicle)
+        stops = list(route.stops.order_by('stop_order'))
+        driver = make_driver(1, vehicle)
+        student = make_student(1)
+        schedule = Schedule.objects.create(route=route, weekday=date.today().weekday(), departure_time=time(7),
+                                           arrival_time=time(7, 30))
+        trip = Trip.objects.create(route=route, schedule=schedule, driver=driver, trip_date=date.today())
+
+        def book():
+            return Booking.objects.create(student=student, route=route, schedule=schedule, trip=trip,
+                                          booking_date=date.today(), pickup_stop=stops[0], dropoff_stop=stops[-1],
+                                          seats_booked=1, total_fare=Decimal('50.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bookings = [book() for _ in range(4)]
+            update_bookings(Booking.objects.filter(pk=bookings[0].pk), status='CANCELLED')
+            bookings[1].status = 'CANCELLED'
+            bookings[1].save()
+            bookings[1].save()
+            VehicleLocation.objects.create(vehicle=vehicle, latitude=Decimal('11.56'), longitude=Decimal('124.40'))
+            # Rolled back, so not counted
+            with self.assertRaises(ValueError), transaction.atomic():
+                book()
+                raise ValueError
+
+            self.client.force_login(driver.user)
+            self.client.get(reverse('driver_start_trip', args=[trip.pk]))
+            trip.refresh_from_db()
+            trip.cancel()
+
+        samples = metrics.collect()
+        self.assertEqual(samples['sakay_bookings_created_total'], 4)
+        self.assertEqual(samples['sakay_bookings_cancelled_total'], 4)
+        self.assertEqual(samples['sakay_gps_fixes_total'], 1)
+        self.assertEqual(samples['sakay_trip_transitions_total{status="IN_PROGRESS"}'], 1)
+        self.assertEqual(samples['sakay_trip_transitions_total{status="CANCELLED"}'], 1)
+        self.assertEqual(samples['sakay_http_request_duration_seconds_count{view="driver_start_trip"}'], 1)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_endpoint(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape-token'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(response, 'sakay_http_request_duration_seconds_count{view="metrics"} 1')
+
+    def test_endpoint_without_a_token_is_for_admins(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(make_student(1).user)
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin-pass-123'))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_timed(self):
+        aggregator.reset()
+        self.client.get(reverse('home'))
+        self.assertEqual(metrics.collect()['sakay_http_request_duration_seconds_count{view="home"}'], 1)
+        self.assertEqual(aggregator.snapshot(), [])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, STORAGES=TEST_STORAGES)
+class PageCacheTests(TestCase):
+    """Anonymous visitors get cached public pages that follow the catalog; signed-in users get them rendered"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.route = make_route(1, make_vehicle(1))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_cached(self):
+        url = reverse('routes_list') + '?search=Naval'
+        first = self.client.get(url)
+        self.assertContains(first, 'Naval to Almeria 1')
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('no-cache', second['Cache-Control'])
+        self.assertIn('Cookie', second['Vary'])
+
+        # Another query string is another page
+        self.assertNotContains(self.client.get(reverse('routes_list') + '?search=Kawayan'), 'Naval to Almeria 1')
+
+    def test_only_the_parameters_the_view_reads_make_a_page(self):
+        url = reverse('routes_list')
+        self.client.get(url, {'search': 'Naval'})
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url, {'search': ' Naval ', 'type': ''}), 'Naval to Almeria 1')
+        for query in ({'search': 'Naval', 'utm_source': 'feed'}, {'search': ['Naval', 'Almeria']},
+                      {'search': 'N' * 101}, {'search': 'Nowhere'}, {'type': 'JUNK'}):
+            self.assertNotIn('ETag', self.client.get(url, query))
+
+    def test_browsers_revalidate(self):
+        url = reverse('route_detail', args=[self.route.route_code])
+        response = self.client.get(url)
+        revalidated = self.client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b'')
+        revalidated = self.client.get(url, headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_catalog_changes_show_at_once(self):
+        url = reverse('route_detail', args=[self.route.route_code])
+        etag = self.client.get(url)['ETag']
+        self.route.route_name = 'Naval to Kawayan'
+        self.route.save()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertContains(response, 'Naval to Kawayan')
+
+    def test_signed_in_users_get_the_dynamic_page(self):
+        self.client.get(reverse('about'))
+        self.client.force_login(make_student(1).user)
+        response = self.client.get(reverse('about'))
+        self.assertNotIn('ETag', response)
+        self.assertContains(response, 'Logout')
+
+    def test_each_visitor_gets_their_own_csrf_token(self):
+        self.client.get(reverse('contact'))
+        visitor = Client(enforce_csrf_checks=True)
+        response = visitor.get(reverse('contact'))
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', response.content.decode()).group(1)
+        self.assertNotIn('{{csrf-token}}', response.content.decode())
+        response = visitor.post(reverse('contact'), {'csrfmiddlewaretoken': token}, follow=True)
+        self.assertContains(response, 'Thank you for contacting us!')
@@ -0,0 +1,99 @@
+# timetable.py
+"""
+"Next departures from this stop" index.
+
+For every place (stops sharing a Place across routes) and day of the week, the departure times of every trip passing through it are
+precomputed into a sorted array, so a lookup is one binary search plus a
+slice. Times are the schedule's departure plus the stop's offset from the
+route's first stop. Built from the cached catalog and memoized per catalog
+version.
+
+A date's departures come from the arrays of the weekdays its running
+schedules keep (see service_calendar.py), so an added date runs the
+timetable it borrows and a removed one has none; entries of schedules not
+running that date are skipped.
+"""
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import islice
+from operator import itemgetter
+
+from .catalog import get_catalog, memoize_on_version
+from .journeys import minutes_of_day, place_key
+
+
+class TimetableIndex:
+
+    def __init__(self, catalog):
+        self.stop_place = {}   # Stop.id -> place key
+        self.names = {}        # place key -> display name
+        self.aliases = {}      # stop name key -> place key
+        self.schedule_weekday = {}  # Schedule.id -> weekday
+        rows = {}
+
+        for route in catalog['routes']:
+            stops = route['stops']
+            if len(stops) < 2:
+                continue
+            first = minutes_of_day(stops[0]['estimated_arrival_time'])
+            for schedule in route['schedules']:
+                self.schedule_weekday[schedule['id']] = schedule['weekday']
+            for stop in stops:
+                key = stop['place_key']
+                self.stop_place[stop['id']] = key
+                self.names.setdefault(key, stop['place_name'])
+                self.aliases.setdefault(place_key(stop['stop_name']), key)
+
+            # The terminal stop has no departures
+            for stop in stops[:-1]:
+                key = self.stop_place[stop['id']]
+                offset = (minutes_of_day(stop['estimated_arrival_time']) - first) % (24 * 60)
+                for schedule in route['schedules']:
+                    departure = minutes_of_day(schedule['departure_time']) + offset
+                    rows.setdefault((key, schedule['weekday']), []).append((departure, {
+                        'route_code': route['route_code'],
+                        'route_name': route['route_name'],
+                        'destination': route['destination'],
+                        'schedule_id': schedule['id'],
+                        'stop_id': stop['id'],
+                        'stop_name': stop['stop_name'],
+                        'departure': f'{(departure // 60) % 24:02d}:{departure % 60:02d}',
+                    }))
+
+        self.times = {}
+        self.entries = {}
+        for key, departures in rows.items():
+            departures.sort(key=lambda row: row[0])
+            self.times[key] = array('H', (row[0] for row in departures))
+            self.entries[key] = [row[1] for row in departures]
+
+    def resolve(self, value):
+        """Place key for a Stop id or a stop name, or None"""
+        value = str(value).strip()
+        if value.isdigit():
+            return self.stop_place.get(int(value))
+        key = place_key(value)
+        return key if key in self.names else self.aliases.get(key)
+
+    def next_departures(self, place, running, after, limit=5):
+        """
+        Next departures from a place at or after `after` (minutes after
+        midnight), among the running schedule ids of a date
+        """
+        weekdays = {self.schedule_weekday[schedule_id] for schedule_id in running
+                    if schedule_id in self.schedule_weekday}
+        streams = []
+        for weekday in sorted(weekdays):
+            times = self.times.get((place, weekday))
+            if times is None:
+                continue
+            entries = self.entries[(place, weekday)]
+            streams.append(islice(((times[i], entries[i]) for i in range(bisect_left(times, after), len(times))
+                                   if entries[i]['schedule_id'] in running), limit))
+        return [entry for _, entry in islice(merge(*streams, key=itemgetter(0)), limit)]
+
+
+def get_timetable():
+    """Timetable index for the current catalog version"""
+    return memoize_on_version('timetable', lambda: TimetableIndex(get_catalog()))
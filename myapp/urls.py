@@ -34,6 +34,9 @@ path('register/driver/', views.driver_register, name='driver_register'),
     path('live-map/', views.live_map, name='live_map'),
     path('api/vehicle-location/<int:vehicle_id>/', views.get_vehicle_location, name='get_vehicle_location'),
     path('api/update-location/', views.update_vehicle_location, name='update_vehicle_location'),
+    path('api/journeys/', views.journey_planner_api, name='journey_planner_api'),
+    path('api/departures/', views.stop_departures_api, name='stop_departures_api'),
+    path('api/stops/nearest/', views.nearest_stops_api, name='nearest_stops_api'),
 
     # ============ DRIVER ROUTES ============
     path('driver/dashboard/', views.driver_dashboard, name='driver_dashboard'),
@@ -47,6 +50,8 @@ path('register/driver/', views.driver_register, name='driver_register'),
 
     # ============ ADMIN ROUTES (RENAMED) ============
     path('dashboard/admin/', views.admin_dashboard, name='admin_dashboard'),
+    path('dashboard/admin/stats/', views.admin_dashboard_stats, name='admin_dashboard_stats'),
+    path('dashboard/admin/export/<str:dataset>/', views.admin_export, name='admin_export'),
 
     # Bookings (Admin)
     path('dashboard/admin/bookings/', views.admin_bookings, name='admin_bookings'),
@@ -71,10 +76,16 @@ path('register/driver/', views.driver_register, name='driver_register'),
     # Trips (Admin)
     path('dashboard/admin/trips/', views.admin_trips, name='admin_trips'),
     path('dashboard/admin/trips/<int:trip_id>/assign/', views.admin_assign_driver, name='admin_assign_driver'),
+    path('dashboard/admin/trips/<int:trip_id>/cancel/', views.admin_cancel_trip, name='admin_cancel_trip'),
 
     # Reports & Settings (Admin)
     path('dashboard/admin/reports/', views.admin_reports, name='admin_reports'),
+    path('dashboard/admin/reports/load-factor/', views.admin_load_factor, name='admin_load_factor'),
+    path('dashboard/admin/performance/', views.admin_performance, name='admin_performance'),
     path('dashboard/admin/settings/', views.admin_settings, name='admin_settings'),
 
     path('terms/', views.terms, name='terms'),
+
+    # ============ MONITORING ============
+    path('metrics', views.metrics_endpoint, name='metrics'),
 ]
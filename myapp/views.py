@@ -1,46 +1,71 @@
 # views.py - Complete and Fixed Implementation
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login, logout, authenticate, update_session_auth_hash
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q, Sum, Count
+from django.http import HttpResponse, JsonResponse, Http404, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Sum, Count, Q, Prefetch
+from django.db.models.functions import Coalesce
 from django.views.decorators.csrf import csrf_exempt
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
 from .models import (Route, Booking, Student, Schedule, Stop, Payment, Vehicle, 
-                     VehicleLocation, Driver, Trip)
+                     VehicleLocation, Driver, Trip, DailyRevenue)
 from .forms import StudentRegistrationForm, StudentProfileUpdateForm, StudentPasswordChangeForm, DriverRegistrationForm
+from .fares import get_fare_matrix, segment_fare
+from .catalog import get_catalog, get_route
+from .search import route_index
+from .journeys import get_journey_graph
+from .timetable import get_timetable
+from .places import get_place_index
+from .dashboard import get_admin_snapshot, SNAPSHOT_TTL
+from .revenue import update_bookings
+from .exports import EXPORTS, FORMATS
+from .cube import DIMENSIONS, freshness
+from .report_jobs import request_report, load_result
+from .load_factor import week_of, get_weeks, heatmap
+from .service_calendar import running_schedule_ids, runs_on
+from .instrumentation import aggregator, LATENCY_BUCKETS
+from .metrics import exposition
+from .page_cache import cache_anonymous_page
+from .roles import is_admin, is_driver, is_student, get_user_type
 from datetime import datetime, date, timedelta
 import json
 
 
 # ================== HELPER FUNCTIONS ==================
+@cache_anonymous_page
 def terms(request):
     """Terms and conditions page"""
     return render(request, 'myapp/terms.html')
 
-def is_admin(user):
-    """Check if user is admin/staff"""
-    return user.is_staff or user.is_superuser
-
-def is_driver(user):
-    """Check if user is a driver"""
-    return hasattr(user, 'driver')
-
-def is_student(user):
-    """Check if user is a student"""
-    return hasattr(user, 'student')
-
-def get_user_type(user):
-    """Get the type of user"""
-    if is_admin(user):
-        return 'admin'
-    elif is_driver(user):
-        return 'driver'
-    elif is_student(user):
-        return 'student'
-    return None
-
-
+def with_passengers(trips, bookings=False):
+    """
+    Trips with route, vehicle and schedule joined and passenger_count and
+    seat_count annotated (cancelled bookings excluded). With bookings=True
+    the riding bookings are prefetched as trip.passengers, so listing them
+    costs one query for all trips.
+    """
+    riding = ~Q(bookings__status='CANCELLED')
+    trips = trips.select_related('route__vehicle', 'schedule').annotate(
+        passenger_count=Count('bookings', filter=riding),
+        seat_count=Coalesce(Sum('bookings__seats_booked', filter=riding), 0),
+    )
+    if bookings:
+        trips = trips.prefetch_related(Prefetch(
+            'bookings',
+            queryset=Booking.objects.exclude(status='CANCELLED').select_related(
+                'student__user', 'pickup_stop', 'dropoff_stop'
+            ).order_by('pickup_stop__stop_order', 'created_at'),
+            to_attr='passengers',
+        ))
+    return trips
+
+
+@cache_anonymous_page
 def home(request):
     """Home page view - public landing page"""
     # If user is authenticated, redirect to their dashboard
@@ -56,57 +81,66 @@ def home(request):
         return redirect('dashboard')
     
     # Show public home page for non-authenticated users
+    routes = get_catalog()['routes']
     context = {
-        'total_routes': Route.objects.filter(is_active=True).count(),
-        'featured_routes': Route.objects.filter(is_active=True)[:6],
+        'total_routes': len(routes),
+        'featured_routes': routes[:6],
         'today': date.today(),
     }
     return render(request, 'myapp/home.html', context)
 
 
+@cache_anonymous_page
 def about(request):
     """About page view"""
     return render(request, 'myapp/about.html')
 
 
+@cache_anonymous_page(params=('type', 'search'))
 def routes_list(request):
     """Display all available routes"""
-    routes = Route.objects.filter(is_active=True).select_related('vehicle')
+    routes = get_catalog()['routes']
     
-    route_type = request.GET.get('type')
+    route_type = request.GET.get('type', '').strip()
     if route_type:
-        routes = routes.filter(route_type=route_type)
+        routes = [route for route in routes if route['route_type'] == route_type]
     
-    search_query = request.GET.get('search')
+    search_query = request.GET.get('search', '').strip()
     if search_query:
-        routes = routes.filter(
-            Q(route_name__icontains=search_query) |
-            Q(origin__icontains=search_query) |
-            Q(destination__icontains=search_query)
-        )
+        # Ranked ids from the search index, rendered from the cached catalog
+        allowed = {route['id'] for route in routes}
+        by_id = get_catalog()['by_id']
+        routes = [by_id[route_id] for route_id in route_index().search(search_query, route_type=route_type or None)
+                  if route_id in allowed]
     
     context = {
         'routes': routes,
         'route_type': route_type,
         'search_query': search_query,
     }
-    return render(request, 'myapp/routes_list.html', context)
+    response = render(request, 'myapp/routes_list.html', context)
+    if not routes and (route_type or search_query):
+        # Not worth a place in the page cache, and there is no end to searches that find nothing
+        patch_cache_control(response, no_store=True)
+    return response
 
 
+@cache_anonymous_page
 def route_detail(request, route_code):
     """Display route details with stops and schedules"""
-    route = get_object_or_404(Route, route_code=route_code, is_active=True)
-    stops = route.stops.order_by('stop_order')
-    schedules = route.schedules.filter(is_active=True).order_by('day_of_week', 'departure_time')
+    route = get_route(route_code)
+    if route is None:
+        raise Http404('No active route with that code.')
     
     context = {
         'route': route,
-        'stops': stops,
-        'schedules': schedules,
+        'stops': route['stops'],
+        'schedules': route['schedules'],
     }
     return render(request, 'myapp/route_details.html', context)
 
 
+@cache_anonymous_page
 def contact(request):
     """Contact page"""
     if request.method == 'POST':
@@ -305,29 +339,50 @@ def create_booking(request, route_code):
             seats = int(request.POST.get('seats', 1))
             
             schedule = get_object_or_404(Schedule, id=schedule_id, route=route)
-            pickup_stop = get_object_or_404(Stop, id=pickup_stop_id, route=route)
-            dropoff_stop = get_object_or_404(Stop, id=dropoff_stop_id, route=route)
+            pickup_stop = get_object_or_404(Stop, id=pickup_stop_id, route=route, is_active=True)
+            dropoff_stop = get_object_or_404(Stop, id=dropoff_stop_id, route=route, is_active=True)
             
-            total_fare = route.fare * seats
+            travel_date = datetime.strptime(booking_date, '%Y-%m-%d').date()
+            if not runs_on(schedule.id, travel_date):
+                messages.error(request, 'There is no service for this schedule on the selected date.')
+                return redirect('create_booking', route_code=route.route_code)
             
-            booking = Booking.objects.create(
-                student=student,
-                route=route,
-                schedule=schedule,
-                pickup_stop=pickup_stop,
-                dropoff_stop=dropoff_stop,
-                booking_date=booking_date,
-                seats_booked=seats,
-                total_fare=total_fare,
-                status='PENDING'
-            )
+            fare = segment_fare(route, pickup_stop, dropoff_stop)
+            if fare is None:
+                messages.error(request, 'Drop-off stop must come after the pickup stop.')
+                return redirect('create_booking', route_code=route.route_code)
+            total_fare = fare * seats
             
-            Payment.objects.create(
-                booking=booking,
-                amount=total_fare,
-                payment_method='CASH',
-                payment_status='PENDING'
-            )
+            with transaction.atomic():
+                # Bookings of one schedule queue here, so two cannot both take the last seats
+                schedule = Schedule.objects.select_for_update().get(pk=schedule.pk)
+                seats_taken = Booking.objects.filter(
+                    schedule=schedule,
+                    booking_date=travel_date,
+                    status__in=['PENDING', 'CONFIRMED']
+                ).aggregate(Sum('seats_booked'))['seats_booked__sum'] or 0
+                if seats_taken + seats > route.vehicle.capacity:
+                    messages.error(request, f'Only {max(route.vehicle.capacity - seats_taken, 0)} seat(s) left on this trip.')
+                    return redirect('create_booking', route_code=route.route_code)
+                
+                booking = Booking.objects.create(
+                    student=student,
+                    route=route,
+                    schedule=schedule,
+                    pickup_stop=pickup_stop,
+                    dropoff_stop=dropoff_stop,
+                    booking_date=booking_date,
+                    seats_booked=seats,
+                    total_fare=total_fare,
+                    status='PENDING'
+                )
+                
+                Payment.objects.create(
+                    booking=booking,
+                    amount=total_fare,
+                    payment_method='CASH',
+                    payment_status='PENDING'
+                )
             
             messages.success(request, f'Booking created successfully! Booking ID: {booking.booking_id}')
             return redirect('booking_detail', booking_id=booking.booking_id)
@@ -338,13 +393,15 @@ def create_booking(request, route_code):
         except Exception as e:
             messages.error(request, f'Error creating booking: {str(e)}')
     
-    stops = route.stops.order_by('stop_order')
+    stops = route.stops.filter(is_active=True).order_by('stop_order')
     schedules = route.schedules.filter(is_active=True)
+    fare_matrix = get_fare_matrix(route)
     
     context = {
         'route': route,
         'stops': stops,
         'schedules': schedules,
+        'fare_matrix': {'stop_ids': fare_matrix.stop_ids, 'fares': fare_matrix.fares.tolist()},
     }
     return render(request, 'myapp/create_booking.html', context)
 
@@ -656,6 +713,107 @@ def update_vehicle_location(request):
     })
 
 
+def journey_planner_api(request):
+    """API endpoint for multi-route journeys between two stops"""
+    graph = get_journey_graph()
+    origin = graph.resolve(request.GET.get('from', ''))
+    destination = graph.resolve(request.GET.get('to', ''))
+    if origin is None or destination is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Unknown origin or destination stop'
+        }, status=400)
+    if origin == destination:
+        return JsonResponse({
+            'success': False,
+            'message': 'Origin and destination are the same stop'
+        }, status=400)
+    
+    try:
+        now = timezone.localtime()
+        travel_date = datetime.strptime(request.GET['date'], '%Y-%m-%d').date() if request.GET.get('date') else now.date()
+        depart_at = datetime.strptime(request.GET['time'], '%H:%M').time() if request.GET.get('time') else now.time()
+        max_transfers = min(int(request.GET.get('max_transfers', 2)), 5)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid date, time or max_transfers'
+        }, status=400)
+    
+    journeys = graph.earliest_arrivals(
+        origin,
+        destination,
+        running_schedule_ids(travel_date),
+        depart_at.hour * 60 + depart_at.minute,
+        max(max_transfers, 0),
+    )
+    return JsonResponse({
+        'success': True,
+        'from': graph.nodes[origin],
+        'to': graph.nodes[destination],
+        'date': travel_date.isoformat(),
+        'journeys': [graph.describe(legs) for legs in journeys],
+    })
+
+
+def stop_departures_api(request):
+    """API endpoint for the next departures from a stop across all routes"""
+    timetable = get_timetable()
+    place = timetable.resolve(request.GET.get('stop', ''))
+    if place is None:
+        return JsonResponse({
+            'success': False,
+            'message': 'Unknown stop'
+        }, status=400)
+    
+    try:
+        now = timezone.localtime()
+        travel_date = datetime.strptime(request.GET['date'], '%Y-%m-%d').date() if request.GET.get('date') else now.date()
+        after = datetime.strptime(request.GET['time'], '%H:%M').time() if request.GET.get('time') else now.time()
+        limit = min(max(int(request.GET.get('limit', 5)), 1), 50)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid date, time or limit'
+        }, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'stop': timetable.names[place],
+        'date': travel_date.isoformat(),
+        'departures': timetable.next_departures(
+            place,
+            running_schedule_ids(travel_date),
+            after.hour * 60 + after.minute,
+            limit,
+        ),
+    })
+
+
+def nearest_stops_api(request):
+    """API endpoint for the stops nearest to a coordinate"""
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lng'])
+        limit = min(max(int(request.GET.get('limit', 5)), 1), 50)
+        radius_km = min(max(float(request.GET.get('radius', 5)), 0.1), 50)
+    except (KeyError, ValueError):
+        return JsonResponse({
+            'success': False,
+            'message': 'lat and lng are required; limit and radius must be numbers'
+        }, status=400)
+    
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({
+            'success': False,
+            'message': 'Coordinates out of range'
+        }, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'places': get_place_index().nearest(latitude, longitude, limit, radius_km),
+    })
+
 # ================== DRIVER VIEWS (CONTINUED IN NEXT PART) ==================
 # ================== DRIVER VIEWS ==================
 
@@ -674,17 +832,16 @@ def driver_dashboard(request):
         return redirect('login')
     
     today = date.today()
-    trips = Trip.objects.filter(driver=driver, trip_date=today)
+    trips = list(with_passengers(Trip.objects.filter(driver=driver, trip_date=today), bookings=True))
     
-    today_trips = trips.count()
-    today_passengers = sum(trip.bookings.count() for trip in trips)
+    today_trips = len(trips)
+    today_passengers = sum(trip.passenger_count for trip in trips)
     completed_trips = Trip.objects.filter(driver=driver, status='COMPLETED').count()
     
-    total_earnings = Booking.objects.filter(
-        trip__driver=driver,
-        trip__status='COMPLETED',
+    total_earnings = DailyRevenue.objects.filter(
+        driver=driver,
         status='COMPLETED'
-    ).aggregate(Sum('total_fare'))['total_fare__sum'] or 0
+    ).aggregate(Sum('revenue'))['revenue__sum'] or 0
     
     context = {
         'driver': driver,
@@ -694,7 +851,7 @@ def driver_dashboard(request):
         'completed_trips': completed_trips,
         'total_earnings': total_earnings,
     }
-    return render(request, 'myapp/driver_dashboard.html', context)
+    return render(request, 'myapp/driver/driver_dashboard.html', context)
 
 
 @login_required
@@ -710,7 +867,7 @@ def driver_trips(request):
         return redirect('login')
     
     status_filter = request.GET.get('status')
-    trips = Trip.objects.filter(driver=driver).order_by('-trip_date')
+    trips = with_passengers(Trip.objects.filter(driver=driver)).order_by('-trip_date')
     
     if status_filter:
         trips = trips.filter(status=status_filter)
@@ -720,7 +877,7 @@ def driver_trips(request):
         'trips': trips,
         'status_filter': status_filter,
     }
-    return render(request, 'myapp/driver_trips.html', context)
+    return render(request, 'myapp/driver/driver_trips.html', context)
 
 
 @login_required
@@ -762,7 +919,7 @@ def driver_start_trip(request, trip_id):
         trip.save()
         
         # Update all bookings to confirmed
-        trip.bookings.filter(status='PENDING').update(status='CONFIRMED')
+        update_bookings(trip.bookings.filter(status='PENDING'), status='CONFIRMED')
         
         messages.success(request, 'Trip started successfully!')
     else:
@@ -791,7 +948,7 @@ def driver_complete_trip(request, trip_id):
         trip.save()
         
         # Update all bookings to completed
-        trip.bookings.filter(status='CONFIRMED').update(status='COMPLETED')
+        update_bookings(trip.bookings.filter(status='CONFIRMED'), status='COMPLETED')
         
         messages.success(request, 'Trip completed successfully!')
     else:
@@ -812,10 +969,10 @@ def driver_schedule(request):
         messages.error(request, 'Driver profile not found.')
         return redirect('login')
     
-    trips = Trip.objects.filter(
+    trips = with_passengers(Trip.objects.filter(
         driver=driver,
         trip_date__gte=date.today()
-    ).order_by('trip_date', 'schedule__departure_time')
+    )).order_by('trip_date', 'schedule__departure_time')
     
     context = {
         'driver': driver,
@@ -837,21 +994,17 @@ def driver_earnings(request):
         return redirect('login')
     
     completed_trips = Trip.objects.filter(driver=driver, status='COMPLETED')
-    total_earnings = Booking.objects.filter(
-        trip__driver=driver,
-        trip__status='COMPLETED',
-        status='COMPLETED'
-    ).aggregate(Sum('total_fare'))['total_fare__sum'] or 0
+    # Read from the daily rollup rather than the booking table: the completed
+    # bookings of the driver's trips, by service month. The rollup has no trip
+    # status, so a booking counts once completed, even if its trip is not.
+    earnings = DailyRevenue.objects.filter(driver=driver, status='COMPLETED')
+    total_earnings = earnings.aggregate(Sum('revenue'))['revenue__sum'] or 0
     
     from django.db.models.functions import TruncMonth
-    monthly_earnings = Booking.objects.filter(
-        trip__driver=driver,
-        trip__status='COMPLETED',
-        status='COMPLETED'
-    ).annotate(
-        month=TruncMonth('created_at')
+    monthly_earnings = earnings.annotate(
+        month=TruncMonth('date')
     ).values('month').annotate(
-        total=Sum('total_fare')
+        total=Sum('revenue')
     ).order_by('-month')
     
     context = {
@@ -885,33 +1038,64 @@ def driver_profile(request):
 @user_passes_test(is_admin)
 def admin_dashboard(request):
     """Admin Dashboard"""
-    total_students = Student.objects.filter(is_active=True).count()
-    total_drivers = Driver.objects.filter(is_active=True).count()
-    total_routes = Route.objects.filter(is_active=True).count()
-    total_bookings = Booking.objects.count()
-    pending_bookings = Booking.objects.filter(status='PENDING').count()
-    recent_bookings = Booking.objects.select_related('student__user', 'route').order_by('-created_at')[:10]
-    
-    today_trips = Trip.objects.filter(trip_date=date.today())
-    
-    # Revenue statistics
-    total_revenue = Booking.objects.filter(
-        status='COMPLETED'
-    ).aggregate(Sum('total_fare'))['total_fare__sum'] or 0
-    
+    snapshot = get_admin_snapshot()
     context = {
-        'total_students': total_students,
-        'total_drivers': total_drivers,
-        'total_routes': total_routes,
-        'total_bookings': total_bookings,
-        'pending_bookings': pending_bookings,
-        'recent_bookings': recent_bookings,
-        'today_trips': today_trips,
-        'total_revenue': total_revenue,
+        **snapshot['numbers'],
+        'recent_bookings': snapshot['recent_bookings'],
+        'generated_at': snapshot['generated_at'],
+        'refresh_seconds': SNAPSHOT_TTL,
     }
     return render(request, 'myapp/admin/admin_dashboard.html', context)
 
 
+@login_required
+@user_passes_test(is_admin)
+def admin_dashboard_stats(request):
+    """Dashboard counters as JSON, for refreshing the page in place"""
+    snapshot = get_admin_snapshot()
+    return JsonResponse({
+        'success': True,
+        'generated_at': snapshot['generated_at'].isoformat(),
+        'numbers': snapshot['numbers'],
+    })
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_export(request, dataset):
+    """Stream bookings, payments, trips or GPS history as CSV or NDJSON, optionally for a date range"""
+    export = EXPORTS.get(dataset)
+    if export is None:
+        raise Http404('No such export.')
+    
+    fmt = request.GET.get('format', 'csv')
+    try:
+        start, end = (
+            datetime.strptime(request.GET[name], '%Y-%m-%d').date() if request.GET.get(name) else None
+            for name in ('start', 'end')
+        )
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'message': 'start and end must be dates in YYYY-MM-DD format'
+        }, status=400)
+    if fmt not in FORMATS or (start and end and start > end):
+        return JsonResponse({
+            'success': False,
+            'message': f'format must be one of {", ".join(FORMATS)} and start must not be after end'
+        }, status=400)
+    
+    response = StreamingHttpResponse(export.stream(fmt, start, end), content_type=FORMATS[fmt])
+    if start and end:
+        span = f'-{start}-to-{end}'
+    elif start or end:
+        span = f'-from-{start}' if start else f'-until-{end}'
+    else:
+        span = ''
+    response['Content-Disposition'] = f'attachment; filename="sakay-{dataset}{span}.{fmt}"'
+    return response
+
+
 @login_required
 @user_passes_test(is_admin)
 def admin_bookings(request):
@@ -967,7 +1151,8 @@ def admin_confirm_booking(request, booking_id):
 @user_passes_test(is_admin)
 def admin_routes(request):
     """Manage routes (admin)"""
-    routes = Route.objects.select_related('vehicle').order_by('-created_at')
+    routes = Route.objects.select_related('vehicle').annotate(
+        stop_count=Count('stops', filter=Q(stops__is_active=True))).order_by('-created_at')
     context = {'routes': routes}
     return render(request, 'myapp/admin/admin_routes.html', context)
 
@@ -1211,34 +1396,150 @@ def admin_assign_driver(request, trip_id):
 
 @login_required
 @user_passes_test(is_admin)
-def admin_reports(request):
-    """View reports (admin)"""
-    total_revenue = Booking.objects.filter(
-        status='COMPLETED'
-    ).aggregate(Sum('total_fare'))['total_fare__sum'] or 0
+def admin_cancel_trip(request, trip_id):
+    """Cancel a trip with all its bookings and refund completed payments"""
+    trip = get_object_or_404(Trip, id=trip_id)
     
-    bookings_by_status = Booking.objects.values('status').annotate(
-        count=Count('id')
-    )
+    if request.method == 'POST':
+        try:
+            summary = trip.cancel()
+            messages.success(
+                request,
+                f'Trip cancelled. {summary["bookings_cancelled"]} booking(s) cancelled, '
+                f'{summary["payments_refunded"]} payment(s) refunded (₱{summary["refund_total"]}).'
+            )
+        except ValueError as e:
+            messages.error(request, str(e))
     
-    # Monthly revenue
-    from django.db.models.functions import TruncMonth
-    monthly_revenue = Booking.objects.filter(
-        status='COMPLETED'
-    ).annotate(
-        month=TruncMonth('created_at')
-    ).values('month').annotate(
-        total=Sum('total_fare')
-    ).order_by('-month')[:12]
+    return redirect('admin_trips')
+
+
+def report_params(query):
+    """Report cube filters from the query string, as JSON-ready job parameters; ones that don't parse are left out"""
+    params = {'by': query.get('by') if query.get('by') in DIMENSIONS else 'month'}
+    for name in ('start', 'end'):
+        try:
+            params[name] = datetime.strptime(query.get(name, ''), '%Y-%m').strftime('%Y-%m')
+        except ValueError:
+            pass
+    if query.get('route', '').isdigit():
+        params['route_id'] = int(query['route'])
+    if query.get('vehicle_type') in dict(Vehicle.VEHICLE_TYPE_CHOICES):
+        params['vehicle_type'] = query['vehicle_type']
+    if query.get('hour', '').isdigit() and int(query['hour']) < 24:
+        params['hour'] = int(query['hour'])
+    return params
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_reports(request):
+    """View reports (admin), computed by a background job and shown from its latest result"""
+    params = report_params(request.GET)
+    if request.method == 'POST':
+        request_report('admin_reports', params, refresh=True)
+        messages.success(request, 'The report is being regenerated.')
+        return redirect(f"{request.path}?{request.GET.urlencode()}" if request.GET else request.path)
+    
+    latest, active = request_report('admin_reports', params)
+    result = load_result(latest) if latest else None
     
     context = {
-        'total_revenue': total_revenue,
-        'bookings_by_status': bookings_by_status,
-        'monthly_revenue': monthly_revenue,
+        'report': result,
+        'generated_at': latest.finished_at if result else None,
+        'pending': active is not None,
+        'cube_freshness': freshness(),
+        'by': params['by'],
+        'dimensions': [(name, name.replace('_', ' ').title()) for name in DIMENSIONS],
+        'filters': {**request.GET.dict(), 'by': params['by']},
+        'routes': Route.objects.order_by('route_code').values('pk', 'route_code', 'route_name'),
+        'vehicle_types': Vehicle.VEHICLE_TYPE_CHOICES,
+        'hours': range(24),
     }
     return render(request, 'myapp/admin/admin_reports.html', context)
 
 
+@login_required
+@user_passes_test(is_admin)
+def admin_load_factor(request):
+    """Booked seats over vehicle capacity per departure, and a weekday x hour heatmap (admin)"""
+    try:
+        day = datetime.strptime(request.GET['week'], '%Y-%m-%d').date() if request.GET.get('week') else date.today()
+        weeks = min(max(int(request.GET.get('weeks', 4)), 1), 12)
+    except ValueError:
+        day, weeks = date.today(), 4
+    week = week_of(day)
+    route_id = int(request.GET['route']) if request.GET.get('route', '').isdigit() else None
+    
+    # The heatmap spans the selected week and the ones before it
+    by_week = get_weeks([week - timedelta(weeks=offset) for offset in range(weeks)])
+    if route_id:
+        by_week = {monday: [d for d in departures if d['route_id'] == route_id] for monday, departures in by_week.items()}
+    
+    departures = by_week[week]
+    by_load = sorted(departures, key=lambda departure: departure['load_factor'])
+    spanned = [departure for departures_of_week in by_week.values() for departure in departures_of_week]
+    cells = heatmap(spanned)
+    hours = sorted({hour for _, hour in cells})
+    heatmap_rows = [{
+        'weekday': name,
+        'cells': [
+            {'percent': round(cells[(weekday, hour)][0] * 100), 'departures': cells[(weekday, hour)][1],
+             'alpha': round(min(cells[(weekday, hour)][0], 1), 2)}
+            if (weekday, hour) in cells else None
+            for hour in hours
+        ],
+    } for weekday, name in Schedule.WEEKDAY_CHOICES]
+    
+    context = {
+        'week': week,
+        'week_end': week + timedelta(days=6),
+        'previous_week': week - timedelta(weeks=1),
+        'next_week': week + timedelta(weeks=1),
+        'weeks': weeks,
+        'route_id': route_id,
+        'routes': [(route['id'], route['route_code'], route['route_name']) for route in get_catalog()['routes']],
+        'departure_count': len(departures),
+        'average_load': (sum(d['load_factor'] for d in departures) / len(departures) * 100) if departures else 0,
+        'full_count': sum(1 for d in departures if d['load_factor'] >= 0.9),
+        'empty_count': sum(1 for d in departures if d['load_factor'] < 0.25),
+        'tables': [('Fullest Departures', by_load[::-1][:20]), ('Emptiest Departures', by_load[:20])],
+        'hours': hours,
+        'heatmap_rows': heatmap_rows,
+    }
+    return render(request, 'myapp/admin/admin_load_factor.html', context)
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_performance(request):
+    """Latency, query count and SQL time per view in this process, as JSON; POST starts the figures over"""
+    if request.method == 'POST':
+        aggregator.reset()
+    return JsonResponse({
+        'success': True,
+        'since': aggregator.started_at.isoformat(),
+        'sample_rate': settings.REQUEST_METRICS_SAMPLE_RATE,
+        'latency_buckets_ms': [bound * 1000 for bound in LATENCY_BUCKETS],
+        'views': aggregator.snapshot(),
+    })
+
+
+def metrics_endpoint(request):
+    """
+    Prometheus metrics of every worker on the host. The scraper sends
+    `Authorization: Bearer <METRICS_TOKEN>`; with no token set, only a
+    signed-in admin may read them.
+    """
+    if settings.METRICS_TOKEN:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}')
+    else:
+        allowed = is_admin(request.user)
+    if not allowed:
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @login_required
 @user_passes_test(is_admin)
 def admin_settings(request):
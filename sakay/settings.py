@@ -33,6 +33,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.instrumentation.RequestMetricsMiddleware',
+    'myapp.nplusone.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -41,7 +43,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    # 'myapp.middleware.ThreeTierAccessMiddleware',  # DISABLED to fix redirect loop
+    'myapp.middleware.ThreeTierAccessMiddleware',
 ]
 
 ROOT_URLCONF = 'sakay.urls'
@@ -83,6 +85,68 @@ else:
         }
     }
 
+# Cache
+# File-based so every gunicorn worker on the host sees the same catalog
+# version; point CACHE_DIR somewhere persistent if needed. The test runner
+# swaps in a memory cache (see myapp/test_runner.py).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, '.cache')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Public page cache
+# Seconds a page rendered for anonymous visitors is served from the cache;
+# catalog changes replace it sooner (see myapp/page_cache.py).
+PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 60 * 60))
+
+# Report jobs
+# Heavy reports are computed off-request (see myapp/report_jobs.py). By
+# default each job runs in a thread of the web process, since build.sh
+# deploys no worker; a restarted process leaves its jobs RUNNING until they
+# time out. Once a worker runs next to the web service:
+#     python manage.py run_report_jobs
+# set REPORT_JOBS_IN_PROCESS=False and queued reports wait for it instead.
+REPORT_JOBS_IN_PROCESS = os.environ.get('REPORT_JOBS_IN_PROCESS', 'True') == 'True'
+
+# Tests
+TEST_RUNNER = 'myapp.test_runner.TestRunner'
+
+# Request metrics
+# Share of requests whose latency, query count and SQL time are recorded per
+# view (see myapp/instrumentation.py); 0 records none. Every request is still
+# timed for /metrics.
+REQUEST_METRICS_SAMPLE_RATE = float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', '0.1'))
+
+# Prometheus metrics
+# Every process writes its counters to its own file in METRICS_DIR, and
+# /metrics adds them up (see myapp/metrics.py), so all gunicorn workers on
+# the host must share the directory. Set METRICS_TOKEN and have the scraper
+# send `Authorization: Bearer <token>`; without it, only signed-in admins
+# can read /metrics.
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(BASE_DIR, '.metrics'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# N+1 detection
+# With DEBUG on, a query shape run more than NPLUSONE_THRESHOLD times in one
+# request is logged with its template line; under `manage.py test` it raises
+# (see myapp/nplusone.py and myapp/test_runner.py).
+NPLUSONE_THRESHOLD = 5
+NPLUSONE_RAISE = False
+
+# Authentication
+# RoleModelBackend signs users in and loads the session user with its
+# driver/student profile in one query. ModelBackend stays listed so sessions
+# started before it still resolve; it does not check passwords again.
+AUTHENTICATION_BACKENDS = [
+    'myapp.backends.RoleModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -104,7 +168,9 @@ AUTH_PASSWORD_VALIDATORS = [
 
 # Internationalization
 LANGUAGE_CODE = 'en-us'
-TIME_ZONE = 'UTC'
+# Service dates and times (defaults of the journey and departures APIs, today's
+# trips) are local to Biliran
+TIME_ZONE = 'Asia/Manila'
 USE_I18N = True
 USE_TZ = True
 